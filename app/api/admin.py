@@ -1,22 +1,55 @@
 # /api/admin.py
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import func, desc, or_
 from typing import List, Optional
 from datetime import datetime, timedelta
 
 from app.core.database import get_db
-from app.models.models import Order, OrderItem, User, Transaction, Product, Address
+from app.models.models import Order, OrderItem, User, Transaction, Product, Address, JobState, OutboxMessage, WebhookEvent
 from app.core.security import get_current_admin_user
-from app.schemas.admin import OrderSummary, DashboardStats
+from app.schemas.admin import OrderSummary, DashboardStats, BulkOrderStatusUpdate
+from app.services.inventory import compact_movements, movement_history, on_hand_expression
+from app.services.order_archive import archive_closed_orders, load_archived_order
+from app.services.order_expiry import expire_stale_orders
+from app.services.order_history import order_history
+from app.services.outbox import drain, outbox_workers
+from app.services import webhook_inbox
+from app.services.paystack_client import HTTP2_AVAILABLE, paystack_client
+from app.services.order_status import ORDER_STATUSES, transition_orders
+from app.services.upload_gc import collect_orphaned_uploads
 
 router = APIRouter(tags=["admin"])
 
 @router.get("/orders", response_model=List[OrderSummary])
 async def get_all_orders(
+    response: Response,
+    include_archived: bool = Query(False),
+    limit: int = Query(100, ge=1, le=500),
+    before: Optional[int] = Query(None),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_admin_user)
 ):
+    if include_archived:
+        # The archive only grows, so it is read a keyset page at a time (cursor in X-Next-Before)
+        page = order_history(db, None, limit=limit, before=before, include_archived=True)
+        if page["next_before"] is not None:
+            response.headers["X-Next-Before"] = str(page["next_before"])
+        return [
+            {
+                "id": order["id"],
+                "order_number": order["order_number"],
+                "customer_name": order["customer_name"] or "Guest",
+                "customer_email": order["customer_email"] or "",
+                "total_amount": order["total_amount"],
+                "status": order["status"],
+                "payment_status": order["payment_status"],
+                "created_at": order["created_at"],
+                "items_count": order["items_count"]
+            }
+            for order in page["orders"]
+        ]
+    
     orders = db.query(Order).order_by(desc(Order.created_at)).all()
     
     order_summaries = []
@@ -178,6 +211,7 @@ async def get_enhanced_orders(
 @router.get("/orders/{order_id}")
 async def get_order_details(
     order_id: int,
+    include_archived: bool = Query(False),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_admin_user)
 ):
@@ -186,15 +220,20 @@ async def get_order_details(
         joinedload(Order.shipping_address)
     ).filter(Order.id == order_id).first()
     
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
-    transaction = db.query(Transaction).filter(
-        Transaction.order_id == order_id
-    ).first()
+    if order:
+        items = order.items
+        shipping = order.shipping_address
+        transaction = db.query(Transaction).filter(
+            Transaction.order_id == order_id
+        ).first()
+    else:
+        archived = load_archived_order(db, order_id) if include_archived else None
+        if not archived:
+            raise HTTPException(status_code=404, detail="Order not found")
+        order, items, shipping, transaction = archived
     
     items_with_details = []
-    for item in order.items:
+    for item in items:
         item_data = {
             "id": item.id,
             "product_name": item.product_name,
@@ -209,22 +248,22 @@ async def get_order_details(
         }
         
         if item.product_id:
-            product = db.query(Product).filter(Product.id == item.product_id).first()
+            product = db.query(Product.is_active, on_hand_expression().label("on_hand")).filter(Product.id == item.product_id).first()
             if product:
-                item_data["current_stock"] = product.stock
+                item_data["current_stock"] = product.on_hand
                 item_data["is_active"] = product.is_active
         
         items_with_details.append(item_data)
     
     shipping_address = None
-    if order.shipping_address:
+    if shipping:
         shipping_address = {
-            "street": order.shipping_address.street,
-            "city": order.shipping_address.city,
-            "state": order.shipping_address.state,
-            "country": order.shipping_address.country,
-            "postal_code": order.shipping_address.postal_code,
-            "full_address": f"{order.shipping_address.street}, {order.shipping_address.city}, {order.shipping_address.state}, {order.shipping_address.country} - {order.shipping_address.postal_code}"
+            "street": shipping.street,
+            "city": shipping.city,
+            "state": shipping.state,
+            "country": shipping.country,
+            "postal_code": shipping.postal_code,
+            "full_address": f"{shipping.street}, {shipping.city}, {shipping.state}, {shipping.country} - {shipping.postal_code}"
         }
     
     transaction_details = None
@@ -243,12 +282,12 @@ async def get_order_details(
         }
     
     summary = {
-        "items_count": len(order.items),
-        "total_quantity": sum(item.quantity for item in order.items),
-        "has_size": any(item.size for item in order.items),
-        "has_color": any(item.color for item in order.items),
-        "size_variants": list(set(item.size for item in order.items if item.size)),
-        "color_variants": list(set(item.color for item in order.items if item.color))
+        "items_count": len(items),
+        "total_quantity": sum(item.quantity for item in items),
+        "has_size": any(item.size for item in items),
+        "has_color": any(item.color for item in items),
+        "size_variants": list(set(item.size for item in items if item.size)),
+        "color_variants": list(set(item.color for item in items if item.color))
     }
     
     return {
@@ -266,7 +305,8 @@ async def get_order_details(
             "notes": order.notes,
             "created_at": order.created_at.isoformat(),
             "paid_at": order.paid_at.isoformat() if order.paid_at else None,
-            "order_data": order.order_data
+            "order_data": order.order_data,
+            "archived": not isinstance(order, Order)
         },
         "items": items_with_details,
         "transaction": transaction_details,
@@ -281,23 +321,45 @@ async def update_order_status(
     current_user: User = Depends(get_current_admin_user)
 ):
     new_status = status_update.get("status")
-    valid_statuses = ["pending", "processing", "shipped", "delivered", "cancelled"]
     
-    if new_status not in valid_statuses:
+    if new_status not in ORDER_STATUSES:
         raise HTTPException(
             status_code=400,
-            detail=f"Invalid status. Must be one of: {', '.join(valid_statuses)}"
+            detail=f"Invalid status. Must be one of: {', '.join(ORDER_STATUSES)}"
         )
     
-    order = db.query(Order).filter(Order.id == order_id).first()
-    if not order:
+    report = transition_orders(db, [order_id], new_status)
+    if report["not_found"]:
         raise HTTPException(status_code=404, detail="Order not found")
-    
-    order.status = new_status
+    if report["skipped"]:
+        raise HTTPException(status_code=400, detail=report["skipped"][0]["reason"])
     db.commit()
+    if report["emails_queued"]:
+        outbox_workers.notify()
     
     return {"success": True, "message": f"Order status updated to {new_status}"}
 
+@router.post("/orders/bulk-status")
+async def bulk_update_order_status(
+    status_update: BulkOrderStatusUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Move many orders to one status, skipping those the state machine does not allow"""
+    try:
+        report = transition_orders(db, status_update.order_ids, status_update.status)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    db.commit()
+    if report["emails_queued"]:
+        outbox_workers.notify()
+    
+    return {
+        "success": True,
+        "message": f"{len(report['updated'])} orders updated to {status_update.status}",
+        **report
+    }
+
 @router.get("/dashboard/stats")
 async def get_admin_dashboard_stats(
     db: Session = Depends(get_db),
@@ -380,7 +442,7 @@ async def get_all_products(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_admin_user)
 ):
-    products = db.query(Product).order_by(desc(Product.created_at)).all()
+    products = db.query(Product, on_hand_expression().label("on_hand")).order_by(desc(Product.created_at)).all()
     
     return [
         {
@@ -388,12 +450,199 @@ async def get_all_products(
             "name": product.name,
             "price": product.price,
             "original_price": product.original_price,
-            "stock": product.stock,
+            "stock": on_hand,
             "is_active": product.is_active,
             "is_new": product.is_new,
             "is_sale": product.is_sale,
             "created_at": product.created_at.isoformat(),
             "category": product.category.name if product.category else "Uncategorized"
         }
-        for product in products
-    ]
\ No newline at end of file
+        for product, on_hand in products
+    ]
+
+@router.get("/inventory/{product_id}/movements")
+async def get_inventory_movements(
+    product_id: int,
+    since: Optional[datetime] = Query(None),
+    until: Optional[datetime] = Query(None),
+    limit: int = Query(200, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    product = db.query(Product.id, Product.name, Product.stock, on_hand_expression().label("on_hand")).filter(
+        Product.id == product_id
+    ).first()
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    
+    return {
+        "product_id": product.id,
+        "name": product.name,
+        "stock": product.stock,
+        "on_hand": product.on_hand,
+        "movements": [
+            {
+                "id": movement.id,
+                "kind": movement.kind,
+                "quantity": movement.quantity,
+                "applied": movement.applied,
+                "order_id": movement.order_id,
+                "note": movement.note,
+                "created_at": movement.created_at.isoformat() if movement.created_at else None
+            }
+            for movement in movement_history(db, product_id, since=since, until=until, limit=limit)
+        ]
+    }
+
+@router.post("/maintenance/inventory-compaction")
+async def run_inventory_compaction_now(
+    max_batches: Optional[int] = Query(None, ge=1),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    return compact_movements(db, max_batches=max_batches)
+
+@router.post("/maintenance/upload-gc")
+async def run_upload_gc_now(
+    dry_run: bool = Query(True),
+    max_batches: Optional[int] = Query(None, ge=1),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    return collect_orphaned_uploads(db, dry_run=dry_run, max_batches=max_batches)
+
+@router.post("/maintenance/expire-orders")
+async def run_order_expiry_now(
+    max_batches: Optional[int] = Query(None, ge=1),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    return expire_stale_orders(db, max_batches=max_batches)
+
+@router.post("/maintenance/archive-orders")
+async def run_order_archive_now(
+    max_batches: Optional[int] = Query(None, ge=1),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    return archive_closed_orders(db, max_batches=max_batches)
+
+@router.get("/maintenance/outbox")
+async def get_outbox_status(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    counts = dict(db.query(OutboxMessage.status, func.count(OutboxMessage.id)).group_by(OutboxMessage.status).all())
+    dead = db.query(OutboxMessage).filter(OutboxMessage.status == "dead").order_by(desc(OutboxMessage.id)).limit(50).all()
+    return {
+        "counts": counts,
+        "dead": [
+            {
+                "id": message.id,
+                "kind": message.kind,
+                "payload": message.payload,
+                "attempts": message.attempts,
+                "last_error": message.last_error,
+                "created_at": message.created_at.isoformat() if message.created_at else None
+            }
+            for message in dead
+        ]
+    }
+
+@router.post("/maintenance/outbox/{message_id}/retry")
+async def retry_outbox_message(
+    message_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    message = db.query(OutboxMessage).filter(OutboxMessage.id == message_id).first()
+    if not message:
+        raise HTTPException(status_code=404, detail="Outbox message not found")
+    if message.status != "dead":
+        raise HTTPException(status_code=400, detail=f"Only dead messages can be retried, this one is {message.status}")
+    
+    message.status = "pending"
+    message.attempts = 0
+    message.available_at = datetime.utcnow()
+    db.commit()
+    return {"message": "Message requeued", "id": message.id}
+
+@router.post("/maintenance/outbox-drain")
+async def run_outbox_drain_now(
+    max_batches: int = Query(1, ge=1, le=100),
+    current_user: User = Depends(get_current_admin_user)
+):
+    return drain(max_batches=max_batches)
+
+@router.get("/maintenance/webhooks")
+async def get_webhook_inbox_status(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    counts = dict(db.query(WebhookEvent.status, func.count(WebhookEvent.id)).group_by(WebhookEvent.status).all())
+    dead = db.query(WebhookEvent).filter(WebhookEvent.status == "dead").order_by(desc(WebhookEvent.id)).limit(50).all()
+    return {
+        "counts": counts,
+        "dead": [
+            {
+                "id": event.id,
+                "event": event.event,
+                "reference": event.reference,
+                "attempts": event.attempts,
+                "last_error": event.last_error,
+                "received_at": event.received_at.isoformat() if event.received_at else None
+            }
+            for event in dead
+        ]
+    }
+
+@router.post("/maintenance/webhooks/{event_id}/retry")
+async def retry_webhook_event(
+    event_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    event = db.query(WebhookEvent).filter(WebhookEvent.id == event_id).first()
+    if not event:
+        raise HTTPException(status_code=404, detail="Webhook event not found")
+    if event.status != "dead":
+        raise HTTPException(status_code=400, detail=f"Only dead events can be retried, this one is {event.status}")
+    
+    event.status = "pending"
+    event.attempts = 0
+    event.available_at = datetime.utcnow()
+    db.commit()
+    return {"message": "Event requeued", "id": event.id}
+
+@router.post("/maintenance/webhooks-drain")
+async def run_webhook_drain_now(
+    max_batches: int = Query(1, ge=1, le=100),
+    current_user: User = Depends(get_current_admin_user)
+):
+    return webhook_inbox.drain(max_batches=max_batches)
+
+@router.get("/maintenance/paystack")
+async def get_paystack_metrics(
+    current_user: User = Depends(get_current_admin_user)
+):
+    return {
+        "http2": HTTP2_AVAILABLE,
+        "calls": paystack_client.metrics.snapshot()
+    }
+
+@router.get("/maintenance/jobs")
+async def get_background_jobs(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    return [
+        {
+            "name": job.name,
+            "cursor": job.cursor,
+            "last_run_at": job.last_run_at.isoformat() if job.last_run_at else None,
+            "last_result": job.last_result,
+            "lease_owner": job.lease_owner,
+            "lease_expires_at": job.lease_expires_at.isoformat() if job.lease_expires_at else None
+        }
+        for job in db.query(JobState).order_by(JobState.name).all()
+    ]
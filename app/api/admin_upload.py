@@ -0,0 +1,30 @@
+# app/api/admin_upload.py - SITE ASSET UPLOADS (LOGO, LOOKBOOK), MOUNTED AT /api/admin/upload
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
+from sqlalchemy.orm import Session
+
+from app.core.database import get_db
+from app.core.security import get_current_admin_user
+from app.models.models import User
+from app.services.storage import storage
+from app.services.upload_store import store_upload
+
+router = APIRouter()
+
+@router.post("")
+async def upload_file(
+    file: UploadFile = File(...),
+    type: str = "logo",
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    allowed_types = ['image/jpeg', 'image/png', 'image/svg+xml', 'image/x-icon']
+    if file.content_type not in allowed_types:
+        raise HTTPException(status_code=400, detail="Invalid file type")
+    
+    # Site assets share the content-addressed store with product images,
+    # so re-uploading the same logo/lookbook image reuses the stored file
+    blob, near_duplicates = store_upload(db, file)
+    db.commit()
+    
+    # Clients store this URL, so it must not be a presigned one that expires
+    return {"url": storage.public_url(blob.filename), "near_duplicates": near_duplicates}
@@ -1,7 +1,8 @@
 # app/api/auth.py - FULL CORRECTED VERSION
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Cookie, Depends, HTTPException, Response, status, BackgroundTasks
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
+from typing import Optional
 import random
 import string
 from app.services.email_manager import email_manager as email_service
@@ -10,6 +11,7 @@ from app.core.security import hash_password, verify_password, create_access_toke
 from app.core.config import settings
 from app.models.models import User
 from app.schemas.schemas import UserCreate, UserLogin, Token, UserResponse
+from app.services.cart_merge import merge_guest_cart_cookie
 
 router = APIRouter()
 
@@ -39,7 +41,12 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
     return user
 
 @router.post("/login", response_model=Token)
-async def login(user_data: UserLogin, db: Session = Depends(get_db)):
+async def login(
+    user_data: UserLogin,
+    response: Response,
+    guest_cart: Optional[str] = Cookie(None, alias=settings.GUEST_CART_COOKIE),
+    db: Session = Depends(get_db)
+):
     user = authenticate_user(db, user_data.email, user_data.password)
     if not user:
         raise HTTPException(
@@ -53,6 +60,8 @@ async def login(user_data: UserLogin, db: Session = Depends(get_db)):
             detail="Account is inactive"
         )
     
+    merge_guest_cart_cookie(db, user.id, guest_cart, response)
+    
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user.email, "user_id": user.id},
@@ -343,6 +352,8 @@ async def verify_email_code(
 @router.post("/magic-login")
 async def magic_login(
     user_data: dict,
+    response: Response,
+    guest_cart: Optional[str] = Cookie(None, alias=settings.GUEST_CART_COOKIE),
     db: Session = Depends(get_db)
 ):
     email = user_data.get("email")
@@ -355,6 +366,8 @@ async def magic_login(
     user = db.query(User).filter(User.email == email).first()
     
     if user:
+        merge_guest_cart_cookie(db, user.id, guest_cart, response)
+        
         access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
         access_token = create_access_token(
             data={"sub": user.email, "user_id": user.id},
@@ -390,6 +403,8 @@ async def magic_login(
         db.commit()
         db.refresh(new_user)
         
+        merge_guest_cart_cookie(db, new_user.id, guest_cart, response)
+        
         access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
         access_token = create_access_token(
             data={"sub": new_user.email, "user_id": new_user.id},
@@ -1,14 +1,313 @@
 #/api/cart.py
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Cookie, Depends, HTTPException, Response, status
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from typing import List
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
 from app.core.database import get_db
-from app.models.models import CartItem, Product, User
-from app.schemas.schemas import CartItemBase, CartItemResponse
+from app.models.models import CartItem, Category, Product, ProductImage, User
+from app.schemas.schemas import CartBatchRequest, CartItemBase, CartItemResponse, CartMergeRequest
 from app.core.security import get_current_user
+from app.services import guest_cart
+from app.services.cart_merge import merge_into_user_cart
+from app.services.inventory import available_stock_expression
+from app.services.storage import storage
 
 router = APIRouter()
 
+def _display_image_id():
+    """Primary image of the product, or its first image when none is marked"""
+    return (
+        select(ProductImage.id)
+        .where(ProductImage.product_id == Product.id)
+        .order_by(ProductImage.is_primary.desc(), ProductImage.id)
+        .limit(1)
+        .correlate(Product)
+        .scalar_subquery()
+    )
+
+def cart_line_columns():
+    """Columns for a cart line; stock is what is left after active checkout holds"""
+    return (
+        Product.id.label("product_id"),
+        Product.name,
+        Product.price,
+        Product.original_price,
+        available_stock_expression().label("stock"),
+        Product.is_active,
+        Category.id.label("category_id"),
+        Category.name.label("category_name"),
+        ProductImage.filename.label("image_filename"),
+        ProductImage.width.label("image_width"),
+        ProductImage.height.label("image_height"),
+        ProductImage.dominant_color.label("image_dominant_color"),
+        ProductImage.placeholder.label("image_placeholder"),
+    )
+
+def enrich_cart_query(query):
+    """Join the product, its category and display image onto a cart query"""
+    return (
+        query
+        .outerjoin(Category, Category.id == Product.category_id)
+        .outerjoin(ProductImage, ProductImage.id == _display_image_id())
+    )
+
+def _line_warning(quantity: int, stock: int, is_active: bool):
+    if not is_active:
+        return {"code": "unavailable", "message": "This product is no longer available", "available": 0}
+    if stock <= 0:
+        return {"code": "out_of_stock", "message": "Out of stock", "available": 0}
+    if quantity > stock:
+        return {"code": "insufficient_stock", "message": f"Only {stock} left in stock", "available": stock}
+    return None
+
+def serialize_cart_line(row, quantity: int, item_id=None) -> Dict[str, Any]:
+    stock = row.stock or 0
+    subtotal = round(row.price * quantity, 2)
+    return {
+        "id": item_id,
+        "product_id": row.product_id,
+        "name": row.name,
+        "price": row.price,
+        "original_price": row.original_price,
+        "quantity": quantity,
+        "subtotal": subtotal,
+        "stock": stock,
+        "category": {"id": row.category_id, "name": row.category_name} if row.category_id else None,
+        "image": {
+            "url": storage.url(row.image_filename),
+            "width": row.image_width,
+            "height": row.image_height,
+            "dominant_color": row.image_dominant_color,
+            "placeholder": row.image_placeholder,
+        } if row.image_filename else None,
+        "warning": _line_warning(quantity, stock, row.is_active),
+    }
+
+def summarize_cart(lines: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Totals and warnings for serialized cart lines"""
+    warnings = [
+        {"product_id": line["product_id"], "name": line["name"], **line["warning"]}
+        for line in lines if line["warning"]
+    ]
+    return {
+        "items": lines,
+        "line_count": len(lines),
+        "item_count": sum(line["quantity"] for line in lines),
+        "total": round(sum(line["subtotal"] for line in lines), 2),
+        "warnings": warnings,
+        "can_checkout": bool(lines) and not warnings,
+    }
+
+def build_cart_view(db: Session, user_id: int) -> Dict[str, Any]:
+    """The user's cart with product details, totals and stock warnings in one query"""
+    query = db.query(CartItem.id, CartItem.quantity, *cart_line_columns()).join(
+        Product, Product.id == CartItem.product_id
+    )
+    rows = enrich_cart_query(query).filter(
+        CartItem.user_id == user_id
+    ).order_by(CartItem.created_at, CartItem.id).all()
+
+    return summarize_cart([serialize_cart_line(row, row.quantity, item_id=row.id) for row in rows])
+
+@router.get("/view")
+async def get_cart_view(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    return build_cart_view(db, current_user.id)
+
+@router.post("/batch")
+async def apply_cart_operations(
+    batch: CartBatchRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Apply add/set/remove operations in order, all or nothing, and return the cart"""
+    product_ids = {operation.product_id for operation in batch.operations}
+    products = {
+        row.id: row
+        for row in db.query(Product.id, available_stock_expression().label("stock"), Product.is_active).filter(Product.id.in_(product_ids))
+    }
+    cart_items = {
+        cart_item.product_id: cart_item
+        for cart_item in db.query(CartItem).filter(
+            CartItem.user_id == current_user.id,
+            CartItem.product_id.in_(product_ids)
+        )
+    }
+
+    quantities = {product_id: cart_item.quantity for product_id, cart_item in cart_items.items()}
+    errors = []
+    for index, operation in enumerate(batch.operations):
+        if operation.op == "remove":
+            quantities.pop(operation.product_id, None)
+            continue
+
+        product = products.get(operation.product_id)
+        if not product or not product.is_active:
+            errors.append({"index": index, "product_id": operation.product_id, "detail": "Product not found"})
+            continue
+
+        if operation.op == "add":
+            quantities[operation.product_id] = quantities.get(operation.product_id, 0) + operation.quantity
+        elif operation.quantity == 0:
+            quantities.pop(operation.product_id, None)
+        else:
+            quantities[operation.product_id] = operation.quantity
+
+    for product_id, quantity in quantities.items():
+        available = (products[product_id].stock or 0) if product_id in products else 0
+        if quantity > available:
+            errors.append({"product_id": product_id, "detail": "Insufficient stock", "available": available})
+
+    if errors:
+        db.rollback()
+        raise HTTPException(status_code=400, detail={"message": "No changes applied", "errors": errors})
+
+    for product_id, cart_item in cart_items.items():
+        if product_id not in quantities:
+            db.delete(cart_item)
+        else:
+            cart_item.quantity = quantities[product_id]
+    db.add_all([
+        CartItem(user_id=current_user.id, product_id=product_id, quantity=quantity)
+        for product_id, quantity in quantities.items() if product_id not in cart_items
+    ])
+    db.commit()
+
+    return build_cart_view(db, current_user.id)
+
+@router.post("/merge")
+async def merge_cart(
+    response: Response,
+    merge: Optional[CartMergeRequest] = None,
+    cookie: Optional[str] = Cookie(None, alias=settings.GUEST_CART_COOKIE),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Fold the guest cart cookie and/or a client-side cart into the user's cart"""
+    cart_id = guest_cart.unsign_cart_id(cookie)
+    items = guest_cart.load_items(cart_id)
+    for item in (merge.items if merge else []):
+        items[item.product_id] = items.get(item.product_id, 0) + item.quantity
+
+    merge_into_user_cart(db, current_user.id, items)
+    db.commit()
+
+    if cart_id:
+        guest_cart.delete_cart(cart_id)
+        guest_cart.clear_cart_cookie(response)
+
+    return build_cart_view(db, current_user.id)
+
+# ==================== GUEST CART ====================
+# Anonymous carts live in the KV store under a signed cookie; these routes
+# only ever read from the database.
+
+def build_guest_cart_view(db: Session, items: Dict[int, int]) -> Dict[str, Any]:
+    """Same shape as the user cart view, products loaded in one query"""
+    rows = []
+    if items:
+        rows = enrich_cart_query(
+            db.query(*cart_line_columns()).select_from(Product)
+        ).filter(Product.id.in_(list(items))).all()
+    by_product = {row.product_id: row for row in rows}
+
+    return summarize_cart([
+        serialize_cart_line(by_product[product_id], quantity)
+        for product_id, quantity in items.items() if product_id in by_product
+    ])
+
+def guest_cart_id(
+    cookie: Optional[str] = Cookie(None, alias=settings.GUEST_CART_COOKIE)
+) -> Optional[str]:
+    return guest_cart.unsign_cart_id(cookie)
+
+def _save_guest_cart(response: Response, cart_id: Optional[str], items: Dict[int, int]) -> None:
+    cart_id = cart_id or guest_cart.new_cart_id()
+    guest_cart.save_items(cart_id, items)
+    guest_cart.set_cart_cookie(response, cart_id)
+
+def _check_available_quantity(db: Session, product_id: int, quantity: int) -> None:
+    """404 for a missing/inactive product, 400 if quantity exceeds stock on hand minus holds"""
+    product = db.query(available_stock_expression().label("stock"), Product.is_active).filter(Product.id == product_id).first()
+    if not product or not product.is_active:
+        raise HTTPException(status_code=404, detail="Product not found")
+    if (product.stock or 0) < quantity:
+        raise HTTPException(status_code=400, detail="Insufficient stock")
+
+@router.get("/guest")
+async def get_guest_cart(
+    response: Response,
+    cart_id: Optional[str] = Depends(guest_cart_id),
+    db: Session = Depends(get_db)
+):
+    items = guest_cart.load_items(cart_id)
+    if items:
+        # Re-issue the cookie so it slides with the stored cart
+        guest_cart.set_cart_cookie(response, cart_id)
+    return build_guest_cart_view(db, items)
+
+@router.post("/guest/add")
+async def add_to_guest_cart(
+    item: CartItemBase,
+    response: Response,
+    cart_id: Optional[str] = Depends(guest_cart_id),
+    db: Session = Depends(get_db)
+):
+    items = guest_cart.load_items(cart_id)
+    quantity = items.get(item.product_id, 0) + item.quantity
+    _check_available_quantity(db, item.product_id, quantity)
+
+    if item.product_id not in items and len(items) >= settings.GUEST_CART_MAX_LINES:
+        raise HTTPException(status_code=400, detail="Cart is full")
+
+    items[item.product_id] = quantity
+    _save_guest_cart(response, cart_id, items)
+    return build_guest_cart_view(db, items)
+
+@router.put("/guest/{product_id}")
+async def update_guest_cart_item(
+    product_id: int,
+    item: CartItemBase,
+    response: Response,
+    cart_id: Optional[str] = Depends(guest_cart_id),
+    db: Session = Depends(get_db)
+):
+    items = guest_cart.load_items(cart_id)
+    if product_id not in items:
+        raise HTTPException(status_code=404, detail="Cart item not found")
+    _check_available_quantity(db, product_id, item.quantity)
+
+    items[product_id] = item.quantity
+    _save_guest_cart(response, cart_id, items)
+    return build_guest_cart_view(db, items)
+
+@router.delete("/guest/{product_id}")
+async def remove_from_guest_cart(
+    product_id: int,
+    response: Response,
+    cart_id: Optional[str] = Depends(guest_cart_id),
+    db: Session = Depends(get_db)
+):
+    items = guest_cart.load_items(cart_id)
+    if product_id not in items:
+        raise HTTPException(status_code=404, detail="Cart item not found")
+
+    del items[product_id]
+    _save_guest_cart(response, cart_id, items)
+    return build_guest_cart_view(db, items)
+
+@router.delete("/guest")
+async def clear_guest_cart(
+    response: Response,
+    cart_id: Optional[str] = Depends(guest_cart_id)
+):
+    guest_cart.delete_cart(cart_id)
+    guest_cart.clear_cart_cookie(response)
+    return {"message": "Cart cleared"}
+
 @router.get("/", response_model=List[CartItemResponse])
 async def get_cart(
     current_user: User = Depends(get_current_user),
@@ -23,18 +322,14 @@ async def add_to_cart(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    product = db.query(Product).filter(Product.id == item.product_id).first()
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    
-    if product.stock < item.quantity:
-        raise HTTPException(status_code=400, detail="Insufficient stock")
-    
     cart_item = db.query(CartItem).filter(
         (CartItem.user_id == current_user.id) &
         (CartItem.product_id == item.product_id)
     ).first()
     
+    quantity = (cart_item.quantity if cart_item else 0) + item.quantity
+    _check_available_quantity(db, item.product_id, quantity)
+    
     if cart_item:
         cart_item.quantity += item.quantity
     else:
@@ -63,9 +358,7 @@ async def update_cart_item(
     if not cart_item:
         raise HTTPException(status_code=404, detail="Cart item not found")
     
-    product = db.query(Product).filter(Product.id == cart_item.product_id).first()
-    if product.stock < item.quantity:
-        raise HTTPException(status_code=400, detail="Insufficient stock")
+    _check_available_quantity(db, cart_item.product_id, item.quantity)
     
     cart_item.quantity = item.quantity
     db.commit()
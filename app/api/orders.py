@@ -1,9 +1,8 @@
 # app/api/orders.py - COMPLETE CORRECTED VERSION
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy.orm import Session, joinedload
 from typing import List, Optional
-from datetime import datetime
-import uuid
+import secrets
 
 from app.core.database import get_db
 from app.models.models import Order, OrderItem, Product, User, Address 
@@ -18,16 +17,36 @@ from app.schemas.schemas import (
     PaymentMethod,
     PaymentStatus
 )
-from app.core.security import get_current_user
+from app.core.security import get_current_user, hash_password
+from app.services.idempotency import idempotency_key, run_idempotent
+from app.services.order_history import order_history
+from app.services.order_numbers import next_order_number
+from app.services.inventory import InsufficientStock, decrement_stock
 
 router = APIRouter()
 
+def take_order_stock(db: Session, order_id: int, quantities: dict):
+    """Decrement every line in one guarded UPDATE, or roll back the order"""
+    try:
+        decrement_stock(db, quantities, kind="sale", order_id=order_id)
+    except InsufficientStock as e:
+        db.rollback()
+        names = ", ".join(str(line["name"] or line["product_id"]) for line in e.shortfalls)
+        raise HTTPException(status_code=400, detail=f"Insufficient stock for {names}")
+
 @router.post("/create", response_model=OrderResponse)
 async def create_order(
     order_data: OrderCreate,
+    idempotency: Optional[str] = Depends(idempotency_key),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
+    return await run_idempotent(
+        f"orders.create:{current_user.id}", idempotency, order_data,
+        lambda: _create_order(order_data, current_user, db)
+    )
+
+async def _create_order(order_data: OrderCreate, current_user: User, db: Session):
     address = db.query(Address).filter(
         (Address.id == order_data.delivery_address_id) &
         (Address.user_id == current_user.id)
@@ -37,15 +56,18 @@ async def create_order(
     
     total_amount = 0
     order_items_data = []
+    products = {
+        product.id: product
+        for product in db.query(Product.id, Product.name, Product.price).filter(
+            Product.id.in_([cart_item.product_id for cart_item in order_data.items])
+        )
+    }
     
     for cart_item in order_data.items:
-        product = db.query(Product).filter(Product.id == cart_item.product_id).first()
+        product = products.get(cart_item.product_id)
         if not product:
             raise HTTPException(status_code=404, detail=f"Product {cart_item.product_id} not found")
         
-        if product.stock < cart_item.quantity:
-            raise HTTPException(status_code=400, detail=f"Insufficient stock for {product.name}")
-        
         item_total = product.price * cart_item.quantity
         total_amount += item_total
         
@@ -56,7 +78,7 @@ async def create_order(
             "product_name": product.name
         })
     
-    order_number = f"ORD-{datetime.utcnow().strftime('%Y%m%d')}-{uuid.uuid4().hex[:8].upper()}"
+    order_number = next_order_number("ORD")
     
     db_order = Order(
         user_id=current_user.id,
@@ -64,44 +86,52 @@ async def create_order(
         total_amount=total_amount,
         status=OrderStatus.PENDING.value,
         payment_method=order_data.payment_method.value if order_data.payment_method else None,
-        delivery_address_id=order_data.delivery_address_id,
+        shipping_address_id=order_data.delivery_address_id,
+        customer_email=current_user.email,
+        customer_name=current_user.full_name,
         payment_status=PaymentStatus.PENDING.value
     )
     
     db.add(db_order)
     db.flush()
     
+    quantities = {}
     for item_data in order_items_data:
         order_item = OrderItem(
             order_id=db_order.id,
             product_id=item_data["product_id"],
             quantity=item_data["quantity"],
-            price=item_data["price"]
+            price=item_data["price"],
+            product_name=item_data["product_name"]
         )
         db.add(order_item)
-        
-        product = db.query(Product).filter(Product.id == item_data["product_id"]).first()
-        product.stock -= item_data["quantity"]
+        quantities[item_data["product_id"]] = quantities.get(item_data["product_id"], 0) + item_data["quantity"]
     
+    take_order_stock(db, db_order.id, quantities)
     db.commit()
     db.refresh(db_order)
     
-    return db_order
+    return OrderResponse.model_validate(db_order)
 
 @router.post("/guest/create")
 async def create_guest_order(
     order_data: GuestOrderCreate,
+    idempotency: Optional[str] = Depends(idempotency_key),
     db: Session = Depends(get_db)
 ):
-    for item in order_data.items:
-        product = db.query(Product).filter(Product.id == item.product_id).first()
-        if not product:
-            raise HTTPException(status_code=404, detail=f"Product {item.product_id} not found")
-        
-        if product.stock < item.quantity:
-            raise HTTPException(status_code=400, detail=f"Insufficient stock for {product.name}")
+    return await run_idempotent(
+        f"orders.guest_create:{order_data.shipping_address.email.lower()}", idempotency, order_data,
+        lambda: _create_guest_order(order_data, db)
+    )
+
+async def _create_guest_order(order_data: GuestOrderCreate, db: Session):
+    product_ids = {item.product_id for item in order_data.items}
+    found_ids = {row[0] for row in db.query(Product.id).filter(Product.id.in_(product_ids))}
+    missing_ids = product_ids - found_ids
+    if missing_ids:
+        raise HTTPException(status_code=404, detail=f"Product {min(missing_ids)} not found")
     
-    order_number = f"GST-{datetime.utcnow().strftime('%Y%m%d')}-{uuid.uuid4().hex[:8].upper()}"
+    order_number = next_order_number("GST")
     
     guest_user = db.query(User).filter(User.email == order_data.shipping_address.email).first()
     
@@ -109,6 +139,7 @@ async def create_guest_order(
         guest_user = User(
             email=order_data.shipping_address.email,
             full_name=order_data.shipping_address.full_name,
+            hashed_password=hash_password(secrets.token_urlsafe(32)),  # Unusable until a password reset
             is_active=True,
             is_admin=False
         )
@@ -133,13 +164,17 @@ async def create_guest_order(
         total_amount=order_data.total_amount,
         status=OrderStatus.PENDING.value,
         payment_method=order_data.payment_method.value,
-        delivery_address_id=guest_address.id,
+        shipping_address_id=guest_address.id,
+        customer_email=order_data.shipping_address.email,
+        customer_name=order_data.shipping_address.full_name,
+        customer_phone=order_data.shipping_address.phone,
         payment_status=PaymentStatus.PENDING.value
     )
     
     db.add(db_order)
     db.flush()
     
+    quantities = {}
     for item in order_data.items:
         order_item = OrderItem(
             order_id=db_order.id,
@@ -148,10 +183,9 @@ async def create_guest_order(
             price=item.price
         )
         db.add(order_item)
-        
-        product = db.query(Product).filter(Product.id == item.product_id).first()
-        product.stock -= item.quantity
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
     
+    take_order_stock(db, db_order.id, quantities)
     db.commit()
     db.refresh(db_order)
     
@@ -172,9 +206,27 @@ async def list_user_orders(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    orders = db.query(Order).filter(Order.user_id == current_user.id).order_by(Order.created_at.desc()).all()
+    orders = db.query(Order).options(
+        joinedload(Order.items),
+        joinedload(Order.shipping_address)
+    ).filter(Order.user_id == current_user.id).order_by(Order.created_at.desc()).all()
     return orders
 
+@router.get("/history")
+async def list_order_history(
+    response: Response,
+    limit: int = Query(20, ge=1, le=100),
+    before: Optional[int] = Query(None),
+    include_archived: bool = Query(False),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Order summaries without items, newest first. The next page's cursor is in X-Next-Before"""
+    page = order_history(db, current_user.id, limit=limit, before=before, include_archived=include_archived)
+    if page["next_before"] is not None:
+        response.headers["X-Next-Before"] = str(page["next_before"])
+    return page["orders"]
+
 @router.get("/{order_id}", response_model=OrderResponse)
 async def get_order(
     order_id: int,
@@ -260,7 +312,7 @@ async def initiate_guest_payment(
     if order.status != OrderStatus.PENDING.value:
         raise HTTPException(status_code=400, detail="Order cannot be paid")
     
-    address = db.query(Address).filter(Address.id == order.delivery_address_id).first()
+    address = db.query(Address).filter(Address.id == order.shipping_address_id).first()
     if not address:
         raise HTTPException(status_code=404, detail="Address not found")
     
@@ -321,7 +373,7 @@ async def confirm_payment(
         raise HTTPException(status_code=404, detail="Order not found")
     
     try:
-        order.status = OrderStatus.PAID.value
+        order.status = OrderStatus.PROCESSING.value
         order.payment_status = PaymentStatus.PAID.value
         order.payment_reference = payment_ref
         db.commit()
@@ -343,7 +395,7 @@ async def confirm_guest_payment(
         raise HTTPException(status_code=404, detail="Order not found")
     
     try:
-        order.status = OrderStatus.PAID.value
+        order.status = OrderStatus.PROCESSING.value
         order.payment_status = PaymentStatus.PAID.value
         order.payment_reference = payment_ref
         db.commit()
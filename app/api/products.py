@@ -2,42 +2,49 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, Form
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from pathlib import Path
-import shutil
 import os
+import time
 from datetime import datetime
 
 from app.core.database import get_db
 from app.models.models import Product, Category, ProductImage, User
-from app.core.security import get_current_user, require_admin
+from app.core.security import get_current_user, get_current_admin_user
+from app.services.inventory import on_hand_expression, record_movements, set_stock
+from app.services.storage import storage
+from app.services.upload_store import store_uploads_concurrently
 
 router = APIRouter()
 
-UPLOAD_DIR = Path("app/static/uploads")
-UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+def serialize_image(img: ProductImage):
+    return {
+        "id": img.id,
+        "filename": img.filename,
+        "filepath": storage.url(img.filename),
+        "is_primary": img.is_primary,
+        "width": img.width,
+        "height": img.height,
+        "dominant_color": img.dominant_color,
+        "placeholder": img.placeholder
+    }
+
+def product_on_hand(db: Session, product_id: int) -> int:
+    return db.query(on_hand_expression()).filter(Product.id == product_id).scalar() or 0
 
-def serialize_product(product: Product):
+def serialize_product(product: Product, on_hand: int):
+    """on_hand comes from on_hand_expression(), Product.stock lags until compaction"""
     return {
         "id": product.id,
         "name": product.name,
         "description": product.description,
         "price": product.price,
         "original_price": product.original_price,
-        "images": [
-            {
-                "id": img.id,
-                "filename": img.filename,
-                "filepath": f"/static/uploads/{img.filename}",
-                "is_primary": img.is_primary
-            }
-            for img in product.images
-        ],
+        "images": [serialize_image(img) for img in product.images],
         "category": {
             "id": product.category.id,
             "name": product.category.name
         } if product.category else None,
         "category_id": product.category_id,
-        "stock": product.stock,
+        "stock": on_hand,
         "is_new": product.is_new,
         "is_sale": product.is_sale,
         "download_count": product.download_count,
@@ -45,6 +52,41 @@ def serialize_product(product: Product):
         "created_at": product.created_at.isoformat() if product.created_at else None,
     }
 
+async def attach_product_images(
+    db: Session,
+    product_id: int,
+    images: List[UploadFile],
+    first_is_primary: bool,
+    near_duplicates: Optional[str] = None
+):
+    """Process uploads concurrently and insert their ProductImage rows in one batch"""
+    results, timings = await store_uploads_concurrently(
+        db, [image_file for image_file in images if image_file.filename], duplicate_action=near_duplicates
+    )
+    
+    started = time.perf_counter()
+    product_images = []
+    for result in results:
+        if result["status"] == "failed":
+            continue
+        blob = result["blob"]
+        product_image = ProductImage(
+            filename=blob.filename,
+            filepath=storage.uri(blob.filename),
+            product_id=product_id,
+            blob_id=blob.id,
+            is_primary=first_is_primary and not product_images,
+            **result["metadata"]
+        )
+        result["image"] = product_image
+        product_images.append(product_image)
+    
+    db.add_all(product_images)
+    db.commit()
+    timings["insert_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    
+    return results, timings, product_images
+
 @router.get("/", response_model=List[dict])
 async def list_products(
     category_id: int = Query(None),
@@ -53,7 +95,7 @@ async def list_products(
     search: str = Query(None),
     db: Session = Depends(get_db)
 ):
-    query = db.query(Product).filter(Product.is_active == True)
+    query = db.query(Product, on_hand_expression().label("on_hand")).filter(Product.is_active == True)
 
     if category_id:
         query = query.filter(Product.category_id == category_id)
@@ -65,20 +107,20 @@ async def list_products(
         )
 
     products = query.offset(skip).limit(limit).all()
-    return [serialize_product(p) for p in products]
+    return [serialize_product(p, on_hand) for p, on_hand in products]
 
 @router.get("/{product_id}", response_model=dict)
 async def get_product(product_id: int, db: Session = Depends(get_db)):
-    product = (
-        db.query(Product)
+    row = (
+        db.query(Product, on_hand_expression().label("on_hand"))
         .filter(Product.id == product_id, Product.is_active == True)
         .first()
     )
 
-    if not product:
+    if not row:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    return serialize_product(product)
+    return serialize_product(row.Product, row.on_hand)
 
 @router.post("/{product_id}/download")
 async def increment_download_count(
@@ -110,7 +152,7 @@ async def create_product(
     is_sale: bool = Form(False),
     images: List[UploadFile] = File([]),
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_admin)
+    current_user: User = Depends(get_current_admin_user)
 ):
     category = db.query(Category).filter(Category.id == category_id).first()
     if not category:
@@ -128,76 +170,50 @@ async def create_product(
     )
     
     db.add(product)
+    db.flush()
+    record_movements(db, "restock", {product.id: stock}, note="Initial stock", applied=True)
     db.commit()
     db.refresh(product)
     
-    uploaded_images = []
-    for index, image_file in enumerate(images):
-        if image_file.filename:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            file_extension = Path(image_file.filename).suffix
-            unique_filename = f"{product.id}_{timestamp}_{index}{file_extension}"
-            file_path = UPLOAD_DIR / unique_filename
-            
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(image_file.file, buffer)
-            
-            product_image = ProductImage(
-                filename=unique_filename,
-                filepath=str(file_path),
-                product_id=product.id,
-                is_primary=(index == 0)
-            )
-            db.add(product_image)
-            uploaded_images.append(product_image)
-    
-    db.commit()
+    await attach_product_images(db, product.id, images, first_is_primary=True)
     
-    return serialize_product(product)
+    return serialize_product(product, product_on_hand(db, product.id))
 
 @router.post("/{product_id}/upload-images")
 async def upload_product_images(
     product_id: int,
     images: List[UploadFile] = File(...),
+    near_duplicates: Optional[str] = Query(None, pattern="^(flag|reject|off)$"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_admin)
+    current_user: User = Depends(get_current_admin_user)
 ):
     product = db.query(Product).filter(Product.id == product_id).first()
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    uploaded_images = []
-    for index, image_file in enumerate(images):
-        if image_file.filename:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            file_extension = Path(image_file.filename).suffix
-            unique_filename = f"{product.id}_{timestamp}_{index}{file_extension}"
-            file_path = UPLOAD_DIR / unique_filename
-            
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(image_file.file, buffer)
-            
-            product_image = ProductImage(
-                filename=unique_filename,
-                filepath=str(file_path),
-                product_id=product.id,
-                is_primary=False
-            )
-            db.add(product_image)
-            uploaded_images.append(product_image)
-    
-    db.commit()
+    results, timings, uploaded_images = await attach_product_images(
+        db, product.id, images, first_is_primary=False, near_duplicates=near_duplicates
+    )
+    failed = [result for result in results if result["status"] == "failed"]
     
     return {
         "message": f"{len(uploaded_images)} images uploaded successfully",
-        "images": [
+        "images": [serialize_image(img) for img in uploaded_images],
+        "results": [
             {
-                "id": img.id,
-                "filename": img.filename,
-                "filepath": f"/static/uploads/{img.filename}"
+                "filename": result["filename"],
+                "status": result["status"],
+                "error": result["error"],
+                "digest": result["digest"],
+                "size": result["size"],
+                "image_id": result["image"].id if result.get("image") else None,
+                "near_duplicates": result["near_duplicates"],
+                "timings": result["timings"]
             }
-            for img in uploaded_images
-        ]
+            for result in results
+        ],
+        "failed_count": len(failed),
+        "timings": timings
     }
 
 @router.put("/{product_id}")
@@ -212,7 +228,7 @@ async def update_product(
     is_new: Optional[bool] = Form(None),
     is_sale: Optional[bool] = Form(None),
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_admin)
+    current_user: User = Depends(get_current_admin_user)
 ):
     product = db.query(Product).filter(Product.id == product_id).first()
     if not product:
@@ -227,7 +243,7 @@ async def update_product(
     if original_price is not None:
         product.original_price = original_price
     if stock is not None:
-        product.stock = stock
+        set_stock(db, product.id, stock, kind="adjust", note="Product edit")
     if category_id is not None:
         category = db.query(Category).filter(Category.id == category_id).first()
         if not category:
@@ -241,13 +257,13 @@ async def update_product(
     db.commit()
     db.refresh(product)
     
-    return serialize_product(product)
+    return serialize_product(product, product_on_hand(db, product.id))
 
 @router.delete("/{product_id}")
 async def delete_product(
     product_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_admin)
+    current_user: User = Depends(get_current_admin_user)
 ):
     product = db.query(Product).filter(Product.id == product_id).first()
     if not product:
@@ -261,7 +277,7 @@ async def delete_product(
 @router.get("/admin/stats/downloads")
 async def get_download_stats(
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_admin)
+    current_user: User = Depends(get_current_admin_user)
 ):
     from sqlalchemy import func
     
@@ -292,7 +308,7 @@ async def update_product_stock(
     product_id: int,
     stock_update: dict,
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_admin)
+    current_user: User = Depends(get_current_admin_user)
 ):
     """Update product stock in both local database and Supabase"""
     try:
@@ -305,10 +321,8 @@ async def update_product_stock(
         if new_stock is None or new_stock < 0:
             raise HTTPException(status_code=400, detail="Invalid stock value")
         
-        # Update local database
-        product.stock = new_stock
-        # Note: Your Product model doesn't have updated_at field based on your code
-        # You might need to add it to your models.py if you want tracking
+        # Update local database, logging the difference to the inventory ledger
+        set_stock(db, product_id, new_stock, kind="adjust", note=stock_update.get("note") or "Stock update")
         db.commit()
         
         # Update Supabase if credentials are available
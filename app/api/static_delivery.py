@@ -0,0 +1,63 @@
+# app/api/static_delivery.py
+from fastapi import APIRouter, HTTPException, Response
+from fastapi.responses import RedirectResponse
+from pathlib import Path
+from urllib.parse import quote
+import mimetypes
+
+from app.core.config import settings
+from app.services.storage import storage
+
+router = APIRouter()
+
+# Always mounted: stable links to stored files, see StorageBackend.public_url
+files_router = APIRouter()
+
+DELIVERY_MODES = ("direct", "x-accel", "x-sendfile")
+
+def resolve_upload_path(file_path: str) -> Path:
+    """Resolve a public path to a file inside UPLOAD_DIR or raise 404"""
+    base_dir = Path(settings.UPLOAD_DIR).resolve()
+
+    # Hidden segments (temp files, quarantine) are never served
+    if any(part.startswith(".") for part in Path(file_path).parts):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    resolved = (base_dir / file_path).resolve()
+    if base_dir not in resolved.parents or not resolved.is_file():
+        raise HTTPException(status_code=404, detail="File not found")
+
+    return resolved
+
+def delegated_file_response(file_path: str) -> Response:
+    """Empty response telling the fronting server which file to stream"""
+    resolved = resolve_upload_path(file_path)
+    media_type = mimetypes.guess_type(resolved.name)[0] or "application/octet-stream"
+
+    if settings.STATIC_DELIVERY_MODE == "x-sendfile":
+        headers = {"X-Sendfile": str(resolved)}
+    else:
+        relative = resolved.relative_to(Path(settings.UPLOAD_DIR).resolve()).as_posix()
+        prefix = settings.X_ACCEL_INTERNAL_PREFIX.rstrip("/")
+        headers = {"X-Accel-Redirect": f"{prefix}/{quote(relative)}"}
+
+    return Response(status_code=200, media_type=media_type, headers=headers)
+
+@router.api_route("/static/uploads/{file_path:path}", methods=["GET", "HEAD"])
+async def serve_static_upload(file_path: str):
+    return delegated_file_response(file_path)
+
+@router.api_route("/static/{file_path:path}", methods=["GET", "HEAD"])
+async def serve_static(file_path: str):
+    return delegated_file_response(file_path)
+
+@router.api_route("/uploads/{file_path:path}", methods=["GET", "HEAD"])
+async def serve_upload(file_path: str):
+    return delegated_file_response(file_path)
+
+@files_router.get("/files/{key}")
+async def redirect_to_file(key: str):
+    """Redirect to a freshly signed (or public) URL for a stored file"""
+    if key.startswith(".") or "/" in key or not storage.exists(key):
+        raise HTTPException(status_code=404, detail="File not found")
+    return RedirectResponse(storage.url(key), status_code=307)
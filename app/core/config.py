@@ -22,6 +22,12 @@ class Settings(BaseSettings):
     PAYSTACK_SECRET_KEY: Optional[str] = os.getenv("PAYSTACK_SECRET_KEY")
     PAYSTACK_PUBLIC_KEY: Optional[str] = os.getenv("PAYSTACK_PUBLIC_KEY")
     PAYSTACK_CALLBACK_URL: Optional[str] = os.getenv("PAYSTACK_CALLBACK_URL", "http://localhost:3000/order-confirmation")
+    PAYSTACK_BASE_URL: str = os.getenv("PAYSTACK_BASE_URL", "https://api.paystack.co")  # http://localhost:8090 for app.fake_paystack
+    PAYSTACK_CONNECT_TIMEOUT_SECONDS: float = float(os.getenv("PAYSTACK_CONNECT_TIMEOUT_SECONDS", "3"))
+    PAYSTACK_READ_TIMEOUT_SECONDS: float = float(os.getenv("PAYSTACK_READ_TIMEOUT_SECONDS", "10"))
+    PAYSTACK_MAX_CONNECTIONS: int = int(os.getenv("PAYSTACK_MAX_CONNECTIONS", "20"))
+    PAYSTACK_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("PAYSTACK_MAX_KEEPALIVE_CONNECTIONS", "10"))
+    PAYSTACK_VERIFY_CACHE_SECONDS: int = int(os.getenv("PAYSTACK_VERIFY_CACHE_SECONDS", "5"))  # Pending verify results, terminal ones are read from the DB
     
     # Email - USING YOUR RAILWAY VARIABLES
     SMTP_USER: str = os.getenv("SMTP_USER", "ruthlessbyt@gmail.com")
@@ -37,6 +43,118 @@ class Settings(BaseSettings):
     # Uploads
     UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", "app/static/uploads")
     MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024
+    UPLOAD_WORKERS: int = int(os.getenv("UPLOAD_WORKERS", "4"))  # Threads hashing/decoding/writing uploads
+    
+    # Near-duplicate image detection (perceptual hash)
+    PHASH_DUPLICATE_ACTION: str = os.getenv("PHASH_DUPLICATE_ACTION", "flag")  # flag | reject | off
+    PHASH_MAX_DISTANCE: int = int(os.getenv("PHASH_MAX_DISTANCE", "6"))  # Hamming bits out of 64, at most 7
+    
+    # Static delivery - "direct" streams files from uvicorn, "x-accel" (nginx)
+    # and "x-sendfile" (Apache/lighttpd) only resolve the path and let the
+    # fronting server stream the bytes
+    STATIC_DELIVERY_MODE: str = os.getenv("STATIC_DELIVERY_MODE", "direct")
+    X_ACCEL_INTERNAL_PREFIX: str = os.getenv("X_ACCEL_INTERNAL_PREFIX", "/_protected/uploads/")
+    
+    # Storage - "local" keeps files in UPLOAD_DIR, "s3" uses any S3-compatible
+    # object store (AWS, MinIO, R2) and hands out presigned GET URLs
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "local")
+    UPLOAD_URL_PREFIX: str = os.getenv("UPLOAD_URL_PREFIX", "/static/uploads")
+    S3_BUCKET: Optional[str] = os.getenv("S3_BUCKET")
+    S3_ENDPOINT_URL: Optional[str] = os.getenv("S3_ENDPOINT_URL")  # e.g. http://localhost:9000 for MinIO
+    S3_REGION: str = os.getenv("S3_REGION", "us-east-1")
+    S3_ACCESS_KEY_ID: Optional[str] = os.getenv("S3_ACCESS_KEY_ID")
+    S3_SECRET_ACCESS_KEY: Optional[str] = os.getenv("S3_SECRET_ACCESS_KEY")
+    S3_KEY_PREFIX: str = os.getenv("S3_KEY_PREFIX", "uploads/")
+    S3_PRESIGN_EXPIRES: int = int(os.getenv("S3_PRESIGN_EXPIRES", "3600"))
+    S3_PUBLIC_BASE_URL: Optional[str] = os.getenv("S3_PUBLIC_BASE_URL")  # Public bucket/CDN origin for site assets
+    S3_MULTIPART_CHUNK_SIZE: int = 8 * 1024 * 1024
+    
+    # Key-value store for short-lived state (guest carts) - "memory" is a
+    # per-process LRU, "redis" any Redis-protocol server shared by workers
+    KV_STORE_BACKEND: str = os.getenv("KV_STORE_BACKEND", "memory")
+    REDIS_URL: Optional[str] = os.getenv("REDIS_URL")  # e.g. redis://localhost:6379/0
+    KV_KEY_PREFIX: str = os.getenv("KV_KEY_PREFIX", "fashion:")
+    KV_MEMORY_MAX_ENTRIES: int = int(os.getenv("KV_MEMORY_MAX_ENTRIES", "10000"))
+    
+    # Guest carts - kept in the KV store under a signed cookie, never in the database
+    GUEST_CART_COOKIE: str = os.getenv("GUEST_CART_COOKIE", "guest_cart")
+    GUEST_CART_TTL_HOURS: int = int(os.getenv("GUEST_CART_TTL_HOURS", "72"))  # Sliding, renewed on every visit
+    GUEST_CART_MAX_LINES: int = int(os.getenv("GUEST_CART_MAX_LINES", "50"))
+    COOKIE_SECURE: bool = os.getenv("COOKIE_SECURE", "false").lower() == "true"
+    
+    # Idempotency-Key replay for order creation and payment initialization
+    IDEMPOTENCY_TTL_HOURS: int = int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))  # How long a stored response is replayed
+    IDEMPOTENCY_LOCK_SECONDS: int = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))  # Pending claim, outlives a crashed worker
+    IDEMPOTENCY_WAIT_SECONDS: int = int(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))  # Duplicate waits this long, then 409
+    
+    # Order numbers - PREFIX-YYYYMM-NNNNNN from a monthly DB counter, reserved
+    # in blocks per worker so most orders never touch the counter row
+    ORDER_NUMBER_PREFIX: str = os.getenv("ORDER_NUMBER_PREFIX", "OH")
+    ORDER_NUMBER_BLOCK_SIZE: int = int(os.getenv("ORDER_NUMBER_BLOCK_SIZE", "20"))
+    
+    # Stock holds placed at payment initialization
+    STOCK_HOLD_MINUTES: int = int(os.getenv("STOCK_HOLD_MINUTES", "15"))
+    STOCK_HOLD_SWEEP_INTERVAL_MINUTES: int = int(os.getenv("STOCK_HOLD_SWEEP_INTERVAL_MINUTES", "5"))
+    STOCK_HOLD_SWEEP_BATCH_SIZE: int = int(os.getenv("STOCK_HOLD_SWEEP_BATCH_SIZE", "500"))
+    STOCK_HOLD_SWEEP_MAX_BATCHES: int = int(os.getenv("STOCK_HOLD_SWEEP_MAX_BATCHES", "20"))
+    
+    # Inventory ledger compaction (folds pending movements into Product.stock)
+    INVENTORY_COMPACTION_INTERVAL_SECONDS: int = int(os.getenv("INVENTORY_COMPACTION_INTERVAL_SECONDS", "60"))
+    INVENTORY_COMPACTION_BATCH_SIZE: int = int(os.getenv("INVENTORY_COMPACTION_BATCH_SIZE", "1000"))
+    INVENTORY_COMPACTION_MAX_BATCHES: int = int(os.getenv("INVENTORY_COMPACTION_MAX_BATCHES", "20"))
+    
+    # Background jobs
+    BACKGROUND_JOBS_ENABLED: bool = os.getenv("BACKGROUND_JOBS_ENABLED", "true").lower() == "true"
+    
+    # Transactional outbox for post-payment side effects (emails, Supabase sync)
+    OUTBOX_WORKERS: int = int(os.getenv("OUTBOX_WORKERS", "2"))  # Threads per process draining the outbox, 0 disables
+    OUTBOX_POLL_SECONDS: float = float(os.getenv("OUTBOX_POLL_SECONDS", "2"))
+    OUTBOX_BATCH_SIZE: int = int(os.getenv("OUTBOX_BATCH_SIZE", "10"))
+    OUTBOX_MAX_ATTEMPTS: int = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))  # Then the message is marked dead
+    OUTBOX_BACKOFF_SECONDS: int = int(os.getenv("OUTBOX_BACKOFF_SECONDS", "5"))  # Doubles per attempt
+    OUTBOX_BACKOFF_MAX_SECONDS: int = int(os.getenv("OUTBOX_BACKOFF_MAX_SECONDS", "900"))
+    OUTBOX_LOCK_SECONDS: int = int(os.getenv("OUTBOX_LOCK_SECONDS", "300"))
+    OUTBOX_RETENTION_DAYS: int = int(os.getenv("OUTBOX_RETENTION_DAYS", "7"))
+    
+    # Paystack webhook inbox (services/webhook_inbox.py)
+    WEBHOOK_WORKERS: int = int(os.getenv("WEBHOOK_WORKERS", "2"))  # Threads per process applying stored webhooks, 0 disables
+    WEBHOOK_POLL_SECONDS: float = float(os.getenv("WEBHOOK_POLL_SECONDS", "2"))
+    WEBHOOK_BATCH_SIZE: int = int(os.getenv("WEBHOOK_BATCH_SIZE", "20"))
+    WEBHOOK_MAX_ATTEMPTS: int = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "10"))  # Then the event is marked dead
+    WEBHOOK_LOCK_SECONDS: int = int(os.getenv("WEBHOOK_LOCK_SECONDS", "120"))
+    WEBHOOK_RETENTION_DAYS: int = int(os.getenv("WEBHOOK_RETENTION_DAYS", "30"))
+    
+    # Jobs that must run on one worker at a time hold a lease in job_states
+    JOB_LEASE_SECONDS: int = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+    
+    # Unpaid orders from payment initialization expire after this long
+    PENDING_ORDER_TTL_MINUTES: int = int(os.getenv("PENDING_ORDER_TTL_MINUTES", "120"))
+    PENDING_ORDER_SWEEP_INTERVAL_MINUTES: int = int(os.getenv("PENDING_ORDER_SWEEP_INTERVAL_MINUTES", "10"))
+    PENDING_ORDER_SWEEP_BATCH_SIZE: int = int(os.getenv("PENDING_ORDER_SWEEP_BATCH_SIZE", "200"))
+    PENDING_ORDER_SWEEP_MAX_BATCHES: int = int(os.getenv("PENDING_ORDER_SWEEP_MAX_BATCHES", "20"))
+    
+    # Archival of delivered/cancelled orders into the archived_* tables
+    ORDER_ARCHIVE_AFTER_DAYS: int = int(os.getenv("ORDER_ARCHIVE_AFTER_DAYS", "180"))
+    ORDER_ARCHIVE_INTERVAL_MINUTES: int = int(os.getenv("ORDER_ARCHIVE_INTERVAL_MINUTES", "1440"))
+    ORDER_ARCHIVE_BATCH_SIZE: int = int(os.getenv("ORDER_ARCHIVE_BATCH_SIZE", "200"))
+    ORDER_ARCHIVE_MAX_BATCHES: int = int(os.getenv("ORDER_ARCHIVE_MAX_BATCHES", "50"))
+    
+    # Orphaned upload garbage collection
+    UPLOAD_GC_INTERVAL_MINUTES: int = int(os.getenv("UPLOAD_GC_INTERVAL_MINUTES", "360"))
+    UPLOAD_GC_BATCH_SIZE: int = int(os.getenv("UPLOAD_GC_BATCH_SIZE", "500"))
+    UPLOAD_GC_MAX_BATCHES: int = int(os.getenv("UPLOAD_GC_MAX_BATCHES", "20"))  # Per run, the cursor resumes the rest
+    UPLOAD_GC_GRACE_HOURS: int = int(os.getenv("UPLOAD_GC_GRACE_HOURS", "24"))
+    UPLOAD_GC_MODE: str = os.getenv("UPLOAD_GC_MODE", "quarantine")  # quarantine | delete
+    UPLOAD_GC_QUARANTINE_DAYS: int = int(os.getenv("UPLOAD_GC_QUARANTINE_DAYS", "30"))  # Then quarantined files are deleted
+    
+    # Local Paystack stand-in (app/fake_paystack.py), never used in production
+    FAKE_PAYSTACK_WEBHOOK_URL: Optional[str] = os.getenv("FAKE_PAYSTACK_WEBHOOK_URL", "http://localhost:8000/api/payments/webhook")
+    FAKE_PAYSTACK_AUTO_COMPLETE: Optional[str] = os.getenv("FAKE_PAYSTACK_AUTO_COMPLETE")  # success | failed, settle on initialize
+    FAKE_PAYSTACK_LATENCY_MS: int = int(os.getenv("FAKE_PAYSTACK_LATENCY_MS", "0"))
+    FAKE_PAYSTACK_LATENCY_JITTER_MS: int = int(os.getenv("FAKE_PAYSTACK_LATENCY_JITTER_MS", "0"))
+    FAKE_PAYSTACK_FAILURE_RATE: float = float(os.getenv("FAKE_PAYSTACK_FAILURE_RATE", "0"))  # Share of calls answered with a 500
+    FAKE_PAYSTACK_HANG_RATE: float = float(os.getenv("FAKE_PAYSTACK_HANG_RATE", "0"))  # Share of calls that stall past client timeouts
+    FAKE_PAYSTACK_HANG_SECONDS: float = float(os.getenv("FAKE_PAYSTACK_HANG_SECONDS", "30"))
     
     # Supabase
     SUPABASE_URL: Optional[str] = os.getenv("SUPABASE_URL")
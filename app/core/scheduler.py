@@ -0,0 +1,53 @@
+# app/core/scheduler.py - IN-PROCESS PERIODIC BACKGROUND JOBS
+import asyncio
+import logging
+from typing import Callable, Dict, List
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+class PeriodicJob:
+    def __init__(self, name: str, func: Callable[[], object], interval_seconds: float, initial_delay: float = 5):
+        self.name = name
+        self.func = func
+        self.interval_seconds = interval_seconds
+        self.initial_delay = initial_delay
+
+class Scheduler:
+    """Runs blocking job functions in the threadpool on a fixed interval.
+
+    Jobs own their sessions and must be safe to run on several workers;
+    each run is independent, so a crash only skips one interval.
+    """
+
+    def __init__(self):
+        self.jobs: Dict[str, PeriodicJob] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    def add_job(self, name: str, func: Callable[[], object], interval_seconds: float, initial_delay: float = 5):
+        self.jobs[name] = PeriodicJob(name, func, interval_seconds, initial_delay)
+
+    async def _run_forever(self, job: PeriodicJob):
+        await asyncio.sleep(job.initial_delay)
+        while True:
+            try:
+                await run_in_threadpool(job.func)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception(f"Background job {job.name} failed")
+            await asyncio.sleep(job.interval_seconds)
+
+    def start(self):
+        for job in self.jobs.values():
+            self._tasks.append(asyncio.create_task(self._run_forever(job)))
+        print(f"⏱️ Started {len(self._tasks)} background jobs: {', '.join(self.jobs)}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+scheduler = Scheduler()
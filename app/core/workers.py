@@ -0,0 +1,59 @@
+# app/core/workers.py - THREAD POOLS THAT DRAIN A DATABASE QUEUE
+import logging
+import threading
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+class DrainWorkerPool:
+    """`workers` threads that call drain() until stopped.
+
+    drain() claims and runs one batch and reports {"processed", "failed"}.
+    When a batch is empty the threads sleep for poll_seconds, or until
+    notify() wakes them after a commit in this process, so new rows are
+    normally picked up at once. Several processes can run pools against
+    the same table because claiming is done in the database.
+    """
+
+    def __init__(self, name: str, drain: Callable[[], Dict[str, int]], workers: int, poll_seconds: float):
+        self.name = name
+        self.drain = drain
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+    def notify(self) -> None:
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                report = self.drain()
+            except Exception:
+                logger.exception(f"{self.name} worker failed to drain")
+                report = {"processed": 0, "failed": 0}
+            if not report["processed"] and not report["failed"]:
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        if self.workers <= 0:
+            logger.warning(f"{self.name} workers disabled, queued rows wait for another process or an admin drain")
+            return
+        self._stop.clear()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"📬 Started {self.workers} {self.name} workers")
+
+    def stop(self, timeout: float = 10) -> None:
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
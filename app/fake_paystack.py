@@ -0,0 +1,293 @@
+# app/fake_paystack.py - LOCAL PAYSTACK STAND-IN FOR TESTS AND LOAD RUNS
+#
+#   uvicorn app.fake_paystack:app --port 8090
+#   PAYSTACK_BASE_URL=http://localhost:8090 uvicorn app.main:app
+#
+# Keeps transactions and refunds in memory. Webhooks are signed with
+# PAYSTACK_SECRET_KEY exactly like Paystack does, so the real
+# /api/payments/webhook accepts them.
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import random
+import uuid
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, RedirectResponse
+from pydantic import BaseModel
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+SECRET_KEY = settings.PAYSTACK_SECRET_KEY or "sk_test_fake"
+
+app = FastAPI(title="Fake Paystack", docs_url="/_fake/docs", openapi_url="/_fake/openapi.json")
+
+transactions: Dict[str, Dict[str, Any]] = {}  # reference -> transaction
+refunds: List[Dict[str, Any]] = []
+_access_codes: Dict[str, str] = {}  # access_code -> reference
+_callbacks: Dict[str, str] = {}  # reference -> callback_url
+_ids = {"transaction": 4000000000, "refund": 9000000}
+
+class FaultConfig(BaseModel):
+    latency_ms: int = settings.FAKE_PAYSTACK_LATENCY_MS
+    latency_jitter_ms: int = settings.FAKE_PAYSTACK_LATENCY_JITTER_MS
+    failure_rate: float = settings.FAKE_PAYSTACK_FAILURE_RATE
+    hang_rate: float = settings.FAKE_PAYSTACK_HANG_RATE
+    hang_seconds: float = settings.FAKE_PAYSTACK_HANG_SECONDS
+    auto_complete: Optional[str] = settings.FAKE_PAYSTACK_AUTO_COMPLETE
+    webhook_url: Optional[str] = settings.FAKE_PAYSTACK_WEBHOOK_URL
+
+faults = FaultConfig()
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+def _next_id(kind: str) -> int:
+    _ids[kind] += 1
+    return _ids[kind]
+
+def _ok(message: str, data: Any, **extra) -> Dict[str, Any]:
+    return {"status": True, "message": message, "data": data, **extra}
+
+def _error(status_code: int, message: str) -> JSONResponse:
+    return JSONResponse(status_code=status_code, content={"status": False, "message": message})
+
+def sign(body: bytes) -> str:
+    """x-paystack-signature for a webhook body, as checked by verify_paystack_signature"""
+    return hmac.new(SECRET_KEY.encode("utf-8"), body, hashlib.sha512).hexdigest()
+
+async def emit_webhook(event: str, data: Dict[str, Any]) -> Optional[int]:
+    """POST a signed event to the configured webhook URL, returning its status code"""
+    if not faults.webhook_url:
+        return None
+    body = json.dumps({"event": event, "data": data}).encode("utf-8")
+    try:
+        async with httpx.AsyncClient(timeout=10) as client:
+            response = await client.post(
+                faults.webhook_url,
+                content=body,
+                headers={"Content-Type": "application/json", "x-paystack-signature": sign(body)},
+            )
+        logger.info(f"Fake Paystack {event} webhook for {data.get('reference')}: {response.status_code}")
+        return response.status_code
+    except httpx.HTTPError as e:
+        logger.warning(f"Fake Paystack {event} webhook for {data.get('reference')} failed: {e}")
+        return None
+
+_deliveries = set()
+
+def _deliver_later(event: str, data: Dict[str, Any]) -> None:
+    """Send the webhook after the response, like Paystack. Tasks are kept until done"""
+    task = asyncio.get_running_loop().create_task(emit_webhook(event, data))
+    _deliveries.add(task)
+    task.add_done_callback(_deliveries.discard)
+
+def _settle(transaction: Dict[str, Any], outcome: str) -> None:
+    transaction["status"] = outcome
+    transaction["gateway_response"] = "Approved" if outcome == "success" else "Declined"
+    if outcome == "success":
+        transaction["paid_at"] = _now()
+        transaction["authorization"] = {
+            "authorization_code": f"AUTH_{uuid.uuid4().hex[:10]}",
+            "last4": "4081",
+            "card_type": "visa",
+            "bank": "TEST BANK",
+        }
+    _deliver_later("charge.success" if outcome == "success" else "charge.failed", dict(transaction))
+
+@app.middleware("http")
+async def inject_faults(request: Request, call_next):
+    """Latency and failures for the API routes; /_fake and /checkout are exempt"""
+    path = request.url.path
+    if path.startswith("/_fake") or path.startswith("/checkout"):
+        return await call_next(request)
+
+    if request.headers.get("authorization") != f"Bearer {SECRET_KEY}":
+        return _error(401, "Invalid key")
+
+    delay = faults.latency_ms + random.uniform(0, faults.latency_jitter_ms)
+    if delay:
+        await asyncio.sleep(delay / 1000)
+    roll = random.random()
+    if roll < faults.hang_rate:
+        await asyncio.sleep(faults.hang_seconds)
+    elif roll < faults.hang_rate + faults.failure_rate:
+        return _error(500, "Fake Paystack injected failure")
+    return await call_next(request)
+
+@app.post("/transaction/initialize")
+async def initialize_transaction(request: Request):
+    payload = await request.json()
+    if not payload.get("email"):
+        return _error(400, "Email is required")
+    try:
+        amount = int(payload.get("amount"))
+    except (TypeError, ValueError):
+        return _error(400, "Invalid Amount Sent")
+
+    reference = payload.get("reference") or uuid.uuid4().hex[:12]
+    if reference in transactions:
+        return _error(400, "Duplicate Transaction Reference")
+
+    access_code = uuid.uuid4().hex[:15]
+    metadata = payload.get("metadata") or {}
+    transactions[reference] = {
+        "id": _next_id("transaction"),
+        "domain": "test",
+        "status": "abandoned",
+        "reference": reference,
+        "amount": amount,
+        "currency": payload.get("currency", "NGN"),
+        "gateway_response": "The transaction was not completed",
+        "channel": "card",
+        "ip_address": request.client.host if request.client else None,
+        "metadata": metadata,
+        "customer": {"id": zlib.crc32(payload["email"].encode("utf-8")), "email": payload["email"], "customer_code": f"CUS_{uuid.uuid4().hex[:12]}"},
+        "authorization": {},
+        "created_at": _now(),
+        "transaction_date": _now(),
+        "paid_at": None,
+    }
+    _access_codes[access_code] = reference
+    if payload.get("callback_url"):
+        _callbacks[reference] = payload["callback_url"]
+
+    if faults.auto_complete in ("success", "failed"):
+        _settle(transactions[reference], faults.auto_complete)
+
+    return _ok("Authorization URL created", {
+        "authorization_url": f"{str(request.base_url).rstrip('/')}/checkout/{access_code}",
+        "access_code": access_code,
+        "reference": reference,
+    })
+
+@app.get("/transaction/verify/{reference}")
+async def verify_transaction(reference: str):
+    transaction = transactions.get(reference)
+    if not transaction:
+        return _error(400, "Transaction reference not found")
+    return _ok("Verification successful", transaction)
+
+@app.get("/transaction")
+async def list_transactions(
+    perPage: int = 50,
+    page: int = 1,
+    status: Optional[str] = None,
+    customer: Optional[str] = None
+):
+    rows = sorted(transactions.values(), key=lambda transaction: transaction["id"], reverse=True)
+    if status:
+        rows = [row for row in rows if row["status"] == status]
+    if customer:
+        rows = [row for row in rows if customer in (str(row["customer"]["id"]), row["customer"]["email"])]
+    start = (page - 1) * perPage
+    return _ok("Transactions retrieved", rows[start:start + perPage], meta={
+        "total": len(rows),
+        "page": page,
+        "perPage": perPage,
+        "pageCount": max(1, -(-len(rows) // perPage)),
+    })
+
+@app.get("/transaction/{transaction_id}")
+async def fetch_transaction(transaction_id: int):
+    for transaction in transactions.values():
+        if transaction["id"] == transaction_id:
+            return _ok("Transaction retrieved", transaction)
+    return _error(404, "Transaction not found")
+
+@app.post("/refund")
+async def create_refund(request: Request):
+    payload = await request.json()
+    key = str(payload.get("transaction", ""))
+    transaction = transactions.get(key) or next(
+        (row for row in transactions.values() if str(row["id"]) == key), None
+    )
+    if not transaction:
+        return _error(404, "Transaction not found")
+    if transaction["status"] != "success":
+        return _error(400, "Transaction has not been paid")
+
+    refunded = sum(refund["amount"] for refund in refunds if refund["transaction"]["reference"] == transaction["reference"])
+    amount = int(payload.get("amount") or transaction["amount"] - refunded)
+    if amount <= 0 or refunded + amount > transaction["amount"]:
+        return _error(400, "Refund amount cannot be greater than the unrefunded transaction amount")
+
+    refund = {
+        "id": _next_id("refund"),
+        "transaction": {"id": transaction["id"], "reference": transaction["reference"]},
+        "amount": amount,
+        "currency": transaction["currency"],
+        "status": "processed",
+        "customer_note": payload.get("customer_note"),
+        "merchant_note": payload.get("merchant_note"),
+        "refunded_at": _now(),
+        "created_at": _now(),
+    }
+    refunds.append(refund)
+    if refunded + amount == transaction["amount"]:
+        transaction["status"] = "reversed"
+
+    _deliver_later("refund.processed", {**refund, "reference": transaction["reference"]})
+    return _ok("Refund has been queued for processing", refund)
+
+@app.get("/refund")
+async def list_refunds(reference: Optional[str] = None):
+    rows = [refund for refund in refunds if not reference or refund["transaction"]["reference"] == reference]
+    return _ok("Refunds retrieved", rows)
+
+@app.get("/checkout/{access_code}")
+async def checkout(access_code: str, outcome: str = "success"):
+    """Stands in for the hosted payment page: settles and redirects to the callback URL"""
+    reference = _access_codes.get(access_code)
+    if not reference:
+        return _error(404, "Invalid access code")
+    transaction = transactions[reference]
+    if transaction["status"] == "abandoned":
+        _settle(transaction, "success" if outcome == "success" else "failed")
+    if reference in _callbacks:
+        return RedirectResponse(f"{_callbacks[reference]}?trxref={reference}&reference={reference}", status_code=302)
+    return _ok("Checkout complete", transaction)
+
+@app.post("/_fake/transactions/{reference}/complete")
+async def complete_transaction(reference: str, outcome: str = "success"):
+    transaction = transactions.get(reference)
+    if not transaction:
+        return _error(404, "Transaction reference not found")
+    _settle(transaction, "success" if outcome == "success" else "failed")
+    return _ok("Transaction settled", transaction)
+
+@app.post("/_fake/transactions/{reference}/webhook")
+async def resend_webhook(reference: str):
+    """Deliver the settled transaction's event again, like a Paystack retry"""
+    transaction = transactions.get(reference)
+    if not transaction or transaction["status"] not in ("success", "failed"):
+        return _error(400, "Transaction is not settled")
+    event = "charge.success" if transaction["status"] == "success" else "charge.failed"
+    return _ok("Webhook sent", {"event": event, "status_code": await emit_webhook(event, transaction)})
+
+@app.get("/_fake/config")
+async def get_fault_config():
+    return faults
+
+@app.put("/_fake/config")
+async def update_fault_config(changes: Dict[str, Any]):
+    """Change only the given fields, e.g. {"failure_rate": 0.2}"""
+    global faults
+    faults = FaultConfig(**{**faults.model_dump(), **changes})
+    return faults
+
+@app.post("/_fake/reset")
+async def reset():
+    transactions.clear()
+    refunds.clear()
+    _access_codes.clear()
+    _callbacks.clear()
+    return {"status": True, "message": "Fake Paystack reset"}
@@ -3,17 +3,29 @@ from fastapi import FastAPI, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from datetime import datetime
+from typing import Dict
 import os
 from pathlib import Path
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
 from app.core.database import Base, engine, SessionLocal, get_db
 from app.core.config import settings
-from app.api import auth
+from app.core.scheduler import scheduler
+from app.api import admin_upload, auth, cart, orders, products
 
 from app.payments import router as payments_router
 from app.api.admin import router as admin_router  
-from app.models.models import ProductImage, Order, OrderItem, Product
+from app.api.static_delivery import router as static_delivery_router, files_router, DELIVERY_MODES
+from app.models.models import ProductImage, Order, OrderItem
+from app.services.inventory import InsufficientStock, decrement_stock, record_movements, run_hold_sweep, run_movement_compaction
+from app.services.order_archive import run_order_archive
+from app.services.order_expiry import run_order_expiry
+from app.services.outbox import outbox_workers, run_outbox_purge
+from app.services.paystack_client import paystack_client
+from app.services.webhook_inbox import run_webhook_purge, webhook_workers
+from app.services.upload_gc import run_upload_gc
+from app.services.upload_store import shutdown_upload_executor
 
 def init_database():
     from sqlalchemy import inspect, text
@@ -58,6 +70,64 @@ def init_database():
             print("Adding is_sale column to products table...")
             db.execute(text("ALTER TABLE products ADD COLUMN is_sale BOOLEAN DEFAULT 0"))
         
+        try:
+            db.execute(text('SELECT blob_id FROM "product-images" LIMIT 1'))
+        except Exception:
+            print("Adding blob_id column to product-images table...")
+            db.execute(text('ALTER TABLE "product-images" ADD COLUMN blob_id INTEGER REFERENCES upload_blobs(id)'))
+            db.execute(text('CREATE INDEX IF NOT EXISTS "ix_product-images_blob_id" ON "product-images" (blob_id)'))
+        
+        db.execute(text('CREATE INDEX IF NOT EXISTS "ix_product-images_filename" ON "product-images" (filename)'))
+        db.execute(text("CREATE INDEX IF NOT EXISTS ix_orders_user_history ON orders (user_id, id)"))
+        db.execute(text("CREATE INDEX IF NOT EXISTS ix_order_items_order_id ON order_items (order_id)"))
+        db.execute(text("CREATE INDEX IF NOT EXISTS ix_orders_payment_status_created ON orders (payment_status, created_at)"))
+        db.execute(text("CREATE INDEX IF NOT EXISTS ix_orders_status_created ON orders (status, created_at)"))
+        
+        for column, column_type in [
+            ("lease_owner", "VARCHAR"),
+            ("lease_expires_at", "DATETIME"),
+        ]:
+            try:
+                db.execute(text(f"SELECT {column} FROM job_states LIMIT 1"))
+            except Exception:
+                print(f"Adding {column} column to job_states table...")
+                db.execute(text(f"ALTER TABLE job_states ADD COLUMN {column} {column_type}"))
+        
+        try:
+            db.execute(text("SELECT phash FROM upload_blobs LIMIT 1"))
+        except Exception:
+            print("Adding phash column to upload_blobs table...")
+            db.execute(text("ALTER TABLE upload_blobs ADD COLUMN phash VARCHAR"))
+            db.execute(text("CREATE INDEX IF NOT EXISTS ix_upload_blobs_phash ON upload_blobs (phash)"))
+        
+        for column, column_type in [
+            ("width", "INTEGER"),
+            ("height", "INTEGER"),
+            ("dominant_color", "VARCHAR"),
+            ("placeholder", "TEXT"),
+        ]:
+            try:
+                db.execute(text(f'SELECT {column} FROM "product-images" LIMIT 1'))
+            except Exception:
+                print(f"Adding {column} column to product-images table...")
+                db.execute(text(f'ALTER TABLE "product-images" ADD COLUMN {column} {column_type}'))
+        
+        # Older clients could add the same product twice; fold those lines
+        # together before the (user_id, product_id) unique index goes on
+        duplicates = db.execute(text(
+            "SELECT user_id, product_id, MIN(id), SUM(quantity) FROM cart_items "
+            "GROUP BY user_id, product_id HAVING COUNT(*) > 1"
+        )).fetchall()
+        if duplicates:
+            print(f"Merging {len(duplicates)} duplicated cart lines...")
+        for user_id, product_id, keep_id, quantity in duplicates:
+            db.execute(text("UPDATE cart_items SET quantity = :quantity WHERE id = :id"), {"quantity": quantity, "id": keep_id})
+            db.execute(
+                text("DELETE FROM cart_items WHERE user_id = :user_id AND product_id = :product_id AND id <> :id"),
+                {"user_id": user_id, "product_id": product_id, "id": keep_id}
+            )
+        db.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS uq_cart_items_user_product ON cart_items (user_id, product_id)"))
+        
         db.commit()
         print("Database initialization completed successfully!")
         
@@ -69,29 +139,34 @@ def init_database():
 
 init_database()
 
-def update_product_stock(db: Session, product_id: str, quantity: int, increase: bool = False):
+def update_product_stock(db: Session, order_id: int, quantities: Dict[int, int], increase: bool = False):
+    """Apply an order's {product_id: quantity} to stock and commit.
+
+    Restores are appended to the inventory ledger for the next compaction,
+    decrements are one guarded UPDATE so they can be refused.
+    """
     try:
-        product = db.query(Product).filter(Product.id == product_id).first()
-        
-        if not product:
-            raise HTTPException(status_code=404, detail=f"Product {product_id} not found")
-        
         if increase:
-            product.stock += quantity
+            record_movements(db, "cancel", quantities, order_id=order_id)
         else:
-            if product.stock < quantity:
-                raise HTTPException(
-                    status_code=400, 
-                    detail=f"Product {product.name} out of stock. Only {product.stock} available"
-                )
-            product.stock -= quantity
-        
+            decrement_stock(db, quantities, kind="sale", order_id=order_id)
         db.commit()
-        return product.stock
+    except InsufficientStock as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Insufficient stock: {e}")
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Error updating stock: {str(e)}")
 
+def order_quantities(db: Session, order_id: int) -> Dict[int, int]:
+    quantities = {}
+    for product_id, quantity in db.query(OrderItem.product_id, OrderItem.quantity).filter(
+        OrderItem.order_id == order_id,
+        OrderItem.product_id.isnot(None)
+    ):
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
 app = FastAPI(
     title="Fashion Store API",
     description="E-commerce backend for Next.js frontend",
@@ -129,11 +204,27 @@ app.add_middleware(
     max_age=600,
 )
 
-app.mount("/static", StaticFiles(directory=settings.UPLOAD_DIR), name="static")
+if settings.STATIC_DELIVERY_MODE not in DELIVERY_MODES:
+    print(f"⚠️ Unknown STATIC_DELIVERY_MODE '{settings.STATIC_DELIVERY_MODE}', falling back to direct")
+    settings.STATIC_DELIVERY_MODE = "direct"
+
+if settings.STATIC_DELIVERY_MODE == "direct":
+    # Product payloads link to /static/uploads/<key>, so mount it ahead of /static
+    app.mount("/static/uploads", StaticFiles(directory=settings.UPLOAD_DIR), name="static-uploads")
+    app.mount("/static", StaticFiles(directory=settings.UPLOAD_DIR), name="static")
+    app.mount("/uploads", StaticFiles(directory=settings.UPLOAD_DIR), name="uploads")
+else:
+    # nginx / Apache stream the bytes, the app only resolves the path
+    app.include_router(static_delivery_router, tags=["static"])
 
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
+app.include_router(cart.router, prefix="/api/cart", tags=["cart"])
+app.include_router(products.router, prefix="/api/products", tags=["products"])
+app.include_router(orders.router, prefix="/api/orders", tags=["orders"])
 app.include_router(payments_router)
+app.include_router(admin_upload.router, prefix="/api/admin/upload", tags=["admin"])
 app.include_router(admin_router, prefix="/api/admin", tags=["admin"])
+app.include_router(files_router, tags=["static"])
 
 @app.post("/api/orders/{order_id}/update-stock")
 async def update_stock_on_order_completion(
@@ -146,15 +237,14 @@ async def update_stock_on_order_completion(
             raise HTTPException(status_code=404, detail="Order not found")
         
         if order.payment_status == "paid":
-            order_items = db.query(OrderItem).filter(OrderItem.order_id == order_id).all()
-            
-            for item in order_items:
-                update_product_stock(db, item.product_id, item.quantity, increase=False)
+            update_product_stock(db, order_id, order_quantities(db, order_id), increase=False)
             
             return {"message": "Stock updated successfully", "order_id": order_id}
         else:
             return {"message": "Order not paid yet, stock not updated"}
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -168,13 +258,12 @@ async def restore_stock_on_order_cancel(
         if not order:
             raise HTTPException(status_code=404, detail="Order not found")
         
-        order_items = db.query(OrderItem).filter(OrderItem.order_id == order_id).all()
-        
-        for item in order_items:
-            update_product_stock(db, item.product_id, item.quantity, increase=True)
+        update_product_stock(db, order_id, order_quantities(db, order_id), increase=True)
         
         return {"message": "Stock restored successfully", "order_id": order_id}
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -243,6 +332,8 @@ async def startup_event():
     print(f"Environment: {os.getenv('ENVIRONMENT', 'development')}")
     print(f"Database: {settings.DATABASE_URL}")
     print(f"Upload directory: {settings.UPLOAD_DIR}")
+    print(f"Static delivery: {settings.STATIC_DELIVERY_MODE}")
+    print(f"Storage backend: {settings.STORAGE_BACKEND}")
     print("CORS allowed origins:")
     for origin in [
         "http://localhost:3000",
@@ -253,6 +344,50 @@ async def startup_event():
         print(f"  - {origin}")
     print("=" * 50)
 
+@app.on_event("startup")
+async def open_http_clients():
+    paystack_client.start()
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    await paystack_client.close()
+
+@app.on_event("shutdown")
+async def stop_upload_workers():
+    await run_in_threadpool(shutdown_upload_executor)
+
+@app.on_event("startup")
+async def start_background_jobs():
+    if not settings.BACKGROUND_JOBS_ENABLED:
+        print("Background jobs disabled")
+        return
+    
+    scheduler.add_job("upload_gc", run_upload_gc, settings.UPLOAD_GC_INTERVAL_MINUTES * 60, initial_delay=60)
+    scheduler.add_job("stock_hold_sweep", run_hold_sweep, settings.STOCK_HOLD_SWEEP_INTERVAL_MINUTES * 60)
+    scheduler.add_job("inventory_compaction", run_movement_compaction, settings.INVENTORY_COMPACTION_INTERVAL_SECONDS)
+    scheduler.add_job("pending_order_expiry", run_order_expiry, settings.PENDING_ORDER_SWEEP_INTERVAL_MINUTES * 60, initial_delay=30)
+    scheduler.add_job("order_archive", run_order_archive, settings.ORDER_ARCHIVE_INTERVAL_MINUTES * 60, initial_delay=300)
+    scheduler.add_job("outbox_purge", run_outbox_purge, 24 * 60 * 60, initial_delay=600)
+    scheduler.add_job("webhook_purge", run_webhook_purge, 24 * 60 * 60, initial_delay=900)
+    scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_background_jobs():
+    await scheduler.stop()
+
+@app.on_event("startup")
+async def start_queue_workers():
+    # Independent of BACKGROUND_JOBS_ENABLED: without these threads stored
+    # webhooks are never applied and outbox messages never sent. Set
+    # WEBHOOK_WORKERS=0 / OUTBOX_WORKERS=0 only where another process drains them
+    webhook_workers.start()
+    outbox_workers.start()
+
+@app.on_event("shutdown")
+async def stop_queue_workers():
+    await run_in_threadpool(webhook_workers.stop)
+    await run_in_threadpool(outbox_workers.stop)
+
 @app.on_event("startup")
 async def print_routes():
     from fastapi.routing import APIRoute
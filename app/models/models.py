@@ -1,5 +1,5 @@
 # app/models/models.py
-from sqlalchemy import Column, Integer, String, Text, Float, Boolean, ForeignKey, DateTime, JSON
+from sqlalchemy import Column, Integer, String, Text, Float, Boolean, ForeignKey, DateTime, JSON, Index, Table, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
@@ -67,13 +67,56 @@ class ProductImage(Base):
     __table_args__ = {"extend_existing": True}
 
     id = Column(Integer, primary_key=True, index=True)
-    filename = Column(String, nullable=False)
+    filename = Column(String, nullable=False, index=True)
     filepath = Column(String, nullable=False)
     product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"))
+    blob_id = Column(Integer, ForeignKey("upload_blobs.id"), nullable=True, index=True)  # Shared content-addressed file
     is_primary = Column(Boolean, default=False)
+    
+    # Extracted at upload time so the storefront can reserve layout and paint a placeholder
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    dominant_color = Column(String, nullable=True)  # #rrggbb
+    placeholder = Column(Text, nullable=True)  # Tiny base64 JPEG data URI (LQIP)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     product = relationship("Product", back_populates="images")
+    blob = relationship("UploadBlob", back_populates="images")
+
+
+# ==================== UPLOAD BLOB MODEL ====================
+class UploadBlob(Base):
+    __tablename__ = "upload_blobs"
+    __table_args__ = {"extend_existing": True}
+
+    id = Column(Integer, primary_key=True, index=True)
+    digest = Column(String, unique=True, index=True, nullable=False)  # sha256 hex of the file bytes
+    filename = Column(String, nullable=False)  # Storage key: <digest><ext>
+    size = Column(Integer, nullable=False)
+    content_type = Column(String, nullable=True)
+    ref_count = Column(Integer, default=0, nullable=False)  # ProductImage rows + site assets using it
+    phash = Column(String, nullable=True, index=True)  # 64-bit dHash as hex, see image_hash_bands
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    images = relationship("ProductImage", back_populates="blob")
+    hash_bands = relationship("ImageHashBand", back_populates="blob", cascade="all, delete-orphan")
+
+
+# ==================== IMAGE HASH BAND MODEL ====================
+class ImageHashBand(Base):
+    """One 8-bit slice of a blob's perceptual hash, for near-duplicate lookups"""
+    __tablename__ = "image_hash_bands"
+    __table_args__ = (
+        Index("ix_image_hash_bands_band_value", "band", "value"),
+        {"extend_existing": True},
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    blob_id = Column(Integer, ForeignKey("upload_blobs.id", ondelete="CASCADE"), nullable=False, index=True)
+    band = Column(Integer, nullable=False)
+    value = Column(Integer, nullable=False)
+
+    blob = relationship("UploadBlob", back_populates="hash_bands")
 
 
 # ==================== ADDRESS MODEL ====================
@@ -98,7 +141,11 @@ class Address(Base):
 # ==================== CART ITEM MODEL ====================
 class CartItem(Base):
     __tablename__ = "cart_items"
-    __table_args__ = {"extend_existing": True}
+    __table_args__ = (
+        # One line per product, so carts can be merged with INSERT ... ON CONFLICT
+        Index("uq_cart_items_user_product", "user_id", "product_id", unique=True),
+        {"extend_existing": True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
@@ -113,18 +160,23 @@ class CartItem(Base):
 # ==================== ORDER MODEL (UPDATED FOR PAYSTACK) ====================
 class Order(Base):
     __tablename__ = "orders"
-    __table_args__ = {"extend_existing": True}
+    __table_args__ = (
+        Index("ix_orders_user_history", "user_id", "id"),  # Keyset-paginated order history, newest first
+        Index("ix_orders_payment_status_created", "payment_status", "created_at"),  # Stale pending order sweep
+        Index("ix_orders_status_created", "status", "created_at"),  # Archival of closed orders
+        {"extend_existing": True, "sqlite_autoincrement": True},  # Never reuse ids that now live in archived_orders
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
     shipping_address_id = Column(Integer, ForeignKey("addresses.id"))
     
     # Order identification
-    order_number = Column(String, unique=True, index=True, nullable=False)  # Custom order number like OH-202412-0001
+    order_number = Column(String, unique=True, index=True, nullable=False)  # e.g. OH-202412-000001, see services/order_numbers.py
     
     # Status fields
     status = Column(String, default="pending")  # pending, processing, shipped, delivered, cancelled
-    payment_status = Column(String, default="pending")  # pending, paid, failed, refunded, partially_paid
+    payment_status = Column(String, default="pending")  # pending, paid, failed, refunded, partially_paid, expired
     
     # Amount and currency
     total_amount = Column(Float, nullable=False)
@@ -164,10 +216,10 @@ class Order(Base):
 # ==================== ORDER ITEM MODEL ====================
 class OrderItem(Base):
     __tablename__ = "order_items"
-    __table_args__ = {"extend_existing": True}
+    __table_args__ = {"extend_existing": True, "sqlite_autoincrement": True}
 
     id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("orders.id", ondelete="CASCADE"))
+    order_id = Column(Integer, ForeignKey("orders.id", ondelete="CASCADE"), index=True)
     product_id = Column(Integer, ForeignKey("products.id", ondelete="SET NULL"), nullable=True)
     quantity = Column(Integer, nullable=False)
     price = Column(Float, nullable=False)
@@ -190,7 +242,7 @@ class OrderItem(Base):
 # ==================== TRANSACTION MODEL (NEW FOR PAYSTACK) ====================
 class Transaction(Base):
     __tablename__ = "transactions"
-    __table_args__ = {"extend_existing": True}
+    __table_args__ = {"extend_existing": True, "sqlite_autoincrement": True}
 
     id = Column(Integer, primary_key=True, index=True)
     order_id = Column(Integer, ForeignKey("orders.id", ondelete="CASCADE"))
@@ -225,4 +277,148 @@ class Transaction(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationship
-    order = relationship("Order", back_populates="transactions")
\ No newline at end of file
+    order = relationship("Order", back_populates="transactions")
+
+
+# ==================== STOCK RESERVATION MODEL ====================
+class StockReservation(Base):
+    """Short-lived hold on stock while a checkout is being paid"""
+    __tablename__ = "stock_reservations"
+    __table_args__ = (
+        # Covers the per-product sum of active holds in availability checks
+        Index("ix_stock_reservations_product_expires", "product_id", "expires_at"),
+        {"extend_existing": True},
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    order_id = Column(Integer, ForeignKey("orders.id", ondelete="CASCADE"), nullable=True, index=True)
+    quantity = Column(Integer, nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)  # Holds past this are ignored, then swept
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+# ==================== INVENTORY MOVEMENT MODEL ====================
+class InventoryMovement(Base):
+    """Append-only stock ledger. Pending rows are folded into Product.stock by compaction"""
+    __tablename__ = "inventory_movements"
+    __table_args__ = (
+        Index("ix_inventory_movements_product_created", "product_id", "created_at"),  # Audit range queries
+        Index(
+            "ix_inventory_movements_pending", "product_id",
+            sqlite_where=text("applied = 0"), postgresql_where=text("NOT applied"),
+        ),
+        {"extend_existing": True},
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    kind = Column(String, nullable=False)  # sale, restock, cancel, adjust, sync
+    quantity = Column(Integer, nullable=False)  # Signed change to on-hand stock
+    applied = Column(Boolean, default=False, nullable=False)  # Already included in Product.stock
+    order_id = Column(Integer, nullable=True, index=True)  # No FK, so the ledger outlives archived orders
+    note = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+# ==================== OUTBOX MESSAGE MODEL ====================
+class OutboxMessage(Base):
+    """Side effects written in the same transaction as the change that causes them"""
+    __tablename__ = "outbox_messages"
+    __table_args__ = (
+        Index("ix_outbox_messages_status_available", "status", "available_at"),  # Worker claim query
+        {"extend_existing": True},
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)  # Handler name, e.g. order_confirmation_email
+    payload = Column(JSON, nullable=False)
+    status = Column(String, default="pending", nullable=False)  # pending, processing, done, dead
+    attempts = Column(Integer, default=0, nullable=False)
+    available_at = Column(DateTime(timezone=True), nullable=False)  # Not retried before this
+    locked_until = Column(DateTime(timezone=True), nullable=True)  # A crashed worker's claim lapses here
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class WebhookEvent(Base):
+    """Paystack webhook bodies, stored on receipt and processed by the inbox workers"""
+    __tablename__ = "webhook_events"
+    __table_args__ = (
+        Index("ix_webhook_events_status_available", "status", "available_at"),  # Worker claim query
+        Index("ix_webhook_events_reference", "reference", "id"),  # Per-reference ordering
+        {"extend_existing": True},
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    event_key = Column(String, unique=True, nullable=False)  # event:reference:paystack id, retries collapse onto it
+    event = Column(String, nullable=False)  # charge.success, charge.failed
+    reference = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)  # The event's data object
+    status = Column(String, default="pending", nullable=False)  # pending, processing, done, dead
+    attempts = Column(Integer, default=0, nullable=False)
+    available_at = Column(DateTime(timezone=True), nullable=False)
+    locked_until = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+    received_at = Column(DateTime(timezone=True), server_default=func.now())
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+
+
+# ==================== JOB STATE MODEL ====================
+class JobState(Base):
+    __tablename__ = "job_states"
+    __table_args__ = {"extend_existing": True}
+
+    name = Column(String, primary_key=True)
+    cursor = Column(String, nullable=True)  # Resume point for batched jobs
+    last_run_at = Column(DateTime(timezone=True), nullable=True)
+    last_result = Column(JSON, nullable=True)
+    lease_owner = Column(String, nullable=True)  # Worker currently running the job, see services/job_lease.py
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+# ==================== SEQUENCE COUNTER MODEL ====================
+class SequenceCounter(Base):
+    """Named counters handed out to workers in blocks (order numbers)"""
+    __tablename__ = "sequence_counters"
+    __table_args__ = {"extend_existing": True}
+
+    name = Column(String, primary_key=True)  # e.g. order_number:202610
+    next_value = Column(Integer, nullable=False, default=1)  # First value not yet reserved by any worker
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+# ==================== ARCHIVE TABLES ====================
+# Cold copies of closed orders, their items and transactions, moved out by
+# services/order_archive.py. Same columns as the hot tables, keeping the
+# original ids, without foreign keys so rows can outlive their parents
+def _archive_columns(source):
+    return [
+        Column(column.name, column.type, primary_key=column.primary_key, autoincrement=False, nullable=column.nullable)
+        for column in source.columns
+    ] + [Column("archived_at", DateTime(timezone=True), server_default=func.now())]
+
+archived_orders = Table(
+    "archived_orders", Base.metadata,
+    *_archive_columns(Order.__table__),
+    Index("ix_archived_orders_user_history", "user_id", "id"),
+    Index("ix_archived_orders_order_number", "order_number"),
+    extend_existing=True,
+)
+
+archived_order_items = Table(
+    "archived_order_items", Base.metadata,
+    *_archive_columns(OrderItem.__table__),
+    Index("ix_archived_order_items_order_id", "order_id"),
+    extend_existing=True,
+)
+
+archived_transactions = Table(
+    "archived_transactions", Base.metadata,
+    *_archive_columns(Transaction.__table__),
+    Index("ix_archived_transactions_order_id", "order_id"),
+    Index("ix_archived_transactions_reference", "reference"),
+    extend_existing=True,
+)
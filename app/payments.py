@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Request, Response
+from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Request, Response, Query
 from fastapi.responses import JSONResponse
+from sqlalchemy import func, update
 from sqlalchemy.orm import Session
 from typing import Dict, Any, Optional
-import requests
+import asyncio
+import httpx
 import hashlib
 import hmac
 import json
@@ -12,17 +14,23 @@ import os
 from dotenv import load_dotenv
 import csv
 import io
-import threading
-import time
 
 from app.core.config import settings
 from app.schemas.order import OrderCreate, PaystackInitializeResponse
 
 load_dotenv()
 
-from app.core.database import get_db
+from app.core.database import SessionLocal, get_db
 from app.models.models import Order, Transaction, OrderItem, Address, User, Product
 from app.services.email_manager import email_manager as email_service
+from app.services.idempotency import idempotency_key, run_idempotent
+from app.services import outbox, webhook_inbox
+from app.services.inventory import InsufficientStock, on_hand_expression, place_holds, record_movements, release_holds, set_stock
+from app.services.kv_store import kv_store
+from app.services.order_history import order_history
+from app.services.order_numbers import next_order_number
+from app.services.outbox import outbox_workers
+from app.services.paystack_client import paystack_client
 from sqlalchemy.orm import joinedload
 
 SUPABASE_URL = settings.SUPABASE_URL
@@ -30,7 +38,7 @@ SUPABASE_KEY = settings.SUPABASE_SERVICE_KEY
 PAYSTACK_SECRET_KEY = settings.PAYSTACK_SECRET_KEY
 PAYSTACK_PUBLIC_KEY = settings.PAYSTACK_PUBLIC_KEY
 FRONTEND_URL = settings.FRONTEND_URL
-PAYSTACK_BASE_URL = "https://api.paystack.co"
+PAYSTACK_BASE_URL = settings.PAYSTACK_BASE_URL.rstrip("/")
 
 router = APIRouter(prefix="/api/payments", tags=["payments"])
 
@@ -81,11 +89,6 @@ async def initialize_payment_debug(
             "error": str(e)
         }
 
-def generate_order_number():
-    timestamp = datetime.now().strftime("%Y%m")
-    unique_id = str(uuid.uuid4().int)[:4]
-    return f"OH-{timestamp}-{unique_id}"
-
 def verify_paystack_signature(payload: bytes, signature: str) -> bool:
     if not signature or not PAYSTACK_SECRET_KEY:
         return False
@@ -114,122 +117,63 @@ def parse_datetime(date_string: str):
             return None
     except (ValueError, TypeError, AttributeError):
         return None
+
 def update_product_stock_on_order(db: Session, order_id: int):
-    """Update stock when an order is paid - FIXED VERSION"""
-    try:
-        order_items = db.query(OrderItem).filter(OrderItem.order_id == order_id).all()
-        
-        if not order_items:
-            print(f"⚠️ No items found for order {order_id}")
-            return
-        
-        print(f"🔄 Processing stock update for order {order_id} with {len(order_items)} items")
-        
-        # Update local database first (immediate)
-        for item in order_items:
-            product = db.query(Product).filter(Product.id == item.product_id).first()
-            if product:
-                old_stock = product.stock
-                new_stock = max(0, old_stock - item.quantity)
-                product.stock = new_stock
-                print(f"📦 Local DB: Product {product.id} stock: {old_stock} → {new_stock} (-{item.quantity})")
-        
-        db.commit()
-        print(f"✅ Local database updated for order {order_id}")
-        
-        # Update Supabase in background if credentials are available
-        if SUPABASE_URL and SUPABASE_KEY:
-            print(f"🚀 Starting Supabase background sync for order {order_id}")
-            threading.Thread(
-                target=_sync_stock_to_supabase,
-                args=(order_items,),
-                daemon=True
-            ).start()
-        else:
-            print("⚠️ Supabase credentials missing, skipping Supabase update")
-            
-    except Exception as e:
-        db.rollback()
-        print(f"❌ Failed to update stock for order {order_id}: {e}")
-        import traceback
-        traceback.print_exc()
-        raise
+    """Record a paid order's sale in the inventory ledger and queue the Supabase sync.
 
-def _sync_stock_to_supabase(order_items):
-    """Background thread to sync stock to Supabase"""
-    try:
-        # Give a small delay to ensure local DB commit is complete
-        time.sleep(1)
-        
-        from supabase import create_client
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-        
-        print(f"🔄 Supabase sync started for {len(order_items)} items")
-        
-        for item in order_items:
-            try:
-                product_id_str = str(item.product_id)
-                
-                # First, try to get current stock from Supabase
-                try:
-                    response = supabase.table("products")\
-                        .select("id, name, stock")\
-                        .eq("id", product_id_str)\
-                        .single()\
-                        .execute()
-                    
-                    if response.data:
-                        current_stock = response.data.get('stock', 0)
-                        new_stock = max(0, current_stock - item.quantity)
-                        
-                        # Update Supabase
-                        update_response = supabase.table("products")\
-                            .update({
-                                "stock": new_stock,
-                                "updated_at": datetime.now(timezone.utc).isoformat()
-                            })\
-                            .eq("id", product_id_str)\
-                            .execute()
-                        
-                        print(f"✅ Supabase: Product {product_id_str} updated to {new_stock} (-{item.quantity})")
-                    else:
-                        print(f"⚠️ Product {product_id_str} not found in Supabase")
-                        
-                except Exception as fetch_error:
-                    # Product might not exist or other error - try direct update
-                    print(f"⚠️ Could not fetch product {product_id_str} from Supabase: {fetch_error}")
-                    
-                    # Try direct update assuming we know the stock should be reduced
-                    try:
-                        # This is a fallback - try to decrement stock directly
-                        update_response = supabase.table("products")\
-                            .update({
-                                "stock": supabase.table("products")
-                                    .select("stock")
-                                    .eq("id", product_id_str)
-                                    .single()
-                                    .execute()
-                                    .data.get('stock', 0) - item.quantity,
-                                "updated_at": datetime.now(timezone.utc).isoformat()
-                            })\
-                            .eq("id", product_id_str)\
-                            .execute()
-                        print(f"✅ Used fallback update for product {product_id_str}")
-                    except Exception as fallback_error:
-                        print(f"❌ Fallback also failed for product {product_id_str}: {fallback_error}")
-                        
-            except Exception as item_error:
-                print(f"❌ Error processing product {item.product_id}: {item_error}")
-                continue  # Continue with next item even if one fails
-        
-        print(f"🎉 Supabase sync completed")
-        
-    except ImportError:
-        print("❌ Supabase client not available")
-    except Exception as e:
-        print(f"❌ Supabase sync failed: {e}")
-        import traceback
-        traceback.print_exc()
+    Nothing is committed here, so the sale is written in the same
+    transaction as the order update that caused it.
+    """
+    quantities = {}
+    for product_id, quantity in db.query(OrderItem.product_id, OrderItem.quantity).filter(
+        OrderItem.order_id == order_id,
+        OrderItem.product_id.isnot(None)
+    ):
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    
+    if not quantities:
+        print(f"⚠️ No items found for order {order_id}")
+        return
+    
+    # Folded into product stock by the next compaction. The payment is
+    # already taken, so oversold lines are clamped there
+    record_movements(db, "sale", {product_id: -quantity for product_id, quantity in quantities.items()}, order_id=order_id)
+    
+    if SUPABASE_URL and SUPABASE_KEY:
+        outbox.enqueue(db, "supabase_stock_sync", {"product_ids": sorted(quantities), "order_id": order_id})
+
+@outbox.handler("supabase_stock_sync")
+def sync_stock_to_supabase(db: Session, payload: Dict[str, Any]):
+    """Push the local on-hand count of each product to Supabase.
+
+    Absolute values rather than decrements, so a retried message cannot
+    take stock off twice.
+    """
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        return
+    
+    from supabase import create_client
+    supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+    
+    products = db.query(Product.id, on_hand_expression().label("on_hand")).filter(
+        Product.id.in_(payload["product_ids"])
+    ).all()
+    
+    failed = []
+    for product in products:
+        response = supabase.table("products")\
+            .update({
+                "stock": max(0, product.on_hand),
+                "updated_at": datetime.now(timezone.utc).isoformat()
+            })\
+            .eq("id", str(product.id))\
+            .execute()
+        if not response.data:
+            failed.append(product.id)
+    
+    if failed:
+        raise RuntimeError(f"Supabase did not update products {failed}")
+    print(f"✅ Supabase: synced stock for {len(products)} products")
 
 # Add these debugging and sync endpoints:
 
@@ -250,8 +194,7 @@ async def debug_update_stock(
         if not product:
             return {"success": False, "message": f"Product {product_id} not found in local DB"}
         
-        old_stock = product.stock
-        product.stock = new_stock
+        old_stock = set_stock(db, product.id, new_stock, kind="adjust", note="debug update-stock")
         db.commit()
         
         # Try to update Supabase
@@ -300,8 +243,8 @@ async def debug_check_stock(product_id: str, db: Session = Depends(get_db)):
     """Check stock in both databases"""
     
     # Check local database
-    product = db.query(Product).filter(Product.id == product_id).first()
-    local_stock = product.stock if product else None
+    product = db.query(Product.name, on_hand_expression().label("on_hand")).filter(Product.id == product_id).first()
+    local_stock = product.on_hand if product else None
     
     # Check Supabase
     supabase_stock = None
@@ -352,8 +295,8 @@ async def sync_all_stock(db: Session = Depends(get_db)):
         from supabase import create_client
         supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
         
-        # Get all products from local database
-        local_products = db.query(Product).all()
+        # Get all products from local database, stock including uncompacted movements
+        local_products = db.query(Product.id, Product.name, on_hand_expression().label("stock")).all()
         
         synced_count = 0
         failed_count = 0
@@ -653,8 +596,16 @@ async def get_transaction_details(
 @router.post("/initialize", response_model=PaystackInitializeResponse)
 async def initialize_payment(
     order_data: OrderCreate,
+    idempotency: Optional[str] = Depends(idempotency_key),
     db: Session = Depends(get_db)
 ):
+    """Create the order and Paystack transaction, once per customer and Idempotency-Key"""
+    return await run_idempotent(
+        f"payments.initialize:{order_data.email.lower()}", idempotency, order_data,
+        lambda: _initialize_payment(order_data, db)
+    )
+
+async def _initialize_payment(order_data: OrderCreate, db: Session):
     try:
         if not PAYSTACK_SECRET_KEY or not PAYSTACK_PUBLIC_KEY:
             raise HTTPException(
@@ -662,7 +613,8 @@ async def initialize_payment(
                 detail="Paystack configuration missing"
             )
         
-        order_number = generate_order_number()
+        committed_order = None
+        order_number = next_order_number()
         
         shipping_address = Address(
             street=order_data.shipping_address["street"],
@@ -717,6 +669,25 @@ async def initialize_payment(
             )
             db.add(order_item)
         
+        quantities = {}
+        for cart_item in order_data.cart_items:
+            if isinstance(cart_item.product_id, int):
+                quantities[cart_item.product_id] = quantities.get(cart_item.product_id, 0) + cart_item.quantity
+        
+        try:
+            place_holds(db, order.id, quantities)
+        except InsufficientStock as e:
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Insufficient stock: {e}"
+            )
+        
+        # Commit the order and its holds before calling Paystack, so product
+        # rows are not locked for the length of the request
+        db.commit()
+        committed_order = (order.id, shipping_address.id)
+        
         amount_in_kobo = int(order_data.total_amount * 100)
         
         headers = {
@@ -737,17 +708,18 @@ async def initialize_payment(
             }
         }
         
-        response = requests.post(
+        response = await paystack_client.post(
+            "transaction.initialize",
             f"{PAYSTACK_BASE_URL}/transaction/initialize",
             headers=headers,
-            json=payload,
-            timeout=30
+            json=payload
         )
         
         paystack_response = response.json()
         
         if not paystack_response.get("status"):
-            db.rollback()
+            discard_unpaid_order(db, committed_order)
+            committed_order = None
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=paystack_response.get("message", "Payment initialization failed")
@@ -778,8 +750,8 @@ async def initialize_payment(
         
         return result
         
-    except requests.exceptions.RequestException as e:
-        db.rollback()
+    except httpx.HTTPError as e:
+        discard_unpaid_order(db, committed_order)
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail=f"Payment service unavailable: {str(e)}"
@@ -787,17 +759,96 @@ async def initialize_payment(
     except HTTPException as e:
         raise e
     except Exception as e:
-        db.rollback()
+        discard_unpaid_order(db, committed_order)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Payment initialization failed: {str(e)}"
         )
 
+def discard_unpaid_order(db: Session, committed_order: Optional[tuple]):
+    """Undo an (order_id, address_id) committed before Paystack refused or failed to initialize it"""
+    db.rollback()
+    if not committed_order:
+        return
+    order_id, address_id = committed_order
+    try:
+        release_holds(db, order_id)
+        db.query(OrderItem).filter(OrderItem.order_id == order_id).delete(synchronize_session=False)
+        db.query(Order).filter(Order.id == order_id).delete(synchronize_session=False)
+        db.query(Address).filter(Address.id == address_id).delete(synchronize_session=False)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️ Could not discard order {order_id} after failed initialization: {e}")
+
+# Paystack will not change these, so verify answers them from our own rows
+TERMINAL_PAYMENT_STATUSES = ("success", "failed", "reversed")
+
+# reference -> upstream verification in progress in this process
+_verifications_in_flight: Dict[str, asyncio.Future] = {}
+
+def _verification_result(order: Order, transaction: Transaction, reference: str, message: Optional[str]) -> Dict[str, Any]:
+    return {
+        "success": transaction.status == "success",
+        "message": message,
+        "data": {
+            "order_number": order.order_number,
+            "order_id": order.id,
+            "status": order.status,
+            "payment_status": order.payment_status,
+            "amount": transaction.amount,
+            "paid_at": transaction.paid_at.isoformat() if transaction.paid_at else None,
+            "reference": reference
+        }
+    }
+
+def _local_verification(db: Session, reference: str) -> Optional[Dict[str, Any]]:
+    """The stored result for a reference whose Transaction is terminal, else None"""
+    transaction = db.query(Transaction).filter(
+        Transaction.reference == reference,
+        Transaction.status.in_(TERMINAL_PAYMENT_STATUSES)
+    ).first()
+    if not transaction:
+        return None
+    order = db.query(Order).filter(Order.id == transaction.order_id).first()
+    if not order:
+        return None
+    return _verification_result(order, transaction, reference, transaction.gateway_response)
+
 @router.get("/verify/{reference}")
 async def verify_payment(
     reference: str,
     db: Session = Depends(get_db)
 ):
+    """Payment status for the confirmation page, which polls this.
+
+    Terminal results come from the Transaction table without calling
+    Paystack. Otherwise one upstream call per reference runs at a time in
+    this process and concurrent pollers share its result. A non-terminal
+    result is cached for PAYSTACK_VERIFY_CACHE_SECONDS.
+    """
+    local = _local_verification(db, reference)
+    if local:
+        return local
+    
+    cached = kv_store.get(f"paystack_verify:{reference}")
+    if cached:
+        return cached
+    
+    in_flight = _verifications_in_flight.get(reference)
+    if in_flight is None:
+        in_flight = asyncio.ensure_future(_verify_with_paystack(reference))
+        _verifications_in_flight[reference] = in_flight
+        in_flight.add_done_callback(lambda _: _verifications_in_flight.pop(reference, None))
+    # Shielded so a poller that disconnects does not cancel the others' call
+    return await asyncio.shield(in_flight)
+
+async def _verify_with_paystack(reference: str) -> Dict[str, Any]:
+    """Ask Paystack, apply the result to the order and cache it if not terminal.
+
+    Runs detached from any one request, so it owns its session.
+    """
+    db = SessionLocal()
     try:
         if not PAYSTACK_SECRET_KEY:
             return {
@@ -811,10 +862,10 @@ async def verify_payment(
             "Content-Type": "application/json"
         }
         
-        response = requests.get(
+        response = await paystack_client.get(
+            "transaction.verify",
             f"{PAYSTACK_BASE_URL}/transaction/verify/{reference}",
-            headers=headers,
-            timeout=30
+            headers=headers
         )
         
         paystack_response = response.json()
@@ -828,9 +879,7 @@ async def verify_payment(
         
         data = paystack_response["data"]
         
-        order = db.query(Order).options(
-            joinedload(Order.items)
-        ).filter(Order.payment_reference == reference).first()
+        order = db.query(Order).filter(Order.payment_reference == reference).first()
         
         if not order:
             return {
@@ -839,84 +888,38 @@ async def verify_payment(
                 "data": None
             }
         
-        # FIXED: Removed commas that were creating tuples
         if data["status"] == "success":
-            order.status = "processing"
-            order.payment_status = "paid"
-            order.paystack_transaction_id = data["id"]
-            order.paid_at = datetime.now()
-            
-            update_product_stock_on_order(db, order.id)
-            
+            apply_successful_payment(db, order, data)
         elif data["status"] == "failed":
-            order.payment_status = "failed"
+            if order.payment_status != "paid":
+                order.payment_status = "failed"
+            release_holds(db, order.id)
         elif data["status"] == "abandoned":
-            order.payment_status = "pending"
-        
-        transaction = db.query(Transaction).filter(Transaction.reference == reference).first()
-        if not transaction:
-            transaction_date = parse_datetime(data.get("transaction_date"))
-            paid_at = parse_datetime(data.get("paid_at"))
-            
-            transaction = Transaction(
-                order_id=order.id,
-                reference=reference,
-                amount=data["amount"] / 100,
-                currency=data["currency"],
-                status=data["status"],
-                gateway_response=data["gateway_response"],
-                channel=data.get("channel"),
-                customer_email=data["customer"]["email"],
-                customer_id=data["customer"].get("id"),
-                ip_address=data.get("ip_address"),
-                authorization_code=data.get("authorization", {}).get("authorization_code"),
-                card_last4=data.get("authorization", {}).get("last4"),
-                card_type=data.get("authorization", {}).get("card_type"),
-                bank=data.get("authorization", {}).get("bank"),
-                transaction_date=transaction_date,
-                paid_at=paid_at
-            )
-            db.add(transaction)
-        else:
-            transaction.status = data["status"]
-            transaction.gateway_response = data["gateway_response"]
-            
-            if data.get("paid_at"):
-                paid_at = parse_datetime(data.get("paid_at"))
-                if paid_at:
-                    transaction.paid_at = paid_at
+            if order.payment_status != "paid":
+                order.payment_status = "pending"
         
+        transaction = save_transaction(db, order, reference, data, data["status"])
         db.commit()
+        outbox_workers.notify()
         
-        paid_at_iso = None
-        if transaction.paid_at:
-            paid_at_iso = transaction.paid_at.isoformat()
-        
-        return {
-            "success": data["status"] == "success",
-            "message": data["gateway_response"],
-            "data": {
-                "order_number": order.order_number,
-                "order_id": order.id,
-                "status": order.status,
-                "payment_status": order.payment_status,
-                "amount": transaction.amount,
-                "paid_at": paid_at_iso,
-                "reference": reference
-            }
-        }
+        result = _verification_result(order, transaction, reference, data["gateway_response"])
+        if transaction.status not in TERMINAL_PAYMENT_STATUSES:
+            kv_store.set(f"paystack_verify:{reference}", result, settings.PAYSTACK_VERIFY_CACHE_SECONDS)
+        return result
         
     except Exception as e:
+        db.rollback()
         return {
             "success": False,
             "message": f"Payment verification failed: {str(e)}",
             "data": None
         }
+    finally:
+        db.close()
 
 @router.post("/webhook")
 async def paystack_webhook(
     request: Request,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     try:
@@ -931,16 +934,16 @@ async def paystack_webhook(
         
         payload = json.loads(body)
         event = payload.get("event")
-        data = payload.get("data")
+        data = payload.get("data") or {}
         
-        if event == "charge.success":
-            background_tasks.add_task(handle_successful_payment, data, db)
-            return JSONResponse(content={"status": "success", "message": "Webhook received"})
-        elif event == "charge.failed":
-            background_tasks.add_task(handle_failed_payment, data, db)
-            return JSONResponse(content={"status": "success", "message": "Webhook received"})
+        if event not in webhook_inbox.HANDLERS:
+            return JSONResponse(content={"status": "ignored", "message": "Event not handled"})
         
-        return JSONResponse(content={"status": "ignored", "message": "Event not handled"})
+        # Stored and acknowledged; the inbox workers apply it to the order.
+        # A redelivered event hits ON CONFLICT and is acknowledged again
+        if webhook_inbox.record_event(db, event, data):
+            webhook_inbox.webhook_workers.notify()
+        return JSONResponse(content={"status": "success", "message": "Webhook received"})
     
     except Exception as e:
         raise HTTPException(
@@ -948,116 +951,141 @@ async def paystack_webhook(
             detail=f"Webhook processing failed: {str(e)}"
         )
 
+def apply_successful_payment(db: Session, order: Order, data: Dict[str, Any]) -> bool:
+    """Mark an order paid, record the sale and queue its side effects, once.
+
+    Verify and the webhook both land here, possibly at the same time. The
+    guarded "UPDATE ... WHERE payment_status != 'paid'" lets only one of
+    them through, and only that one records the sale and queues the email.
+    The caller must commit.
+    """
+    orders = Order.__table__
+    paid = db.execute(
+        update(orders)
+        .where(orders.c.id == order.id, orders.c.payment_status != "paid")
+        .values(
+            status="processing",
+            payment_status="paid",
+            paystack_transaction_id=data.get("id"),
+            paid_at=datetime.now(),
+            updated_at=func.now()
+        )
+    ).rowcount == 1
+    db.expire(order)
+    if not paid:
+        return False
+    
+    update_product_stock_on_order(db, order.id)
+    release_holds(db, order.id)
+    outbox.enqueue(db, "order_confirmation_email", {"order_id": order.id})
+    return True
+
+def save_transaction(db: Session, order: Order, reference: str, data: Dict[str, Any], transaction_status: str) -> Transaction:
+    """Insert or update the Transaction for a Paystack reference. The caller must commit"""
+    transaction = db.query(Transaction).filter(Transaction.reference == reference).first()
+    if transaction:
+        if transaction.status == "success":
+            # A late or replayed event never downgrades a settled payment
+            return transaction
+        transaction.status = transaction_status
+        transaction.gateway_response = data.get("gateway_response")
+        paid_at = parse_datetime(data.get("paid_at"))
+        if paid_at:
+            transaction.paid_at = paid_at
+        return transaction
+    
+    customer = data.get("customer") or {}
+    authorization = data.get("authorization") or {}
+    transaction = Transaction(
+        order_id=order.id,
+        reference=reference,
+        amount=data.get("amount", 0) / 100,
+        currency=data.get("currency", "NGN"),
+        status=transaction_status,
+        gateway_response=data.get("gateway_response"),
+        channel=data.get("channel"),
+        customer_email=customer.get("email") or order.customer_email,
+        customer_id=customer.get("id"),
+        ip_address=data.get("ip_address"),
+        authorization_code=authorization.get("authorization_code"),
+        card_last4=authorization.get("last4"),
+        card_type=authorization.get("card_type"),
+        bank=authorization.get("bank"),
+        transaction_date=parse_datetime(data.get("transaction_date")),
+        paid_at=parse_datetime(data.get("paid_at"))
+    )
+    db.add(transaction)
+    return transaction
+
+@webhook_inbox.handler("charge.success")
 def handle_successful_payment(data: Dict[str, Any], db: Session):
+    """charge.success from the inbox: one commit for order, transaction and outbox"""
+    reference = data.get("reference")
+    
+    order = db.query(Order).filter(Order.payment_reference == reference).first()
+    if not order:
+        return
+    
     try:
-        reference = data.get("reference")
-        
-        order = db.query(Order).options(
-            joinedload(Order.items)
-        ).filter(Order.payment_reference == reference).first()
-        
-        if not order:
-            return
-        
-        # FIXED: Removed commas that were creating tuples
-        order.status = "processing"
-        order.payment_status = "paid"
-        order.paystack_transaction_id = data.get("id")
-        order.paid_at = datetime.now()
-        
-        update_product_stock_on_order(db, order.id)
-        
-        transaction_date = parse_datetime(data.get("transaction_date"))
-        paid_at = parse_datetime(data.get("paid_at"))
-        
-        transaction = Transaction(
-            order_id=order.id,
-            reference=reference,
-            amount=data.get("amount", 0) / 100,
-            currency=data.get("currency", "NGN"),
-            status="success",
-            gateway_response=data.get("gateway_response"),
-            channel=data.get("channel"),
-            customer_email=data.get("customer", {}).get("email"),
-            customer_id=data.get("customer", {}).get("id"),
-            ip_address=data.get("ip_address"),
-            authorization_code=data.get("authorization", {}).get("authorization_code"),
-            card_last4=data.get("authorization", {}).get("last4"),
-            card_type=data.get("authorization", {}).get("card_type"),
-            bank=data.get("authorization", {}).get("bank"),
-            transaction_date=transaction_date,
-            paid_at=paid_at
-        )
-        
-        db.add(transaction)
+        apply_successful_payment(db, order, data)
+        save_transaction(db, order, reference, data, "success")
         db.commit()
-        
-        try:
-            shipping_address = db.query(Address).filter(Address.id == order.shipping_address_id).first()
-            shipping_address_str = ""
-            if shipping_address:
-                shipping_address_str = f"{shipping_address.street}, {shipping_address.city}, {shipping_address.state}, {shipping_address.country} - {shipping_address.postal_code}"
-            
-            order_items = []
-            if order.items:
-                for item in order.items:
-                    order_items.append({
-                        'name': item.product_name,
-                        'quantity': item.quantity,
-                        'price': item.price
-                    })
-            
-            order_data = {
-                'order_number': order.order_number,
-                'order_date': order.created_at.strftime('%B %d, %Y') if order.created_at else datetime.now().strftime('%B %d, %Y'),
-                'status': order.status,
-                'payment_status': order.payment_status,
-                'shipping_address': shipping_address_str,
-                'items': order_items,
-                'total_amount': order.total_amount
-            }
-            
-            email_service.send_order_confirmation(
-                to_email=order.customer_email,
-                order_data=order_data,
-                customer_name=order.customer_name or "Customer"
-            )
-                
-        except Exception:
-            pass
-        
     except Exception:
         db.rollback()
+        raise
+    outbox_workers.notify()
 
+@webhook_inbox.handler("charge.failed")
 def handle_failed_payment(data: Dict[str, Any], db: Session):
+    """charge.failed from the inbox"""
+    reference = data.get("reference")
+    
+    order = db.query(Order).filter(Order.payment_reference == reference).first()
+    if not order:
+        return
+    
     try:
-        reference = data.get("reference")
-        
-        order = db.query(Order).filter(Order.payment_reference == reference).first()
-        if not order:
-            return
-        
-        order.payment_status = "failed"
-        
-        transaction_date = parse_datetime(data.get("transaction_date"))
-        
-        transaction = Transaction(
-            order_id=order.id,
-            reference=reference,
-            amount=data.get("amount", 0) / 100,
-            currency=data.get("currency", "NGN"),
-            status="failed",
-            gateway_response=data.get("gateway_response"),
-            channel=data.get("channel"),
-            customer_email=data.get("customer", {}).get("email"),
-            transaction_date=transaction_date
-        )
-        
-        db.add(transaction)
+        if order.payment_status != "paid":
+            order.payment_status = "failed"
+        release_holds(db, order.id)
+        save_transaction(db, order, reference, data, "failed")
         db.commit()
-        
     except Exception:
         db.rollback()
+        raise
+
+@outbox.handler("order_confirmation_email")
+def send_order_confirmation_email(db: Session, payload: Dict[str, Any]):
+    order = db.query(Order).options(
+        joinedload(Order.items)
+    ).filter(Order.id == payload["order_id"]).first()
+    if not order or not order.customer_email:
+        return
+    
+    shipping_address = db.query(Address).filter(Address.id == order.shipping_address_id).first()
+    shipping_address_str = ""
+    if shipping_address:
+        shipping_address_str = f"{shipping_address.street}, {shipping_address.city}, {shipping_address.state}, {shipping_address.country} - {shipping_address.postal_code}"
+    
+    order_data = {
+        'order_number': order.order_number,
+        'order_date': order.created_at.strftime('%B %d, %Y') if order.created_at else datetime.now().strftime('%B %d, %Y'),
+        'status': order.status,
+        'payment_status': order.payment_status,
+        'shipping_address': shipping_address_str,
+        'items': [
+            {'name': item.product_name, 'quantity': item.quantity, 'price': item.price}
+            for item in order.items
+        ],
+        'total_amount': order.total_amount
+    }
+    
+    if not email_service.send_order_confirmation(
+        to_email=order.customer_email,
+        order_data=order_data,
+        customer_name=order.customer_name or "Customer"
+    ):
+        raise RuntimeError(f"Confirmation email for order {order.order_number} was not sent")
 
 @router.get("/order/{order_number}")
 async def get_order(
@@ -1077,47 +1105,26 @@ async def get_order(
 @router.get("/user/{user_id}/orders")
 async def get_user_orders(
     user_id: int,
+    response: Response,
     skip: int = 0,
-    limit: int = 20,
+    limit: int = Query(20, ge=1, le=100),
+    before: Optional[int] = Query(None, description="Order id from X-Next-Before, for the next page"),
+    include_archived: bool = Query(False),
     db: Session = Depends(get_db)
 ):
     try:
-        user = db.query(User).filter(User.id == user_id).first()
+        user = db.query(User.id).filter(User.id == user_id).first()
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="User not found"
             )
         
-        orders = db.query(Order).filter(
-            Order.user_id == user_id
-        ).order_by(Order.created_at.desc()).offset(skip).limit(limit).all()
+        page = order_history(db, user_id, limit=limit, before=before, skip=skip, include_archived=include_archived)
+        if page["next_before"] is not None:
+            response.headers["X-Next-Before"] = str(page["next_before"])
         
-        result = []
-        for order in orders:
-            items_count = db.query(OrderItem).filter(OrderItem.order_id == order.id).count()
-            
-            shipping_address = db.query(Address).filter(Address.id == order.shipping_address_id).first()
-            shipping_info = "Not available"
-            if shipping_address:
-                shipping_info = f"{shipping_address.city}, {shipping_address.state}"
-            
-            result.append({
-                "id": order.id,
-                "order_number": order.order_number,
-                "customer_name": order.customer_name,
-                "customer_email": order.customer_email,
-                "total_amount": order.total_amount,
-                "currency": order.currency,
-                "status": order.status,
-                "payment_status": order.payment_status,
-                "shipping_info": shipping_info,
-                "created_at": order.created_at.isoformat() if order.created_at else None,
-                "paid_at": order.paid_at.isoformat() if order.paid_at else None,
-                "items_count": items_count
-            })
-        
-        return result
+        return page["orders"]
     
     except HTTPException:
         raise
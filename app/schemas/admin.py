@@ -1,5 +1,5 @@
 # /schemas/admin.py
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 
 class OrderItemPreview(BaseModel):
@@ -66,4 +66,8 @@ class DashboardStats(BaseModel):
 
 class PaginatedOrders(BaseModel):
     orders: List[EnhancedOrder]
-    pagination: Dict[str, Any]
\ No newline at end of file
+    pagination: Dict[str, Any]
+
+class BulkOrderStatusUpdate(BaseModel):
+    order_ids: List[int] = Field(..., min_length=1, max_length=500)
+    status: str
@@ -1,7 +1,8 @@
 # app/schemas/schemas.py - CORRECTED VERSION
-from typing import Optional
+from typing import List, Literal, Optional
 from pydantic import BaseModel, EmailStr, Field, validator
 from datetime import datetime
+from enum import Enum
 
 class UserCreate(BaseModel):
     email: EmailStr
@@ -41,4 +42,102 @@ class Token(BaseModel):
 
 class AdminLoginRequest(BaseModel):
     email: EmailStr
-    password: str
\ No newline at end of file
+    password: str
+
+class CartItemBase(BaseModel):
+    product_id: int
+    quantity: int = Field(1, ge=1)
+
+class CartItemResponse(BaseModel):
+    id: int
+    product_id: int
+    quantity: int
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class CartOperation(BaseModel):
+    op: Literal["add", "set", "remove"]
+    product_id: int
+    quantity: int = Field(1, ge=0)  # "set" to 0 removes the line
+
+class CartBatchRequest(BaseModel):
+    operations: List[CartOperation] = Field(..., min_length=1, max_length=100)
+
+class CartMergeRequest(BaseModel):
+    items: List[CartItemBase] = Field(default_factory=list, max_length=100)  # Client-side cart, if any
+
+# ==================== ORDERS (app/api/orders.py) ====================
+class OrderStatus(str, Enum):
+    PENDING = "pending"
+    PROCESSING = "processing"
+    SHIPPED = "shipped"
+    DELIVERED = "delivered"
+    CANCELLED = "cancelled"
+
+class PaymentStatus(str, Enum):
+    PENDING = "pending"
+    PAID = "paid"
+    FAILED = "failed"
+    REFUNDED = "refunded"
+
+class PaymentMethod(str, Enum):
+    PAYSTACK = "paystack"
+    BANK_TRANSFER = "bank_transfer"
+    CASH_ON_DELIVERY = "cash_on_delivery"
+
+class CartItem(BaseModel):
+    product_id: int
+    quantity: int = Field(..., ge=1)
+
+class OrderCreate(BaseModel):
+    items: List[CartItem] = Field(..., min_length=1)
+    delivery_address_id: int
+    payment_method: Optional[PaymentMethod] = None
+
+class GuestShippingAddress(BaseModel):
+    full_name: str
+    email: EmailStr
+    phone: Optional[str] = None
+    street: str
+    city: str
+    state: str
+    country: str = "Nigeria"
+    postal_code: Optional[str] = None
+
+class GuestOrderItem(BaseModel):
+    product_id: int
+    quantity: int = Field(..., ge=1)
+    price: float = Field(..., ge=0)
+
+class GuestOrderCreate(BaseModel):
+    items: List[GuestOrderItem] = Field(..., min_length=1)
+    shipping_address: GuestShippingAddress
+    total_amount: float = Field(..., gt=0)
+    payment_method: PaymentMethod = PaymentMethod.PAYSTACK
+
+class OrderItemResponse(BaseModel):
+    id: int
+    product_id: Optional[int]
+    product_name: Optional[str] = None
+    quantity: int
+    price: float
+
+    class Config:
+        from_attributes = True
+
+class OrderResponse(BaseModel):
+    id: int
+    order_number: str
+    status: str
+    payment_status: str
+    payment_method: Optional[str] = None
+    total_amount: float
+    currency: Optional[str] = None
+    shipping_address_id: Optional[int] = None
+    items: List[OrderItemResponse] = []
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
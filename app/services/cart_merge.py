@@ -0,0 +1,84 @@
+# app/services/cart_merge.py - FOLD A GUEST CART INTO A USER'S CART IN ONE STATEMENT
+import logging
+from typing import Dict, Optional
+
+from fastapi import Response
+from sqlalchemy import case, func, literal, literal_column, select
+from sqlalchemy.orm import Session
+
+from app.models.models import CartItem, Product
+from app.services import guest_cart
+from app.services.inventory import on_hand_expression
+
+logger = logging.getLogger(__name__)
+
+def _dialect_upsert(db: Session):
+    """(insert construct, two-argument minimum) for the session's database"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert, func.least
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        return insert, func.min
+    raise RuntimeError(f"Cart merge needs INSERT ... ON CONFLICT, not supported on {dialect}")
+
+def merge_into_user_cart(db: Session, user_id: int, items: Dict[int, int]) -> int:
+    """Upsert {product_id: quantity} into the user's cart, clamped to stock.
+
+    One INSERT ... SELECT ... ON CONFLICT (user_id, product_id) DO UPDATE:
+    new lines take min(quantity, on-hand), existing lines add to their
+    quantity up to on-hand stock. Inactive and sold-out products are skipped.
+    Returns the number of lines written. The caller must commit.
+    """
+    items = {product_id: quantity for product_id, quantity in items.items() if quantity > 0}
+    if not items:
+        return 0
+
+    insert, least = _dialect_upsert(db)
+    requested = case(items, value=Product.id)
+    on_hand = on_hand_expression()
+
+    source = select(
+        literal(user_id),
+        Product.id,
+        least(requested, on_hand),
+    ).where(
+        Product.id.in_(list(items)),
+        Product.is_active == True,
+        on_hand > 0,
+    )
+
+    statement = insert(CartItem).from_select(["user_id", "product_id", "quantity"], source)
+    # Spelled as a literal so the subquery stays correlated to the proposed row
+    # instead of adding "excluded" to its own FROM list
+    stock = select(on_hand_expression()).where(
+        Product.id == literal_column("excluded.product_id")
+    ).scalar_subquery()
+    statement = statement.on_conflict_do_update(
+        index_elements=[CartItem.user_id, CartItem.product_id],
+        set_={"quantity": least(CartItem.quantity + statement.excluded.quantity, stock)},
+    )
+
+    return db.execute(statement).rowcount
+
+def merge_guest_cart_cookie(db: Session, user_id: int, cookie: Optional[str], response: Response) -> int:
+    """Move the signed-cookie guest cart into the user's cart and drop it.
+
+    Used on login, so a failed merge is logged and never blocks signing in.
+    """
+    cart_id = guest_cart.unsign_cart_id(cookie)
+    if not cart_id:
+        return 0
+
+    try:
+        merged = merge_into_user_cart(db, user_id, guest_cart.load_items(cart_id))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Could not merge guest cart into user {user_id}: {e}")
+        return 0
+
+    guest_cart.delete_cart(cart_id)
+    guest_cart.clear_cart_cookie(response)
+    return merged
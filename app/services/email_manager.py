@@ -323,6 +323,54 @@ class EmailManager:
         subject = f"Order Confirmation #{order_data.get('order_number', '')} - BLOOM&G"
         
         return self.send_email(to_email, subject, html_content)
+    
+    def send_order_status_update(
+        self,
+        to_email: str,
+        order_number: str,
+        customer_name: Optional[str],
+        status: str
+    ) -> bool:
+        """Tell the customer their order was shipped, delivered or cancelled"""
+        html_template = """
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="utf-8">
+            <meta name="viewport" content="width=device-width, initial-scale=1.0">
+            <title>Order Update - BLOOM&G</title>
+        </head>
+        <body style="font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; line-height: 1.6; color: #333; background-color: #f5f5f5;">
+            <div style="max-width: 600px; margin: 0 auto; background: white; border-radius: 10px; padding: 30px;">
+                <h2>Hello {{ customer_name }},</h2>
+                <p>{{ message }}</p>
+                <p><strong>Order #{{ order_number }}</strong></p>
+                {% if status != 'cancelled' %}
+                <p><a href="{{ track_order_url }}">Track Your Order</a></p>
+                {% endif %}
+                <p>If you have any questions, please contact our support team at support@bloomg.com</p>
+                <p>Best regards,<br>The BLOOM&G Team</p>
+            </div>
+        </body>
+        </html>
+        """
+        
+        messages = {
+            'shipped': 'Good news! Your order is on its way.',
+            'delivered': 'Your order has been delivered. We hope you love it.',
+            'cancelled': 'Your order has been cancelled. Any payment taken will be refunded.',
+        }
+        
+        html_content = Template(html_template).render(
+            customer_name=customer_name or 'there',
+            order_number=order_number,
+            status=status,
+            message=messages.get(status, f'Your order is now {status}.'),
+            track_order_url=f"{os.getenv('FRONTEND_URL', 'https://ecommerce-frontend-ic8e.vercel.app')}/orders/{order_number}"
+        )
+        subject = f"Order #{order_number} {status.capitalize()} - BLOOM&G"
+        
+        return self.send_email(to_email, subject, html_content)
 
 # Create instance
 email_manager = EmailManager()
\ No newline at end of file
@@ -0,0 +1,65 @@
+# app/services/guest_cart.py - ANONYMOUS CARTS IN THE KV STORE UNDER A SIGNED COOKIE
+import hashlib
+import hmac
+import secrets
+from typing import Dict, Optional
+
+from fastapi import Response
+
+from app.core.config import settings
+from app.services.kv_store import kv_store
+
+KEY_PREFIX = "guest_cart:"
+
+def _signature(cart_id: str) -> str:
+    return hmac.new(settings.SECRET_KEY.encode(), cart_id.encode(), hashlib.sha256).hexdigest()[:32]
+
+def sign_cart_id(cart_id: str) -> str:
+    return f"{cart_id}.{_signature(cart_id)}"
+
+def unsign_cart_id(cookie: Optional[str]) -> Optional[str]:
+    """Cart id from a cookie value, None if missing or tampered with"""
+    if not cookie or "." not in cookie:
+        return None
+    cart_id, signature = cookie.rsplit(".", 1)
+    if not hmac.compare_digest(signature, _signature(cart_id)):
+        return None
+    return cart_id
+
+def new_cart_id() -> str:
+    return secrets.token_urlsafe(18)
+
+def ttl_seconds() -> int:
+    return settings.GUEST_CART_TTL_HOURS * 3600
+
+def load_items(cart_id: Optional[str]) -> Dict[int, int]:
+    """{product_id: quantity} in insertion order, sliding the TTL"""
+    if not cart_id:
+        return {}
+    data = kv_store.get(KEY_PREFIX + cart_id, refresh_ttl=ttl_seconds()) or {}
+    # JSON object keys come back as strings
+    return {int(product_id): quantity for product_id, quantity in data.get("items", {}).items()}
+
+def save_items(cart_id: str, items: Dict[int, int]) -> None:
+    if items:
+        kv_store.set(KEY_PREFIX + cart_id, {"items": items}, ttl_seconds())
+    else:
+        kv_store.delete(KEY_PREFIX + cart_id)
+
+def delete_cart(cart_id: Optional[str]) -> None:
+    if cart_id:
+        kv_store.delete(KEY_PREFIX + cart_id)
+
+def set_cart_cookie(response: Response, cart_id: str) -> None:
+    # The storefront is on another site, so a secure cookie must be SameSite=None
+    response.set_cookie(
+        settings.GUEST_CART_COOKIE,
+        sign_cart_id(cart_id),
+        max_age=ttl_seconds(),
+        httponly=True,
+        secure=settings.COOKIE_SECURE,
+        samesite="none" if settings.COOKIE_SECURE else "lax",
+    )
+
+def clear_cart_cookie(response: Response) -> None:
+    response.delete_cookie(settings.GUEST_CART_COOKIE)
@@ -0,0 +1,107 @@
+# app/services/idempotency.py - IDEMPOTENCY-KEY REPLAY FOR ORDER AND PAYMENT CREATION
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi import Header, HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.services.kv_store import kv_store
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "idempotency:"
+REPLAY_HEADER = "Idempotent-Replayed"
+
+def idempotency_key(key: Optional[str] = Header(None, alias="Idempotency-Key")) -> Optional[str]:
+    """Optional Idempotency-Key header, any opaque client string up to 255 characters"""
+    if key is None:
+        return None
+    key = key.strip()
+    if not key or len(key) > 255:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid Idempotency-Key header")
+    return key
+
+def _store_key(scope: str, key: str) -> str:
+    # Hashed so client-chosen keys cannot collide with other KV namespaces
+    return KEY_PREFIX + scope + ":" + hashlib.sha256(key.encode()).hexdigest()
+
+def _fingerprint(payload: Any) -> str:
+    return hashlib.sha256(
+        json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":")).encode()
+    ).hexdigest()
+
+def _replay(record: dict, fingerprint: str) -> JSONResponse:
+    if record["fingerprint"] != fingerprint:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key was already used with a different request body"
+        )
+    return JSONResponse(content=record["body"], status_code=record["status_code"], headers={REPLAY_HEADER: "true"})
+
+async def run_idempotent(
+    scope: str,
+    key: Optional[str],
+    payload: Any,
+    handler: Callable[[], Awaitable[Any]]
+) -> Any:
+    """Run handler once per (scope, key), replaying its stored response after that.
+
+    The first request claims the key with a set-if-absent "pending" record
+    and runs handler. Its JSON result is stored for IDEMPOTENCY_TTL_HOURS.
+    Repeats with the same key get that response back without touching the
+    database or Paystack. Repeats that arrive while the first request is
+    still running wait for it instead of racing it. A failed request
+    (any exception) releases the key so the client can retry. Without a
+    key the handler simply runs.
+    """
+    if not key:
+        return await handler()
+
+    store_key = _store_key(scope, key)
+    fingerprint = _fingerprint(payload)
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    delay = 0.05
+
+    # kv_store calls block (a Redis round trip), so they run in the threadpool
+    while not await run_in_threadpool(
+        kv_store.add, store_key, {"state": "pending", "fingerprint": fingerprint}, settings.IDEMPOTENCY_LOCK_SECONDS
+    ):
+        record = await run_in_threadpool(kv_store.get, store_key)
+        if record is None:
+            # The first request failed and released the key, claim it
+            continue
+        if record["state"] == "done":
+            return _replay(record, fingerprint)
+        if time.monotonic() >= deadline:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A request with this Idempotency-Key is still in progress"
+            )
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.5)
+
+    try:
+        result = await handler()
+    except BaseException:
+        await run_in_threadpool(kv_store.delete, store_key)
+        raise
+
+    try:
+        await run_in_threadpool(kv_store.set, store_key, {
+            "state": "done",
+            "fingerprint": fingerprint,
+            "status_code": status.HTTP_200_OK,
+            "body": jsonable_encoder(result),
+        }, settings.IDEMPOTENCY_TTL_HOURS * 3600)
+    except Exception as e:
+        # The work is done, so the response still goes out. A retry after
+        # this point would run it again once the pending record expires
+        logger.warning(f"Could not store idempotent response for {scope}: {e}")
+    return result
@@ -0,0 +1,100 @@
+# app/services/image_metadata.py - DIMENSIONS, DOMINANT COLOR & LQIP AT UPLOAD TIME
+import base64
+import io
+import logging
+from typing import Any, BinaryIO, Dict, List
+
+from sqlalchemy.orm import Session
+
+from app.models.models import ProductImage
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_SIZE = 16  # Longest edge of the inline preview in pixels
+PLACEHOLDER_QUALITY = 40
+EXIF_ORIENTATION = 0x0112
+
+EMPTY_METADATA = {
+    "width": None,
+    "height": None,
+    "dominant_color": None,
+    "placeholder": None,
+}
+
+def extract_image_metadata(fileobj: BinaryIO) -> Dict[str, Any]:
+    """Width, height, dominant color and a tiny base64 JPEG placeholder.
+
+    Returns empty values for files Pillow cannot decode (SVG, icons, corrupt
+    uploads) so the upload itself never fails because of metadata.
+    """
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        logger.warning("Pillow not installed, skipping image metadata")
+        return dict(EMPTY_METADATA)
+
+    try:
+        fileobj.seek(0)
+        with Image.open(fileobj) as img:
+            # Report dimensions the browser will actually lay out
+            width, height = img.size
+            if img.getexif().get(EXIF_ORIENTATION) in (5, 6, 7, 8):
+                width, height = height, width
+
+            # JPEGs decode at reduced scale, we only need a thumbnail
+            img.draft("RGB", (PLACEHOLDER_SIZE * 8, PLACEHOLDER_SIZE * 8))
+            img = ImageOps.exif_transpose(img)
+            if img.mode in ("RGBA", "LA", "P"):
+                background = Image.new("RGB", img.size, (255, 255, 255))
+                background.paste(img.convert("RGBA"), mask=img.convert("RGBA").split()[-1])
+                img = background
+            else:
+                img = img.convert("RGB")
+
+            img.thumbnail((64, 64))
+            dominant_color = _dominant_color(img)
+
+            img.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+            buffer = io.BytesIO()
+            img.save(buffer, format="JPEG", quality=PLACEHOLDER_QUALITY, optimize=True)
+            placeholder = "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+    except Exception as e:
+        logger.info(f"Could not read image metadata: {e}")
+        return dict(EMPTY_METADATA)
+    finally:
+        fileobj.seek(0)
+
+    return {
+        "width": width,
+        "height": height,
+        "dominant_color": dominant_color,
+        "placeholder": placeholder,
+    }
+
+def _dominant_color(img) -> str:
+    """Most common color of a 5-color quantized thumbnail as #rrggbb"""
+    quantized = img.quantize(colors=5)
+    palette = quantized.getpalette()
+    count, index = max(quantized.getcolors())
+    r, g, b = palette[index * 3:index * 3 + 3]
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+def known_image_metadata(db: Session, blob_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """Metadata already computed for these blobs, so duplicates skip decoding"""
+    if not blob_ids:
+        return {}
+
+    images = db.query(ProductImage).filter(
+        ProductImage.blob_id.in_(blob_ids),
+        ProductImage.width.isnot(None)
+    ).all()
+
+    return {
+        image.blob_id: {
+            "width": image.width,
+            "height": image.height,
+            "dominant_color": image.dominant_color,
+            "placeholder": image.placeholder,
+        }
+        for image in images
+    }
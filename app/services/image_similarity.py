@@ -0,0 +1,122 @@
+# app/services/image_similarity.py - PERCEPTUAL HASHES & NEAR-DUPLICATE LOOKUP
+import logging
+from typing import Any, BinaryIO, Dict, List, Optional
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import ImageHashBand, ProductImage, UploadBlob
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+BAND_COUNT = 8
+BAND_BITS = HASH_BITS // BAND_COUNT
+
+# Two hashes within distance d differ in at most d bands, so with 8 bands any
+# match up to distance 7 shares at least one band exactly (pigeonhole)
+MAX_GUARANTEED_DISTANCE = BAND_COUNT - 1
+
+def perceptual_hash(fileobj: BinaryIO) -> Optional[str]:
+    """64-bit difference hash (dHash) as 16 hex chars, None if not decodable"""
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return None
+
+    try:
+        fileobj.seek(0)
+        with Image.open(fileobj) as img:
+            img.draft("L", (64, 64))
+            img = ImageOps.exif_transpose(img).convert("L").resize((9, 8), Image.Resampling.LANCZOS)
+            pixels = list(img.getdata())
+    except Exception as e:
+        logger.info(f"Could not compute perceptual hash: {e}")
+        return None
+    finally:
+        fileobj.seek(0)
+
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+
+    return f"{value:016x}"
+
+def hamming_distance(hash_a: str, hash_b: str) -> int:
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count("1")
+
+def hash_bands(phash: str) -> List[int]:
+    value = int(phash, 16)
+    mask = (1 << BAND_BITS) - 1
+    return [(value >> (band * BAND_BITS)) & mask for band in range(BAND_COUNT)]
+
+def max_distance() -> int:
+    return max(0, min(settings.PHASH_MAX_DISTANCE, MAX_GUARANTEED_DISTANCE))
+
+def register_hash(db: Session, blob: UploadBlob, phash: Optional[str]) -> None:
+    """Store the hash on the blob and in the band index"""
+    if not phash or blob.phash:
+        return
+    blob.phash = phash
+    db.add_all([
+        ImageHashBand(blob_id=blob.id, band=band, value=value)
+        for band, value in enumerate(hash_bands(phash))
+    ])
+
+def find_near_duplicates(
+    db: Session,
+    phashes: List[str],
+    distance: Optional[int] = None
+) -> Dict[str, List[Dict[str, Any]]]:
+    """Stored blobs within the Hamming distance of each hash.
+
+    Candidates come from one indexed (band, value) query; only those are
+    compared bit by bit.
+    """
+    distance = max_distance() if distance is None else distance
+    phashes = [phash for phash in set(phashes) if phash]
+    if not phashes:
+        return {}
+
+    conditions = {
+        (band, value)
+        for phash in phashes
+        for band, value in enumerate(hash_bands(phash))
+    }
+    candidate_ids = db.query(ImageHashBand.blob_id).filter(
+        or_(*[
+            and_(ImageHashBand.band == band, ImageHashBand.value == value)
+            for band, value in conditions
+        ])
+    ).distinct()
+    candidates = db.query(UploadBlob).filter(UploadBlob.id.in_(candidate_ids)).all()
+
+    matches = {phash: [] for phash in phashes}
+    matched_blob_ids = set()
+    for phash in phashes:
+        for blob in candidates:
+            blob_distance = hamming_distance(phash, blob.phash)
+            if blob_distance <= distance:
+                matches[phash].append({
+                    "blob_id": blob.id,
+                    "filename": blob.filename,
+                    "distance": blob_distance,
+                })
+                matched_blob_ids.add(blob.id)
+
+    if matched_blob_ids:
+        product_ids = {}
+        for blob_id, product_id in db.query(ProductImage.blob_id, ProductImage.product_id).filter(
+            ProductImage.blob_id.in_(matched_blob_ids)
+        ).distinct():
+            product_ids.setdefault(blob_id, []).append(product_id)
+        for phash_matches in matches.values():
+            for match in phash_matches:
+                match["product_ids"] = product_ids.get(match["blob_id"], [])
+            phash_matches.sort(key=lambda match: match["distance"])
+
+    return {phash: found for phash, found in matches.items() if found}
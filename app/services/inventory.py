@@ -0,0 +1,434 @@
+# app/services/inventory.py - STOCK LEVELS, MOVEMENT LEDGER, ATOMIC DECREMENTS AND CHECKOUT HOLDS
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import bindparam, case, delete, func, insert, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.models import InventoryMovement, Product, StockReservation
+
+logger = logging.getLogger(__name__)
+
+MOVEMENT_KINDS = ("sale", "restock", "cancel", "adjust", "sync")
+
+class InsufficientStock(Exception):
+    """Raised with one entry per line that cannot be covered"""
+
+    def __init__(self, shortfalls: List[Dict[str, Any]]):
+        self.shortfalls = shortfalls
+        super().__init__(", ".join(
+            f"{line['name'] or line['product_id']}: {line['available']} available, {line['requested']} requested"
+            for line in shortfalls
+        ))
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+def _stock_lines(quantities: Dict[int, int]) -> List[Dict[str, int]]:
+    # Product id order, so concurrent writers take row locks in the same order
+    return [
+        {"line_id": product_id, "line_quantity": quantity}
+        for product_id, quantity in sorted(quantities.items()) if quantity > 0
+    ]
+
+_products = Product.__table__
+_movements = InventoryMovement.__table__
+_reservations = StockReservation.__table__
+
+_increment = (
+    update(_products)
+    .where(_products.c.id == bindparam("line_id"))
+    .values(stock=func.coalesce(_products.c.stock, 0) + bindparam("line_quantity"))
+)
+
+def pending_quantity_expression():
+    """Movements not yet compacted into Product.stock, as a correlated scalar subquery"""
+    return (
+        select(func.coalesce(func.sum(_movements.c.quantity), 0))
+        .where(_movements.c.product_id == _products.c.id, _movements.c.applied == False)
+        .correlate(_products)
+        .scalar_subquery()
+    )
+
+def on_hand_expression():
+    """Compacted stock plus pending movements, correlated to Product"""
+    return func.coalesce(_products.c.stock, 0) + pending_quantity_expression()
+
+def record_movements(
+    db: Session,
+    kind: str,
+    deltas: Dict[int, int],
+    order_id: Optional[int] = None,
+    note: Optional[str] = None,
+    applied: bool = False
+) -> int:
+    """Append {product_id: signed delta} to the ledger in one executemany.
+
+    Pending rows (the default) are the cheap hot-path write: nothing touches
+    the product row, and compaction folds them into Product.stock later.
+    applied=True records a change the caller has already made to
+    Product.stock. The caller must commit.
+    """
+    return record_order_movements(db, kind, {order_id: deltas}, note=note, applied=applied)
+
+def record_order_movements(
+    db: Session,
+    kind: str,
+    order_deltas: Dict[Optional[int], Dict[int, int]],
+    note: Optional[str] = None,
+    applied: bool = False
+) -> int:
+    """record_movements for several orders ({order_id: {product_id: delta}}) in one executemany"""
+    if kind not in MOVEMENT_KINDS:
+        raise ValueError(f"Unknown inventory movement kind: {kind}")
+    rows = [
+        {"product_id": product_id, "kind": kind, "quantity": delta, "applied": applied, "order_id": order_id, "note": note}
+        for order_id, deltas in order_deltas.items()
+        for product_id, delta in sorted(deltas.items()) if delta
+    ]
+    if rows:
+        db.connection().execute(insert(_movements), rows)
+    return len(rows)
+
+def _shortfalls(db: Session, quantities: Dict[int, int], order_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    found = {
+        row.id: row
+        for row in db.execute(
+            select(_products.c.id, _products.c.name, available_stock_expression(order_id).label("available"))
+            .where(_products.c.id.in_(list(quantities)))
+        )
+    }
+    return [
+        {
+            "product_id": product_id,
+            "name": found[product_id].name if product_id in found else None,
+            "requested": quantity,
+            "available": max(0, found[product_id].available) if product_id in found else 0,
+        }
+        for product_id, quantity in quantities.items()
+    ]
+
+def _apply_decrement(db: Session, lines: List[Dict[str, int]], order_id: Optional[int] = None) -> set:
+    """Conditionally decrement every line, returning the product ids that were covered"""
+    connection = db.connection()
+    # Stock reserved by other checkouts is not for sale, so the guard is
+    # stock + pending - other orders' active holds >= q
+    available = available_stock_expression(order_id)
+    if connection.dialect.update_returning:
+        # UPDATE products SET stock = stock - CASE id ... END
+        # WHERE id IN (...) AND stock + pending - held >= CASE id ... END RETURNING id
+        quantity = case({line["line_id"]: line["line_quantity"] for line in lines}, value=_products.c.id)
+        statement = (
+            update(_products)
+            .where(_products.c.id.in_([line["line_id"] for line in lines]), available >= quantity)
+            .values(stock=func.coalesce(_products.c.stock, 0) - quantity)
+            .returning(_products.c.id)
+        )
+        return {row[0] for row in connection.execute(statement)}
+
+    statement = (
+        update(_products)
+        .where(_products.c.id == bindparam("line_id"), available >= bindparam("line_quantity"))
+        .values(stock=func.coalesce(_products.c.stock, 0) - bindparam("line_quantity"))
+    )
+    return {line["line_id"] for line in lines if connection.execute(statement, line).rowcount == 1}
+
+def decrement_stock(
+    db: Session,
+    quantities: Dict[int, int],
+    kind: str = "sale",
+    order_id: Optional[int] = None,
+    note: Optional[str] = None
+) -> None:
+    """Take {product_id: quantity} off on-hand stock in the caller's transaction.
+
+    Every line is a guarded "stock = stock - q WHERE stock + pending -
+    held >= q" in a single set-based UPDATE, where held counts other
+    orders' active checkout holds. So no line can go negative or eat into
+    reserved stock, and there is no read-modify-write race. The ids it returns tell which lines were
+    short: those put the covered lines back and raise InsufficientStock.
+    Successful decrements are logged as applied movements. The caller must
+    commit.
+    """
+    lines = _stock_lines(quantities)
+    if not lines:
+        return
+
+    covered = _apply_decrement(db, lines, order_id)
+    if len(covered) < len(lines):
+        short = {line["line_id"]: line["line_quantity"] for line in lines if line["line_id"] not in covered}
+        shortfalls = _shortfalls(db, short, order_id)
+        increment_stock(db, {line["line_id"]: line["line_quantity"] for line in lines if line["line_id"] in covered}, log=False)
+        raise InsufficientStock(shortfalls)
+
+    record_movements(db, kind, {line["line_id"]: -line["line_quantity"] for line in lines}, order_id=order_id, note=note, applied=True)
+
+def increment_stock(
+    db: Session,
+    quantities: Dict[int, int],
+    kind: str = "restock",
+    order_id: Optional[int] = None,
+    note: Optional[str] = None,
+    log: bool = True
+) -> int:
+    """Put {product_id: quantity} back on hand immediately in one executemany"""
+    lines = _stock_lines(quantities)
+    if not lines:
+        return 0
+    updated = db.connection().execute(_increment, lines).rowcount
+    if log:
+        record_movements(db, kind, {line["line_id"]: line["line_quantity"] for line in lines}, order_id=order_id, note=note, applied=True)
+    return updated
+
+def set_stock(db: Session, product_id: int, new_stock: int, kind: str = "adjust", note: Optional[str] = None) -> Optional[int]:
+    """Set a product's absolute on-hand count (stock takes, admin edits, syncs).
+
+    The product row is locked, its pending movements are claimed so
+    compaction cannot apply them on top of the new count, and the
+    difference is appended as an applied movement. Returns the previous
+    on-hand count, or None if the product does not exist. The caller must
+    commit.
+    """
+    stock = db.execute(
+        select(_products.c.stock).where(_products.c.id == product_id).with_for_update()
+    ).first()
+    if stock is None:
+        return None
+
+    pending = _claim_pending(db, [product_id]).get(product_id, 0)
+    previous = (stock[0] or 0) + pending
+    db.execute(update(_products).where(_products.c.id == product_id).values(stock=new_stock))
+    record_movements(db, kind, {product_id: new_stock - previous}, note=note, applied=True)
+    return previous
+
+def movement_history(
+    db: Session,
+    product_id: int,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = 200
+) -> List[InventoryMovement]:
+    """Newest-first ledger entries for one product, an index range scan"""
+    query = db.query(InventoryMovement).filter(InventoryMovement.product_id == product_id)
+    if since:
+        query = query.filter(InventoryMovement.created_at >= since)
+    if until:
+        query = query.filter(InventoryMovement.created_at < until)
+    return query.order_by(InventoryMovement.created_at.desc(), InventoryMovement.id.desc()).limit(limit).all()
+
+def held_quantity_expression(exclude_order_id: Optional[int] = None):
+    """Active holds on Product, as a scalar subquery for use in other queries.
+
+    exclude_order_id leaves out that order's own holds, for the order that
+    is taking the stock it reserved.
+    """
+    conditions = [_reservations.c.product_id == _products.c.id, _reservations.c.expires_at > _now()]
+    if exclude_order_id is not None:
+        conditions.append(or_(_reservations.c.order_id.is_(None), _reservations.c.order_id != exclude_order_id))
+    return (
+        select(func.coalesce(func.sum(_reservations.c.quantity), 0))
+        .where(*conditions)
+        .correlate(_products)
+        .scalar_subquery()
+    )
+
+def available_stock_expression(exclude_order_id: Optional[int] = None):
+    """On-hand stock (compacted plus pending) minus active holds, correlated to Product"""
+    return on_hand_expression() - held_quantity_expression(exclude_order_id)
+
+def available_stock(db: Session, product_ids: List[int]) -> Dict[int, int]:
+    """{product_id: on-hand minus active holds} in one read-only query"""
+    if not product_ids:
+        return {}
+    rows = db.query(Product.id, available_stock_expression()).filter(Product.id.in_(product_ids)).all()
+    return {product_id: available for product_id, available in rows}
+
+def place_holds(
+    db: Session,
+    order_id: int,
+    quantities: Dict[int, int],
+    minutes: Optional[int] = None
+) -> int:
+    """Reserve stock for an order's lines, all or nothing, returning the lines held.
+
+    Each line is one guarded "INSERT INTO stock_reservations SELECT ...
+    FROM products WHERE id = :id AND stock + pending - held >= :q", so the
+    check and the hold are a single statement. On SQLite, which has no row
+    locks, the database write lock keeps two checkouts from both passing
+    it. Where FOR UPDATE exists the product rows are locked in id order
+    first, so concurrent checkouts of a product queue. Products unknown to
+    this database are not held. If a line is short, the holds this call
+    added are removed and InsufficientStock is raised. The caller must
+    commit.
+    """
+    quantities = {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+    if not quantities:
+        return 0
+
+    connection = db.connection()
+    known = [
+        row[0] for row in connection.execute(
+            select(_products.c.id).where(_products.c.id.in_(list(quantities))).order_by(_products.c.id).with_for_update()
+        )
+    ]
+    lines = _stock_lines({product_id: quantities[product_id] for product_id in known})
+    if not lines:
+        return 0
+
+    statement = insert(_reservations).from_select(
+        ["product_id", "order_id", "quantity", "expires_at"],
+        select(
+            _products.c.id,
+            bindparam("order_id", type_=_reservations.c.order_id.type),
+            bindparam("line_quantity", type_=_reservations.c.quantity.type),
+            bindparam("expires_at", type_=_reservations.c.expires_at.type),
+        ).where(_products.c.id == bindparam("line_id"), available_stock_expression() >= bindparam("line_quantity"))
+    )
+    expires_at = _now() + timedelta(minutes=minutes or settings.STOCK_HOLD_MINUTES)
+    held = [
+        line["line_id"] for line in lines
+        if connection.execute(statement, {**line, "order_id": order_id, "expires_at": expires_at}).rowcount == 1
+    ]
+
+    if len(held) < len(lines):
+        connection.execute(
+            delete(_reservations).where(_reservations.c.order_id == order_id, _reservations.c.product_id.in_(held))
+        )
+        raise InsufficientStock(_shortfalls(db, {
+            line["line_id"]: line["line_quantity"] for line in lines if line["line_id"] not in held
+        }))
+    return len(held)
+
+def release_holds(db: Session, order_id: int) -> int:
+    """Drop an order's holds once it is paid (stock decremented) or failed"""
+    return db.query(StockReservation).filter(
+        StockReservation.order_id == order_id
+    ).delete(synchronize_session=False)
+
+def sweep_expired_holds(db: Session, batch_size: Optional[int] = None, max_batches: Optional[int] = None) -> Dict[str, Any]:
+    """Delete expired holds in bounded batches, committing after each.
+
+    Expired holds already stop counting against availability, so this only
+    keeps the table and its index small.
+    """
+    batch_size = batch_size or settings.STOCK_HOLD_SWEEP_BATCH_SIZE
+    max_batches = max_batches or settings.STOCK_HOLD_SWEEP_MAX_BATCHES
+    now = _now()
+    report = {"deleted": 0, "batches": 0, "complete": False}
+
+    while report["batches"] < max_batches:
+        expired_ids = [
+            row[0] for row in db.query(StockReservation.id).filter(
+                StockReservation.expires_at <= now
+            ).order_by(StockReservation.expires_at).limit(batch_size)
+        ]
+        if not expired_ids:
+            report["complete"] = True
+            break
+
+        db.query(StockReservation).filter(
+            StockReservation.id.in_(expired_ids)
+        ).delete(synchronize_session=False)
+        db.commit()
+        report["batches"] += 1
+        report["deleted"] += len(expired_ids)
+
+    return report
+
+def run_hold_sweep():
+    """Scheduler entry point"""
+    db = SessionLocal()
+    try:
+        report = sweep_expired_holds(db)
+        if report["deleted"]:
+            print(f"🧺 Stock holds: swept {report['deleted']} expired holds")
+        return report
+    finally:
+        db.close()
+
+def _claim_pending(db: Session, product_ids: Optional[List[int]] = None, movement_ids: Optional[List[int]] = None) -> Dict[int, int]:
+    """Mark pending movements applied, returning their {product_id: summed delta}.
+
+    The "applied = false" guard in the UPDATE means two compactors can never
+    both claim (and double-apply) the same row.
+    """
+    conditions = [_movements.c.applied == False]
+    if product_ids is not None:
+        conditions.append(_movements.c.product_id.in_(product_ids))
+    if movement_ids is not None:
+        conditions.append(_movements.c.id.in_(movement_ids))
+
+    connection = db.connection()
+    statement = update(_movements).where(*conditions).values(applied=True)
+    if connection.dialect.update_returning:
+        rows = connection.execute(statement.returning(_movements.c.product_id, _movements.c.quantity)).all()
+    else:
+        rows = connection.execute(
+            select(_movements.c.product_id, _movements.c.quantity).where(*conditions).with_for_update()
+        ).all()
+        connection.execute(statement)
+
+    totals: Dict[int, int] = {}
+    for product_id, quantity in rows:
+        totals[product_id] = totals.get(product_id, 0) + quantity
+    return totals
+
+def compact_movements(db: Session, batch_size: Optional[int] = None, max_batches: Optional[int] = None) -> Dict[str, Any]:
+    """Fold pending movements into Product.stock in bounded batches.
+
+    Each batch claims the oldest pending rows, applies their per-product
+    sums in one executemany and commits. A product driven below zero
+    (oversold sales) is set to zero with an applied "adjust" movement so
+    the ledger still sums to the stock on hand.
+    """
+    batch_size = batch_size or settings.INVENTORY_COMPACTION_BATCH_SIZE
+    max_batches = max_batches or settings.INVENTORY_COMPACTION_MAX_BATCHES
+    report = {"movements": 0, "products": 0, "batches": 0, "oversold": [], "complete": False}
+
+    while report["batches"] < max_batches:
+        pending_ids = [
+            row[0] for row in db.execute(
+                select(_movements.c.id).where(_movements.c.applied == False).order_by(_movements.c.id).limit(batch_size)
+            )
+        ]
+        if not pending_ids:
+            report["complete"] = True
+            break
+
+        totals = _claim_pending(db, movement_ids=pending_ids)
+        deltas = [{"line_id": product_id, "line_quantity": delta} for product_id, delta in sorted(totals.items()) if delta]
+        if deltas:
+            db.connection().execute(_increment, deltas)
+
+            negative = dict(db.execute(
+                select(_products.c.id, _products.c.stock).where(
+                    _products.c.id.in_([line["line_id"] for line in deltas]), _products.c.stock < 0
+                )
+            ).all())
+            if negative:
+                db.execute(update(_products).where(_products.c.id.in_(list(negative))).values(stock=0))
+                record_movements(db, "adjust", {product_id: -stock for product_id, stock in negative.items()}, note="Oversold, clamped to zero", applied=True)
+                report["oversold"].extend(sorted(negative))
+
+        db.commit()
+        report["batches"] += 1
+        report["movements"] += len(pending_ids)
+        report["products"] += len(totals)
+
+    if report["oversold"]:
+        logger.warning(f"Stock clamped to zero for oversold products: {report['oversold']}")
+    return report
+
+def run_movement_compaction():
+    """Scheduler entry point"""
+    db = SessionLocal()
+    try:
+        report = compact_movements(db)
+        if report["movements"]:
+            print(f"📦 Inventory: compacted {report['movements']} movements across {report['products']} products")
+        return report
+    finally:
+        db.close()
@@ -0,0 +1,55 @@
+# app/services/job_lease.py - DATABASE LEASES SO A JOB RUNS ON ONE WORKER AT A TIME
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import JobState
+
+# Unique per process, readable in job_states when debugging a stuck lease
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+def acquire_lease(db: Session, name: str, seconds: Optional[int] = None) -> bool:
+    """Take or extend the lease on job `name`, True if this worker now holds it.
+
+    One conditional UPDATE succeeds only when the lease is free, expired or
+    already ours, so two workers can never both get it. A worker that dies
+    holding it blocks the job for at most `seconds`. Commits.
+    """
+    now = datetime.now(timezone.utc)
+    if not db.query(JobState.name).filter(JobState.name == name).first():
+        try:
+            db.add(JobState(name=name))
+            db.commit()
+        except IntegrityError:
+            # Another worker created it first
+            db.rollback()
+
+    acquired = db.execute(
+        update(JobState)
+        .where(
+            JobState.name == name,
+            or_(JobState.lease_owner.is_(None), JobState.lease_expires_at < now, JobState.lease_owner == WORKER_ID),
+        )
+        .values(lease_owner=WORKER_ID, lease_expires_at=now + timedelta(seconds=seconds or settings.JOB_LEASE_SECONDS))
+        # SQLite hands back naive datetimes, which cannot be evaluated
+        # in Python against the aware `now` for rows already in the session
+        .execution_options(synchronize_session=False)
+    ).rowcount == 1
+    db.commit()
+    return acquired
+
+def release_lease(db: Session, name: str) -> None:
+    """Give the lease up early if this worker still holds it. Commits"""
+    db.execute(
+        update(JobState)
+        .where(JobState.name == name, JobState.lease_owner == WORKER_ID)
+        .values(lease_owner=None, lease_expires_at=None)
+    )
+    db.commit()
@@ -0,0 +1,123 @@
+# app/services/kv_store.py - PLUGGABLE KEY-VALUE STORE FOR SHORT-LIVED STATE
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from app.core.config import settings
+
+class KVStore:
+    """JSON values with a per-key TTL in seconds. Keys are flat strings"""
+
+    name = "base"
+
+    def get(self, key: str, refresh_ttl: Optional[int] = None) -> Optional[Any]:
+        """Value or None; refresh_ttl slides the expiry on every read"""
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        raise NotImplementedError
+
+    def add(self, key: str, value: Any, ttl: int) -> bool:
+        """Set only if the key is absent, True when this call created it"""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+
+class MemoryKVStore(KVStore):
+    """Per-process LRU with expiry. State is lost on restart and not shared between workers"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _live(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key: str, value: Any, ttl: int) -> None:
+        # Serialized so callers never share mutable state with the store
+        self._entries[key] = (time.monotonic() + ttl, json.dumps(value))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str, refresh_ttl: Optional[int] = None) -> Optional[Any]:
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                return None
+            if refresh_ttl:
+                self._entries[key] = (time.monotonic() + refresh_ttl, entry[1])
+            return json.loads(entry[1])
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        with self._lock:
+            self._store(key, value, ttl)
+
+    def add(self, key: str, value: Any, ttl: int) -> bool:
+        with self._lock:
+            if self._live(key) is not None:
+                return False
+            self._store(key, value, ttl)
+            return True
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class RedisKVStore(KVStore):
+    """Any Redis-protocol server (Redis, Valkey, KeyDB, Dragonfly)"""
+
+    name = "redis"
+
+    def __init__(self, url: str, key_prefix: str = ""):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("KV_STORE_BACKEND=redis requires redis (pip install redis)")
+
+        self.key_prefix = key_prefix
+        self.client = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+
+    def _key(self, key: str) -> str:
+        return f"{self.key_prefix}{key}"
+
+    def get(self, key: str, refresh_ttl: Optional[int] = None) -> Optional[Any]:
+        if refresh_ttl:
+            raw = self.client.getex(self._key(key), ex=refresh_ttl)
+        else:
+            raw = self.client.get(self._key(key))
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        self.client.set(self._key(key), json.dumps(value), ex=ttl)
+
+    def add(self, key: str, value: Any, ttl: int) -> bool:
+        return bool(self.client.set(self._key(key), json.dumps(value), ex=ttl, nx=True))
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self._key(key))
+
+
+def build_kv_store() -> KVStore:
+    if settings.KV_STORE_BACKEND == "redis":
+        if not settings.REDIS_URL:
+            raise RuntimeError("KV_STORE_BACKEND=redis requires REDIS_URL")
+        return RedisKVStore(settings.REDIS_URL, key_prefix=settings.KV_KEY_PREFIX)
+    return MemoryKVStore(max_entries=settings.KV_MEMORY_MAX_ENTRIES)
+
+kv_store = build_kv_store()
@@ -0,0 +1,146 @@
+# app/services/order_archive.py - MOVE CLOSED ORDERS TO THE ARCHIVE TABLES
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.models import (
+    Address, JobState, Order, OrderItem, StockReservation, Transaction,
+    archived_order_items, archived_orders, archived_transactions,
+)
+from app.services.job_lease import acquire_lease, release_lease
+
+logger = logging.getLogger(__name__)
+
+JOB_NAME = "order_archive"
+
+CLOSED_STATUSES = ("delivered", "cancelled")
+
+_orders = Order.__table__
+_order_items = OrderItem.__table__
+_transactions = Transaction.__table__
+
+# (hot table, archive table, column holding the order id)
+ARCHIVED = [
+    (_orders, archived_orders, _orders.c.id),
+    (_order_items, archived_order_items, _order_items.c.order_id),
+    (_transactions, archived_transactions, _transactions.c.order_id),
+]
+
+def _newest_order_ids():
+    """Orders owning the highest id in each hot table, which are never archived.
+
+    SQLite tables created before sqlite_autoincrement was declared hand out
+    max(id) + 1, so moving the top row out would let the next insert reuse
+    an id that already exists in the archive.
+    """
+    return [
+        func.coalesce(select(func.max(_orders.c.id)).scalar_subquery(), 0),
+        func.coalesce(select(_order_items.c.order_id).order_by(_order_items.c.id.desc()).limit(1).scalar_subquery(), 0),
+        func.coalesce(select(_transactions.c.order_id).order_by(_transactions.c.id.desc()).limit(1).scalar_subquery(), 0),
+    ]
+
+def _copy(db: Session, hot, archive, order_column, order_ids) -> int:
+    """INSERT INTO archive (...) SELECT ... FROM hot WHERE order_column IN (...)"""
+    columns = [column.name for column in hot.columns]
+    return db.execute(
+        insert(archive).from_select(columns, select(*hot.columns).where(order_column.in_(order_ids)))
+    ).rowcount
+
+def archive_closed_orders(
+    db: Session,
+    days: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    max_batches: Optional[int] = None
+) -> Dict[str, Any]:
+    """Move delivered/cancelled orders older than ORDER_ARCHIVE_AFTER_DAYS out of the hot tables.
+
+    Each batch copies the orders, their items and transactions into the
+    archived_* tables with INSERT ... SELECT, deletes them from the hot
+    tables and commits, so a batch is either fully moved or not at all.
+    The newest rows stay behind, see _newest_order_ids. Runs under the job
+    lease, renewed after every batch.
+    """
+    days = days or settings.ORDER_ARCHIVE_AFTER_DAYS
+    batch_size = batch_size or settings.ORDER_ARCHIVE_BATCH_SIZE
+    max_batches = max_batches or settings.ORDER_ARCHIVE_MAX_BATCHES
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+    report = {"orders": 0, "order_items": 0, "transactions": 0, "batches": 0, "complete": False, "leased": False}
+
+    if not acquire_lease(db, JOB_NAME):
+        return report
+    report["leased"] = True
+
+    try:
+        while report["batches"] < max_batches:
+            order_ids = [
+                row[0] for row in db.execute(
+                    select(_orders.c.id)
+                    .where(
+                        _orders.c.status.in_(CLOSED_STATUSES),
+                        _orders.c.created_at < cutoff,
+                        _orders.c.id.notin_(_newest_order_ids()),
+                    )
+                    .order_by(_orders.c.id)
+                    .limit(batch_size)
+                )
+            ]
+            if not order_ids:
+                report["complete"] = True
+                break
+
+            for hot, archive, order_column in ARCHIVED:
+                report[hot.name] += _copy(db, hot, archive, order_column, order_ids)
+
+            db.query(StockReservation).filter(StockReservation.order_id.in_(order_ids)).delete(synchronize_session=False)
+            for hot, archive, order_column in reversed(ARCHIVED):
+                db.execute(delete(hot).where(order_column.in_(order_ids)))
+            db.commit()
+
+            report["batches"] += 1
+            if not acquire_lease(db, JOB_NAME):
+                break
+
+        state = db.query(JobState).filter(JobState.name == JOB_NAME).first()
+        state.last_run_at = datetime.now(timezone.utc)
+        state.last_result = report
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        release_lease(db, JOB_NAME)
+
+    return report
+
+def load_archived_order(db: Session, order_id: int):
+    """(order, items, shipping address, transaction) for an archived order, or None.
+
+    Rows have the same attribute names as the ORM models they came from.
+    """
+    order = db.execute(select(archived_orders).where(archived_orders.c.id == order_id)).first()
+    if not order:
+        return None
+    items = db.execute(
+        select(archived_order_items).where(archived_order_items.c.order_id == order_id).order_by(archived_order_items.c.id)
+    ).all()
+    transaction = db.execute(
+        select(archived_transactions).where(archived_transactions.c.order_id == order_id).limit(1)
+    ).first()
+    address = db.query(Address).filter(Address.id == order.shipping_address_id).first() if order.shipping_address_id else None
+    return order, items, address, transaction
+
+def run_order_archive():
+    """Scheduler entry point"""
+    db = SessionLocal()
+    try:
+        report = archive_closed_orders(db)
+        if report["orders"]:
+            print(f"🗄️ Order archive: moved {report['orders']} orders, {report['order_items']} items, {report['transactions']} transactions")
+        return report
+    finally:
+        db.close()
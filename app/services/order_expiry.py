@@ -0,0 +1,106 @@
+# app/services/order_expiry.py - EXPIRE ABANDONED UNPAID ORDERS
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.models import JobState, Order, StockReservation
+from app.services.job_lease import acquire_lease, release_lease
+
+logger = logging.getLogger(__name__)
+
+JOB_NAME = "pending_order_expiry"
+
+_orders = Order.__table__
+
+def expire_stale_orders(
+    db: Session,
+    ttl_minutes: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    max_batches: Optional[int] = None
+) -> Dict[str, Any]:
+    """Cancel Paystack checkouts still unpaid PENDING_ORDER_TTL_MINUTES after creation.
+
+    Only orders from /api/payments/initialize are swept, recognised by their
+    payment_reference. They hold stock through reservations, so dropping
+    the holds is all the cleanup they need. /api/orders orders take stock
+    when they are created and may be paid by transfer or on delivery, so
+    they are left for an admin to cancel through transition_orders.
+
+    Runs only while this worker holds the job lease, renewed after every
+    batch. Each batch reads the oldest stale ids through the
+    (payment_status, created_at) index, flips them to cancelled/expired
+    with an UPDATE that re-checks payment_status (so a payment landing
+    meanwhile wins), drops their stock holds and commits. A payment that
+    arrives after expiry still marks the order paid.
+    """
+    ttl_minutes = ttl_minutes or settings.PENDING_ORDER_TTL_MINUTES
+    batch_size = batch_size or settings.PENDING_ORDER_SWEEP_BATCH_SIZE
+    max_batches = max_batches or settings.PENDING_ORDER_SWEEP_MAX_BATCHES
+    cutoff = datetime.now(timezone.utc) - timedelta(minutes=ttl_minutes)
+    report = {"expired": 0, "holds_released": 0, "batches": 0, "complete": False, "leased": False}
+
+    if not acquire_lease(db, JOB_NAME):
+        return report
+    report["leased"] = True
+
+    try:
+        while report["batches"] < max_batches:
+            stale_ids = [
+                row[0] for row in db.execute(
+                    select(_orders.c.id)
+                    .where(
+                        _orders.c.payment_status == "pending",
+                        _orders.c.created_at < cutoff,
+                        _orders.c.payment_reference.isnot(None),
+                    )
+                    .order_by(_orders.c.created_at)
+                    .limit(batch_size)
+                )
+            ]
+            if not stale_ids:
+                report["complete"] = True
+                break
+
+            expired = db.execute(
+                update(_orders)
+                .where(_orders.c.id.in_(stale_ids), _orders.c.payment_status == "pending")
+                .values(status="cancelled", payment_status="expired", updated_at=func.now())
+            ).rowcount
+            report["holds_released"] += db.query(StockReservation).filter(
+                StockReservation.order_id.in_(stale_ids)
+            ).delete(synchronize_session=False)
+            db.commit()
+
+            report["batches"] += 1
+            report["expired"] += expired
+            if not acquire_lease(db, JOB_NAME):
+                # Held past the lease, another worker has taken over
+                break
+
+        state = db.query(JobState).filter(JobState.name == JOB_NAME).first()
+        state.last_run_at = datetime.now(timezone.utc)
+        state.last_result = report
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        release_lease(db, JOB_NAME)
+
+    return report
+
+def run_order_expiry():
+    """Scheduler entry point"""
+    db = SessionLocal()
+    try:
+        report = expire_stale_orders(db)
+        if report["expired"]:
+            print(f"⌛ Pending orders: expired {report['expired']}, released {report['holds_released']} stock holds")
+        return report
+    finally:
+        db.close()
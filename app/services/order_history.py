@@ -0,0 +1,101 @@
+# app/services/order_history.py - ONE-QUERY, KEYSET-PAGINATED CUSTOMER ORDER HISTORY
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func, select, union_all
+from sqlalchemy.orm import Session
+
+from app.models.models import Address, Order, OrderItem, archived_order_items, archived_orders
+
+def _serialize(row) -> Dict[str, Any]:
+    return {
+        "id": row.id,
+        "order_number": row.order_number,
+        "customer_name": row.customer_name,
+        "customer_email": row.customer_email,
+        "total_amount": row.total_amount,
+        "currency": row.currency,
+        "status": row.status,
+        "payment_status": row.payment_status,
+        "shipping_info": f"{row.city}, {row.state}" if row.city or row.state else "Not available",
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+        "paid_at": row.paid_at.isoformat() if row.paid_at else None,
+        "items_count": row.items_count,
+    }
+
+def _history_query(orders, order_items, user_id: Optional[int], before: Optional[int], limit: int):
+    """Projection of one orders/order_items table pair, hot or archived"""
+    page = select(orders.c.id)
+    if user_id is not None:
+        page = page.where(orders.c.user_id == user_id)
+    if before is not None:
+        page = page.where(orders.c.id < before)
+    page = page.order_by(orders.c.id.desc()).limit(limit).subquery()
+
+    # Counted for the page's orders only, not the user's whole history
+    item_counts = (
+        select(order_items.c.order_id, func.count(order_items.c.id).label("items_count"))
+        .where(order_items.c.order_id.in_(select(page.c.id)))
+        .group_by(order_items.c.order_id)
+        .subquery()
+    )
+
+    return (
+        select(
+            orders.c.id,
+            orders.c.order_number,
+            orders.c.customer_name,
+            orders.c.customer_email,
+            orders.c.total_amount,
+            orders.c.currency,
+            orders.c.status,
+            orders.c.payment_status,
+            orders.c.created_at,
+            orders.c.paid_at,
+            Address.city,
+            Address.state,
+            func.coalesce(item_counts.c.items_count, 0).label("items_count"),
+        )
+        .join(page, page.c.id == orders.c.id)
+        .outerjoin(Address, Address.id == orders.c.shipping_address_id)
+        .outerjoin(item_counts, item_counts.c.order_id == orders.c.id)
+        .order_by(orders.c.id.desc())
+    )
+
+def order_history(
+    db: Session,
+    user_id: Optional[int],
+    limit: int = 20,
+    before: Optional[int] = None,
+    skip: int = 0,
+    include_archived: bool = False
+) -> Dict[str, Any]:
+    """A page of a user's orders, newest first, in a single query.
+
+    Only the listed columns are selected, the shipping address is joined
+    and item counts come from one grouped subquery over the page's orders.
+    Pages are keyed on order id (ids grow with created_at) through the
+    (user_id, id) index. Pass the returned next_before to get the next page.
+    skip is an offset for older clients and is ignored when before is set.
+    include_archived adds the archived_* tables with a UNION ALL, each side
+    limited on its own index before the merge. user_id None pages through
+    every customer's orders, for the admin list.
+    """
+    fetch = limit + 1 + (0 if before is not None else skip)
+    query = _history_query(Order.__table__, OrderItem.__table__, user_id, before, fetch)
+    if include_archived:
+        # Each side is wrapped so its ORDER BY/LIMIT is legal inside the compound SELECT
+        merged = union_all(
+            select(query.subquery()),
+            select(_history_query(archived_orders, archived_order_items, user_id, before, fetch).subquery()),
+        ).subquery()
+        query = select(merged).order_by(merged.c.id.desc())
+    query = query.limit(limit + 1)
+    if before is None and skip:
+        query = query.offset(skip)
+
+    rows = db.execute(query).all()
+    orders: List[Dict[str, Any]] = [_serialize(row) for row in rows[:limit]]
+    return {
+        "orders": orders,
+        "next_before": orders[-1]["id"] if len(rows) > limit else None,
+    }
@@ -0,0 +1,125 @@
+# app/services/order_status.py - ORDER STATUS STATE MACHINE AND BULK TRANSITIONS
+import logging
+from typing import Any, Dict, List
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from app.models.models import InventoryMovement, Order, StockReservation
+from app.services import outbox
+from app.services.email_manager import email_manager
+from app.services.inventory import record_order_movements
+
+logger = logging.getLogger(__name__)
+
+ORDER_STATUSES = ["pending", "processing", "shipped", "delivered", "cancelled"]
+
+# status -> statuses it may move to. delivered and cancelled are final
+ORDER_TRANSITIONS = {
+    "pending": {"processing", "cancelled"},
+    "processing": {"shipped", "cancelled"},
+    "shipped": {"delivered"},
+    "delivered": set(),
+    "cancelled": set(),
+}
+
+NOTIFY_STATUSES = {"shipped", "delivered", "cancelled"}
+
+_orders = Order.__table__
+
+def allowed_sources(target: str) -> List[str]:
+    """Statuses an order may be moved to target from"""
+    if target not in ORDER_TRANSITIONS:
+        raise ValueError(f"Invalid status. Must be one of: {', '.join(ORDER_STATUSES)}")
+    return sorted(source for source, targets in ORDER_TRANSITIONS.items() if target in targets)
+
+def transition_orders(db: Session, order_ids: List[int], target: str) -> Dict[str, Any]:
+    """Move every order that is allowed to reach target, in one guarded UPDATE.
+
+    "UPDATE orders SET status = target WHERE id IN (...) AND status IN
+    (allowed sources)" means a concurrent change can never be overwritten
+    with an illegal transition. Orders in any other state are reported as
+    skipped. Cancelling appends "cancel" movements for whatever stock the
+    orders took, for all of them at once, and drops their stock holds.
+    Customer emails are added to the outbox in the same transaction. The
+    caller must commit, then notify outbox_workers.
+    """
+    sources = allowed_sources(target)
+    order_ids = sorted(set(order_ids))
+
+    statement = (
+        update(_orders)
+        .where(_orders.c.id.in_(order_ids), _orders.c.status.in_(sources))
+        .values(status=target, updated_at=func.now())
+    )
+    returned = [_orders.c.id, _orders.c.order_number, _orders.c.customer_email, _orders.c.customer_name]
+    connection = db.connection()
+    if connection.dialect.update_returning:
+        updated = connection.execute(statement.returning(*returned)).all()
+    else:
+        updated = connection.execute(
+            select(*returned).where(_orders.c.id.in_(order_ids), _orders.c.status.in_(sources)).with_for_update()
+        ).all()
+        connection.execute(statement)
+
+    updated_ids = {row.id for row in updated}
+    remaining = [order_id for order_id in order_ids if order_id not in updated_ids]
+    current = dict(
+        connection.execute(select(_orders.c.id, _orders.c.status).where(_orders.c.id.in_(remaining))).all()
+    ) if remaining else {}
+
+    if target == "cancelled" and updated:
+        cancelled_ids = [row.id for row in updated]
+        record_order_movements(db, "cancel", _unreturned_sales(db, cancelled_ids), note="Order cancelled")
+        db.query(StockReservation).filter(
+            StockReservation.order_id.in_(cancelled_ids)
+        ).delete(synchronize_session=False)
+
+    emails_queued = 0
+    if target in NOTIFY_STATUSES:
+        for row in updated:
+            if row.customer_email:
+                outbox.enqueue(db, "order_status_email", {
+                    "email": row.customer_email,
+                    "order_number": row.order_number,
+                    "customer_name": row.customer_name,
+                    "status": target,
+                })
+                emails_queued += 1
+
+    return {
+        "status": target,
+        "updated": sorted(updated_ids),
+        "skipped": [
+            {"id": order_id, "status": current[order_id], "reason": f"Cannot move from {current[order_id]} to {target}"}
+            for order_id in remaining if order_id in current
+        ],
+        "not_found": [order_id for order_id in remaining if order_id not in current],
+        "emails_queued": emails_queued,
+    }
+
+def _unreturned_sales(db: Session, order_ids: List[int]) -> Dict[int, Dict[int, int]]:
+    """{order_id: {product_id: quantity}} sold and not yet put back, from the ledger.
+
+    Stock leaves at different points depending on how the order was placed
+    (at creation for /orders/create, on payment for Paystack checkout), so
+    the order's own "sale" and "cancel" movements decide what to restore,
+    not its payment_status.
+    """
+    quantities: Dict[int, Dict[int, int]] = {}
+    for order_id, product_id, net in db.query(
+        InventoryMovement.order_id, InventoryMovement.product_id, func.sum(InventoryMovement.quantity)
+    ).filter(
+        InventoryMovement.order_id.in_(order_ids),
+        InventoryMovement.kind.in_(("sale", "cancel"))
+    ).group_by(InventoryMovement.order_id, InventoryMovement.product_id):
+        if net and net < 0:
+            quantities.setdefault(order_id, {})[product_id] = -net
+    return quantities
+
+@outbox.handler("order_status_email")
+def send_status_email(db: Session, payload: Dict[str, Any]):
+    if not email_manager.send_order_status_update(
+        payload["email"], payload["order_number"], payload["customer_name"], payload["status"]
+    ):
+        raise RuntimeError(f"Status email for order {payload['order_number']} was not sent")
@@ -0,0 +1,157 @@
+# app/services/outbox.py - TRANSACTIONAL OUTBOX AND THE WORKER POOL THAT DRAINS IT
+import logging
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.workers import DrainWorkerPool
+from app.models.models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+_messages = OutboxMessage.__table__
+
+# kind -> handler(db, payload). Handlers run in their own session and
+# commit themselves; raising schedules a retry, so they must be safe to
+# run more than once
+HANDLERS: Dict[str, Callable[[Session, Dict[str, Any]], Any]] = {}
+
+def handler(kind: str):
+    """Register the function that performs one kind of outbox message"""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+def enqueue(db: Session, kind: str, payload: Dict[str, Any]) -> OutboxMessage:
+    """Add a message to the caller's transaction, so it exists only if that commits"""
+    message = OutboxMessage(kind=kind, payload=payload, status="pending", attempts=0, available_at=_now())
+    db.add(message)
+    return message
+
+def backoff_seconds(attempts: int) -> float:
+    """Exponential backoff with jitter, capped at OUTBOX_BACKOFF_MAX_SECONDS"""
+    delay = min(settings.OUTBOX_BACKOFF_SECONDS * (2 ** max(attempts - 1, 0)), settings.OUTBOX_BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+def claim_batch(db: Session, limit: Optional[int] = None) -> List[Any]:
+    """Lock up to `limit` due messages for this worker and return them.
+
+    Due means pending and past available_at, or processing by a worker
+    whose lock has lapsed. The UPDATE repeats those conditions, so when
+    two workers pick the same ids only one claims each row. Commits.
+    """
+    now = _now()
+    due = or_(
+        and_(_messages.c.status == "pending", _messages.c.available_at <= now),
+        and_(_messages.c.status == "processing", _messages.c.locked_until < now),
+    )
+    ids = [
+        row[0] for row in db.execute(
+            select(_messages.c.id).where(due).order_by(_messages.c.id).limit(limit or settings.OUTBOX_BATCH_SIZE)
+        )
+    ]
+    if not ids:
+        return []
+
+    statement = (
+        update(_messages)
+        .where(_messages.c.id.in_(ids), due)
+        .values(
+            status="processing",
+            attempts=_messages.c.attempts + 1,
+            locked_until=now + timedelta(seconds=settings.OUTBOX_LOCK_SECONDS),
+        )
+    )
+    connection = db.connection()
+    returned = [_messages.c.id, _messages.c.kind, _messages.c.payload, _messages.c.attempts]
+    if connection.dialect.update_returning:
+        claimed = connection.execute(statement.returning(*returned)).all()
+    else:
+        claimed = connection.execute(select(*returned).where(_messages.c.id.in_(ids), due).with_for_update()).all()
+        connection.execute(statement)
+    db.commit()
+    return sorted(claimed, key=lambda message: message.id)
+
+def _finish(db: Session, message, error: Optional[str] = None) -> None:
+    if error is None:
+        values = {"status": "done", "processed_at": _now(), "locked_until": None, "last_error": None}
+    elif message.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+        values = {"status": "dead", "locked_until": None, "last_error": error}
+        logger.error(f"Outbox message {message.id} ({message.kind}) gave up after {message.attempts} attempts: {error}")
+    else:
+        values = {
+            "status": "pending",
+            "locked_until": None,
+            "last_error": error,
+            "available_at": _now() + timedelta(seconds=backoff_seconds(message.attempts)),
+        }
+    db.execute(update(_messages).where(_messages.c.id == message.id).values(**values))
+    db.commit()
+
+def process_message(message) -> bool:
+    """Run one claimed message in a fresh session and record the outcome"""
+    db = SessionLocal()
+    try:
+        func = HANDLERS.get(message.kind)
+        if func is None:
+            raise RuntimeError(f"No outbox handler for {message.kind}")
+        func(db, message.payload)
+        db.commit()
+        error = None
+    except Exception as e:
+        db.rollback()
+        error = f"{type(e).__name__}: {e}"
+        logger.warning(f"Outbox message {message.id} ({message.kind}) attempt {message.attempts} failed: {error}")
+    finally:
+        db.close()
+
+    db = SessionLocal()
+    try:
+        _finish(db, message, error)
+    finally:
+        db.close()
+    return error is None
+
+def drain(max_batches: int = 1) -> Dict[str, int]:
+    """Claim and run due messages in this thread, for workers and admin triggers"""
+    report = {"processed": 0, "failed": 0}
+    for _ in range(max_batches):
+        db = SessionLocal()
+        try:
+            batch = claim_batch(db)
+        finally:
+            db.close()
+        if not batch:
+            break
+        for message in batch:
+            report["processed" if process_message(message) else "failed"] += 1
+    return report
+
+def purge_processed(db: Session, days: Optional[int] = None) -> int:
+    """Delete done messages older than OUTBOX_RETENTION_DAYS. Dead ones stay for inspection"""
+    cutoff = _now() - timedelta(days=days or settings.OUTBOX_RETENTION_DAYS)
+    deleted = db.execute(
+        delete(_messages).where(_messages.c.status == "done", _messages.c.processed_at < cutoff)
+    ).rowcount
+    db.commit()
+    return deleted
+
+def run_outbox_purge():
+    """Scheduler entry point"""
+    db = SessionLocal()
+    try:
+        return purge_processed(db)
+    finally:
+        db.close()
+
+# Threads per process draining the outbox; notify() after committing messages
+outbox_workers = DrainWorkerPool("outbox", drain, settings.OUTBOX_WORKERS, settings.OUTBOX_POLL_SECONDS)
@@ -0,0 +1,114 @@
+# app/services/paystack_client.py - SHARED ASYNC HTTP CLIENT FOR PAYSTACK CALLS
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+class CallMetrics:
+    """Latency of recent calls per operation, for /api/admin/maintenance/paystack"""
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self._calls: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, operation: str, elapsed_ms: float, ok: bool) -> None:
+        with self._lock:
+            entry = self._calls.setdefault(
+                operation, {"count": 0, "errors": 0, "recent_ms": deque(maxlen=self.window)}
+            )
+            entry["count"] += 1
+            entry["errors"] += 0 if ok else 1
+            entry["recent_ms"].append(elapsed_ms)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            report = {}
+            for operation, entry in self._calls.items():
+                recent = sorted(entry["recent_ms"])
+                report[operation] = {
+                    "count": entry["count"],
+                    "errors": entry["errors"],
+                    "p50_ms": recent[len(recent) // 2] if recent else None,
+                    "p95_ms": recent[min(len(recent) - 1, int(len(recent) * 0.95))] if recent else None,
+                    "max_ms": recent[-1] if recent else None,
+                }
+            return report
+
+
+class PaystackClient:
+    """One pooled httpx.AsyncClient for the life of the app.
+
+    Connections are kept alive between calls (HTTP/2 when the h2 package is
+    installed) and every call is bounded by PAYSTACK_CONNECT_TIMEOUT_SECONDS
+    and PAYSTACK_READ_TIMEOUT_SECONDS, so a slow Paystack holds up only the
+    request waiting on it instead of the whole worker. start() and close()
+    are called on app startup and shutdown; a call made before start()
+    opens the client itself.
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self.metrics = CallMetrics()
+
+    def start(self) -> None:
+        if self._client is not None:
+            return
+        self._client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            timeout=httpx.Timeout(
+                settings.PAYSTACK_READ_TIMEOUT_SECONDS,
+                connect=settings.PAYSTACK_CONNECT_TIMEOUT_SECONDS,
+            ),
+            limits=httpx.Limits(
+                max_connections=settings.PAYSTACK_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.PAYSTACK_MAX_KEEPALIVE_CONNECTIONS,
+            ),
+            headers={"Content-Type": "application/json"},
+        )
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def request(self, operation: str, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send one request and record its latency under `operation`.
+
+        Transport errors and timeouts raise httpx.HTTPError after being
+        counted; HTTP error statuses are returned, since Paystack explains
+        them in the JSON body.
+        """
+        self.start()
+        started = time.perf_counter()
+        ok = False
+        try:
+            response = await self._client.request(method, url, **kwargs)
+            ok = response.status_code < 500
+            return response
+        finally:
+            elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+            self.metrics.record(operation, elapsed_ms, ok)
+            logger.debug(f"Paystack {operation} took {elapsed_ms}ms")
+
+    async def get(self, operation: str, url: str, **kwargs) -> httpx.Response:
+        return await self.request(operation, "GET", url, **kwargs)
+
+    async def post(self, operation: str, url: str, **kwargs) -> httpx.Response:
+        return await self.request(operation, "POST", url, **kwargs)
+
+
+paystack_client = PaystackClient()
@@ -0,0 +1,298 @@
+# app/services/storage.py - PLUGGABLE STORAGE FOR UPLOADED FILES
+import os
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, Optional
+
+from app.core.config import settings
+
+CHUNK_SIZE = 1024 * 1024
+QUARANTINE_NAME = ".quarantine"
+
+class StorageBackend:
+    """Where upload bytes live. Keys are flat names such as <digest>.jpg"""
+
+    name = "base"
+
+    def save(self, key: str, fileobj: BinaryIO, content_type: Optional[str] = None) -> None:
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def url(self, key: str) -> str:
+        """Public URL the frontend can fetch the file from"""
+        raise NotImplementedError
+
+    def public_url(self, key: str) -> str:
+        """URL that never expires, for links clients keep (logos, site assets)"""
+        return self.url(key)
+
+    def uri(self, key: str) -> str:
+        """Stable location stored on ProductImage.filepath"""
+        raise NotImplementedError
+
+    def list_files(self, start_after: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Yield {key, size, modified} in key order, resuming after start_after"""
+        raise NotImplementedError
+
+    def modified(self, key: str) -> Optional[datetime]:
+        """Last write time of a file, None if it does not exist"""
+        raise NotImplementedError
+
+    def quarantine(self, key: str) -> None:
+        """Move a file out of the served namespace without deleting it"""
+        raise NotImplementedError
+
+    def list_quarantine(self) -> Iterator[Dict[str, Any]]:
+        """Yield {key, size, modified} for quarantined files, modified being when they were moved"""
+        raise NotImplementedError
+
+    def delete_quarantined(self, key: str) -> None:
+        raise NotImplementedError
+
+
+class LocalStorage(StorageBackend):
+    name = "local"
+
+    def __init__(self, base_dir: str, url_prefix: str):
+        self.base_dir = Path(base_dir)
+        self.url_prefix = url_prefix.rstrip("/")
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+
+    def path(self, key: str) -> Path:
+        return self.base_dir / key
+
+    def save(self, key: str, fileobj: BinaryIO, content_type: Optional[str] = None) -> None:
+        # Write to a hidden temp file and rename so readers never see partial files
+        temp_path = self.base_dir / f".tmp-{uuid.uuid4().hex}"
+        try:
+            fileobj.seek(0)
+            with open(temp_path, "wb") as buffer:
+                while True:
+                    chunk = fileobj.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    buffer.write(chunk)
+            os.replace(temp_path, self.path(key))
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+
+    def exists(self, key: str) -> bool:
+        return self.path(key).is_file()
+
+    def delete(self, key: str) -> None:
+        self.path(key).unlink(missing_ok=True)
+
+    def url(self, key: str) -> str:
+        return f"{self.url_prefix}/{key}"
+
+    def uri(self, key: str) -> str:
+        return str(self.path(key))
+
+    def list_files(self, start_after: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        # Top-level files only, so the quarantine directory is never listed
+        with os.scandir(self.base_dir) as entries:
+            names = sorted(
+                entry.name for entry in entries
+                if entry.is_file() and (start_after is None or entry.name > start_after)
+            )
+        for name in names:
+            try:
+                stat = self.path(name).stat()
+            except FileNotFoundError:
+                continue
+            yield {
+                "key": name,
+                "size": stat.st_size,
+                "modified": datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc),
+            }
+
+    def modified(self, key: str) -> Optional[datetime]:
+        try:
+            return datetime.fromtimestamp(self.path(key).stat().st_mtime, tz=timezone.utc)
+        except FileNotFoundError:
+            return None
+
+    def quarantine(self, key: str) -> None:
+        quarantine_dir = self.base_dir / QUARANTINE_NAME
+        quarantine_dir.mkdir(exist_ok=True)
+        os.replace(self.path(key), quarantine_dir / key)
+        # Restamp so retention counts from the move, not the original upload
+        os.utime(quarantine_dir / key)
+
+    def list_quarantine(self) -> Iterator[Dict[str, Any]]:
+        quarantine_dir = self.base_dir / QUARANTINE_NAME
+        if not quarantine_dir.is_dir():
+            return
+        with os.scandir(quarantine_dir) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    stat = entry.stat()
+                    yield {
+                        "key": entry.name,
+                        "size": stat.st_size,
+                        "modified": datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc),
+                    }
+
+    def delete_quarantined(self, key: str) -> None:
+        (self.base_dir / QUARANTINE_NAME / key).unlink(missing_ok=True)
+
+
+class S3Storage(StorageBackend):
+    """S3-compatible object storage (AWS S3, MinIO, Cloudflare R2...)"""
+
+    name = "s3"
+
+    def __init__(
+        self,
+        bucket: str,
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        access_key_id: Optional[str] = None,
+        secret_access_key: Optional[str] = None,
+        key_prefix: str = "",
+        public_base_url: Optional[str] = None,
+        presign_expires: int = 3600,
+        chunk_size: int = 8 * 1024 * 1024,
+    ):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.config import Config
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)")
+
+        self.bucket = bucket
+        self.key_prefix = key_prefix
+        self.public_base_url = public_base_url.rstrip("/") if public_base_url else None
+        self.presign_expires = presign_expires
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key_id,
+            aws_secret_access_key=secret_access_key,
+            # Path-style addressing works with MinIO and other local stand-ins
+            config=Config(signature_version="s3v4", s3={"addressing_style": "path"}),
+        )
+        # upload_fileobj streams the file in parts above the threshold
+        self.transfer_config = TransferConfig(
+            multipart_threshold=chunk_size,
+            multipart_chunksize=chunk_size,
+            max_concurrency=4,
+        )
+
+    def object_key(self, key: str) -> str:
+        return f"{self.key_prefix}{key}"
+
+    def save(self, key: str, fileobj: BinaryIO, content_type: Optional[str] = None) -> None:
+        fileobj.seek(0)
+        extra_args = {"ContentType": content_type} if content_type else None
+        self.client.upload_fileobj(
+            fileobj,
+            self.bucket,
+            self.object_key(key),
+            ExtraArgs=extra_args,
+            Config=self.transfer_config,
+        )
+
+    def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+
+    def url(self, key: str) -> str:
+        # Signed locally, no request to the object store
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self.object_key(key)},
+            ExpiresIn=self.presign_expires,
+        )
+
+    def public_url(self, key: str) -> str:
+        # A public bucket or CDN serves the object directly. Otherwise the
+        # app's /files route presigns a fresh URL on every read
+        if self.public_base_url:
+            return f"{self.public_base_url}/{self.object_key(key)}"
+        return f"/files/{key}"
+
+    def uri(self, key: str) -> str:
+        return f"s3://{self.bucket}/{self.object_key(key)}"
+
+    def list_files(self, start_after: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        params = {"Bucket": self.bucket, "Prefix": self.key_prefix}
+        if start_after:
+            params["StartAfter"] = self.object_key(start_after)
+
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(**params):
+            for obj in page.get("Contents", []):
+                key = obj["Key"][len(self.key_prefix):]
+                # Nested keys (quarantine/...) are not uploads
+                if "/" in key:
+                    continue
+                yield {"key": key, "size": obj["Size"], "modified": obj["LastModified"]}
+
+    def modified(self, key: str) -> Optional[datetime]:
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))["LastModified"]
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def quarantine(self, key: str) -> None:
+        self.client.copy_object(
+            Bucket=self.bucket,
+            Key=self.object_key(f"{QUARANTINE_NAME}/{key}"),
+            CopySource={"Bucket": self.bucket, "Key": self.object_key(key)},
+        )
+        self.delete(key)
+
+    def list_quarantine(self) -> Iterator[Dict[str, Any]]:
+        # The copy gets a new LastModified, so it is the quarantine time
+        prefix = self.object_key(f"{QUARANTINE_NAME}/")
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                yield {"key": obj["Key"][len(prefix):], "size": obj["Size"], "modified": obj["LastModified"]}
+
+    def delete_quarantined(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(f"{QUARANTINE_NAME}/{key}"))
+
+
+def build_storage() -> StorageBackend:
+    if settings.STORAGE_BACKEND == "s3":
+        if not settings.S3_BUCKET:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires S3_BUCKET")
+        return S3Storage(
+            bucket=settings.S3_BUCKET,
+            endpoint_url=settings.S3_ENDPOINT_URL,
+            region=settings.S3_REGION,
+            access_key_id=settings.S3_ACCESS_KEY_ID,
+            secret_access_key=settings.S3_SECRET_ACCESS_KEY,
+            key_prefix=settings.S3_KEY_PREFIX,
+            public_base_url=settings.S3_PUBLIC_BASE_URL,
+            presign_expires=settings.S3_PRESIGN_EXPIRES,
+            chunk_size=settings.S3_MULTIPART_CHUNK_SIZE,
+        )
+    return LocalStorage(settings.UPLOAD_DIR, settings.UPLOAD_URL_PREFIX)
+
+storage = build_storage()
@@ -0,0 +1,207 @@
+# app/services/upload_gc.py - ORPHANED UPLOAD GARBAGE COLLECTION
+import logging
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.models import JobState, ProductImage, UploadBlob
+from app.services.job_lease import acquire_lease, release_lease
+from app.services.storage import storage
+
+logger = logging.getLogger(__name__)
+
+JOB_NAME = "upload_gc"
+
+# Site assets uploaded before content addressing (logo_1a2b3c4d.png) have no
+# database row pointing at them, so they are never treated as orphans
+LEGACY_SITE_ASSET_PATTERN = re.compile(r"^[a-z]+_[0-9a-f]{8}\.[A-Za-z0-9]+$")
+
+def _referenced_keys(db: Session, keys: List[str]) -> set:
+    """Keys used by a ProductImage row or by a blob that still has references"""
+    image_keys = db.query(ProductImage.filename).filter(ProductImage.filename.in_(keys)).all()
+    blob_keys = db.query(UploadBlob.filename).filter(
+        UploadBlob.filename.in_(keys),
+        UploadBlob.ref_count > 0
+    ).all()
+    return {row[0] for row in image_keys} | {row[0] for row in blob_keys}
+
+def _still_orphaned(db: Session, key: str, grace_cutoff: datetime) -> bool:
+    """Re-check a key right before its file is removed.
+
+    The blob row is deleted and committed first, so an upload of the same
+    digest in between writes the file again and registers a new row. Either
+    sign means the file is live again. The remaining window is the moment
+    between this check and the removal.
+    """
+    if db.query(UploadBlob.id).filter(UploadBlob.filename == key).first():
+        return False
+    if db.query(ProductImage.id).filter(ProductImage.filename == key).first():
+        return False
+    modified = storage.modified(key)
+    return modified is not None and modified <= grace_cutoff
+
+def purge_quarantine(days: Optional[int] = None) -> Dict[str, int]:
+    """Delete quarantined files older than UPLOAD_GC_QUARANTINE_DAYS"""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days or settings.UPLOAD_GC_QUARANTINE_DAYS)
+    report = {"purged": 0, "bytes": 0}
+    for entry in list(storage.list_quarantine()):
+        if entry["modified"] > cutoff:
+            continue
+        try:
+            storage.delete_quarantined(entry["key"])
+            report["purged"] += 1
+            report["bytes"] += entry["size"]
+        except Exception as e:
+            logger.warning(f"Upload GC could not purge quarantined {entry['key']}: {e}")
+    return report
+
+def _get_job_state(db: Session) -> JobState:
+    state = db.query(JobState).filter(JobState.name == JOB_NAME).first()
+    if not state:
+        state = JobState(name=JOB_NAME)
+        db.add(state)
+        db.flush()
+    return state
+
+def collect_orphaned_uploads(
+    db: Session,
+    dry_run: bool = False,
+    max_batches: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Walk the upload storage in key order and remove files nothing references.
+
+    Progress is checkpointed in job_states after every batch, so an
+    interrupted or bounded run resumes where the previous one stopped.
+    Real runs hold the job lease, renewed after every batch, and end by
+    deleting quarantined files past UPLOAD_GC_QUARANTINE_DAYS.
+    """
+    started = time.monotonic()
+    batch_size = settings.UPLOAD_GC_BATCH_SIZE
+    max_batches = max_batches or settings.UPLOAD_GC_MAX_BATCHES
+    grace_cutoff = datetime.now(timezone.utc) - timedelta(hours=settings.UPLOAD_GC_GRACE_HOURS)
+    quarantine = settings.UPLOAD_GC_MODE != "delete"
+
+    state = _get_job_state(db)
+    start_cursor = state.cursor
+
+    report = {
+        "mode": "dry_run" if dry_run else ("quarantine" if quarantine else "delete"),
+        "started_after": start_cursor,
+        "scanned": 0,
+        "orphans": 0,
+        "removed": 0,
+        "bytes_reclaimed": 0,
+        "bytes_quarantined": 0,
+        "quarantine_purged": 0,
+        "errors": 0,
+        "complete": False,
+        "leased": False,
+    }
+
+    if not dry_run:
+        if not acquire_lease(db, JOB_NAME):
+            return report
+        report["leased"] = True
+
+    try:
+        files = storage.list_files(start_after=start_cursor)
+        cursor = start_cursor
+        batches = 0
+
+        while batches < max_batches:
+            batch = []
+            for entry in files:
+                batch.append(entry)
+                if len(batch) >= batch_size:
+                    break
+
+            if not batch:
+                report["complete"] = True
+                cursor = None
+                break
+
+            batches += 1
+            report["scanned"] += len(batch)
+            referenced = _referenced_keys(db, [entry["key"] for entry in batch])
+
+            for entry in batch:
+                key = entry["key"]
+                if key in referenced or LEGACY_SITE_ASSET_PATTERN.match(key):
+                    continue
+                if entry["modified"] > grace_cutoff:
+                    # Uploads are written before their rows commit
+                    continue
+
+                report["orphans"] += 1
+                if dry_run:
+                    continue
+
+                try:
+                    # Unreferenced blob rows go too, so a re-upload writes the file again
+                    db.query(UploadBlob).filter(
+                        UploadBlob.filename == key,
+                        UploadBlob.ref_count <= 0
+                    ).delete(synchronize_session=False)
+                    db.commit()
+                    if not _still_orphaned(db, key, grace_cutoff):
+                        report["orphans"] -= 1
+                        continue
+
+                    if quarantine:
+                        storage.quarantine(key)
+                        report["bytes_quarantined"] += entry["size"]
+                    else:
+                        storage.delete(key)
+                        report["bytes_reclaimed"] += entry["size"]
+                    report["removed"] += 1
+                except Exception as e:
+                    db.rollback()
+                    report["errors"] += 1
+                    logger.warning(f"Upload GC could not remove {key}: {e}")
+
+            cursor = batch[-1]["key"]
+            if not dry_run:
+                state.cursor = cursor
+                db.commit()
+                if not acquire_lease(db, JOB_NAME):
+                    # Held past the lease, another worker has taken over
+                    break
+
+        report["cursor"] = cursor
+        report["duration_seconds"] = round(time.monotonic() - started, 3)
+
+        if not dry_run:
+            purged = purge_quarantine()
+            report["quarantine_purged"] = purged["purged"]
+            report["bytes_reclaimed"] += purged["bytes"]
+
+            state.cursor = cursor
+            state.last_run_at = datetime.now(timezone.utc)
+            state.last_result = report
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if not dry_run:
+            release_lease(db, JOB_NAME)
+
+    return report
+
+def run_upload_gc():
+    """Scheduler entry point"""
+    db = SessionLocal()
+    try:
+        report = collect_orphaned_uploads(db)
+        print(
+            f"🧹 Upload GC: scanned {report['scanned']}, removed {report['removed']} orphans, "
+            f"reclaimed {report['bytes_reclaimed']} bytes, quarantined {report['bytes_quarantined']} bytes"
+        )
+        return report
+    finally:
+        db.close()
@@ -0,0 +1,350 @@
+# app/services/upload_store.py - CONTENT-ADDRESSED UPLOAD STORAGE
+import asyncio
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+from sqlalchemy import event, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import ProductImage, UploadBlob
+from app.services.image_metadata import extract_image_metadata, known_image_metadata
+from app.services.image_similarity import (
+    find_near_duplicates,
+    hamming_distance,
+    max_distance,
+    perceptual_hash,
+    register_hash,
+)
+from app.services.storage import storage
+
+CHUNK_SIZE = 1024 * 1024
+
+# Formats Pillow cannot rasterize but that are still valid uploads
+PASSTHROUGH_CONTENT_TYPES = {"image/svg+xml", "image/x-icon", "image/vnd.microsoft.icon"}
+
+# Shared by all requests, so concurrent uploads cannot exhaust the threadpool
+_upload_executor = ThreadPoolExecutor(max_workers=settings.UPLOAD_WORKERS, thread_name_prefix="upload")
+
+def hash_stream(fileobj: BinaryIO) -> Tuple[str, int]:
+    """SHA-256 the stream in chunks and rewind it, enforcing MAX_UPLOAD_SIZE"""
+    digest = hashlib.sha256()
+    size = 0
+
+    fileobj.seek(0)
+    while True:
+        chunk = fileobj.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > settings.MAX_UPLOAD_SIZE:
+            raise HTTPException(status_code=413, detail="File too large")
+        digest.update(chunk)
+    fileobj.seek(0)
+
+    return digest.hexdigest(), size
+
+def blob_key(digest: str, original_filename: Optional[str]) -> str:
+    return f"{digest}{Path(original_filename or '').suffix.lower()}"
+
+def _take_references(db: Session, blob: UploadBlob, count: int = 1) -> UploadBlob:
+    blob.ref_count = UploadBlob.ref_count + count
+    db.flush()
+    db.refresh(blob)
+    return blob
+
+def _register_blob(
+    db: Session,
+    digest: str,
+    filename: str,
+    size: int,
+    content_type: Optional[str],
+    refs: int = 1
+) -> UploadBlob:
+    blob = UploadBlob(
+        digest=digest,
+        filename=filename,
+        size=size,
+        content_type=content_type,
+        ref_count=refs
+    )
+
+    try:
+        with db.begin_nested():
+            db.add(blob)
+    except IntegrityError:
+        # A concurrent upload registered the same digest first
+        blob = db.query(UploadBlob).filter(UploadBlob.digest == digest).one()
+        _take_references(db, blob, refs)
+
+    return blob
+
+def _near_duplicate_action(duplicate_action: Optional[str]) -> str:
+    action = duplicate_action or settings.PHASH_DUPLICATE_ACTION
+    return action if action in ("flag", "reject", "off") else "flag"
+
+def _near_duplicate_error(matches: List[Dict[str, Any]]) -> str:
+    closest = matches[0]
+    return f"Near-duplicate of {closest['filename']} (distance {closest['distance']})"
+
+def store_upload(
+    db: Session,
+    upload_file: UploadFile,
+    duplicate_action: Optional[str] = None
+) -> Tuple[UploadBlob, List[Dict[str, Any]]]:
+    """Store an upload once per digest and take a reference on its blob.
+
+    A duplicate only costs the hash pass: the bytes are not written again.
+    New content is checked for perceptual near-duplicates, which are
+    returned (flag) or refused with a 409 (reject).
+    The caller owns the transaction and must commit.
+    """
+    digest, size = hash_stream(upload_file.file)
+
+    blob = db.query(UploadBlob).filter(UploadBlob.digest == digest).first()
+    if blob:
+        if not storage.exists(blob.filename):
+            storage.save(blob.filename, upload_file.file, blob.content_type)
+        return _take_references(db, blob), []
+
+    action = _near_duplicate_action(duplicate_action)
+    phash = perceptual_hash(upload_file.file)
+    near_duplicates = []
+    if phash and action != "off":
+        near_duplicates = find_near_duplicates(db, [phash]).get(phash, [])
+        if near_duplicates and action == "reject":
+            raise HTTPException(status_code=409, detail=_near_duplicate_error(near_duplicates))
+
+    filename = blob_key(digest, upload_file.filename)
+    storage.save(filename, upload_file.file, upload_file.content_type)
+
+    blob = _register_blob(db, digest, filename, size, upload_file.content_type)
+    register_hash(db, blob, phash)
+
+    return blob, near_duplicates
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 2)
+
+def _fail(result: Dict[str, Any], error: str) -> None:
+    result["status"] = "failed"
+    result["error"] = error
+
+def _hash_file(result: Dict[str, Any], upload_file: UploadFile) -> None:
+    started = time.perf_counter()
+    try:
+        result["digest"], result["size"] = hash_stream(upload_file.file)
+    except HTTPException as e:
+        _fail(result, e.detail)
+    result["timings"]["hash_ms"] = _elapsed_ms(started)
+
+def _analyze_file(result: Dict[str, Any], upload_file: UploadFile, with_phash: bool) -> None:
+    """Validate the image and derive its metadata and perceptual hash"""
+    started = time.perf_counter()
+    try:
+        if result["metadata"] is None:
+            metadata = extract_image_metadata(upload_file.file)
+            if metadata["width"] is None and upload_file.content_type not in PASSTHROUGH_CONTENT_TYPES:
+                raise ValueError("Not a valid image")
+            result["metadata"] = metadata
+        if with_phash:
+            result["phash"] = perceptual_hash(upload_file.file)
+    except Exception as e:
+        _fail(result, str(e))
+    result["timings"]["analyze_ms"] = _elapsed_ms(started)
+
+def _write_file(result: Dict[str, Any], upload_file: UploadFile) -> None:
+    started = time.perf_counter()
+    try:
+        storage.save(result["key"], upload_file.file, upload_file.content_type)
+    except Exception as e:
+        _fail(result, f"Storage error: {e}")
+    result["timings"]["store_ms"] = _elapsed_ms(started)
+
+def _restore_missing_file(result: Dict[str, Any], upload_file: UploadFile) -> None:
+    """Known digest whose file was lost (GC, cleanup, another node): write it back"""
+    started = time.perf_counter()
+    try:
+        if not storage.exists(result["key"]):
+            storage.save(result["key"], upload_file.file, upload_file.content_type)
+    except Exception as e:
+        _fail(result, f"Storage error: {e}")
+    result["timings"]["store_ms"] = _elapsed_ms(started)
+
+def shutdown_upload_executor() -> None:
+    """Called on app shutdown, lets in-flight writes finish"""
+    _upload_executor.shutdown(wait=True)
+
+async def store_uploads_concurrently(
+    db: Session,
+    upload_files: List[UploadFile],
+    duplicate_action: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], Dict[str, float]]:
+    """Hash, validate, describe and store several uploads on the bounded pool.
+
+    Per-file work runs on UPLOAD_WORKERS threads; the session is only used
+    from the calling coroutine. Each result carries the referenced blob and
+    image metadata so the caller can insert its rows in one batch. Exact
+    duplicates (of stored blobs or within the request) are written once at
+    most; perceptual near-duplicates are flagged or rejected per
+    duplicate_action (PHASH_DUPLICATE_ACTION by default).
+    The caller owns the transaction and must commit.
+    """
+    loop = asyncio.get_running_loop()
+    total_started = time.perf_counter()
+    action = _near_duplicate_action(duplicate_action)
+    timings = {}
+
+    results = [
+        {
+            "index": index,
+            "filename": upload_file.filename,
+            "status": "stored",
+            "error": None,
+            "digest": None,
+            "size": None,
+            "key": None,
+            "blob": None,
+            "metadata": None,
+            "phash": None,
+            "near_duplicates": [],
+            "timings": {},
+        }
+        for index, upload_file in enumerate(upload_files)
+    ]
+
+    async def run_parallel(func, jobs):
+        await asyncio.gather(*[
+            loop.run_in_executor(_upload_executor, func, *job) for job in jobs
+        ])
+
+    # 1. Hash everything in parallel
+    started = time.perf_counter()
+    await run_parallel(_hash_file, list(zip(results, upload_files)))
+    timings["hash_ms"] = _elapsed_ms(started)
+
+    # 2. One lookup for blobs we already hold, plus their known metadata
+    started = time.perf_counter()
+    hashed = [result for result in results if result["status"] != "failed"]
+    digests = {result["digest"] for result in hashed}
+    existing = {
+        blob.digest: blob
+        for blob in db.query(UploadBlob).filter(UploadBlob.digest.in_(digests)).all()
+    } if digests else {}
+    known_metadata = known_image_metadata(db, [blob.id for blob in existing.values()])
+    timings["lookup_ms"] = _elapsed_ms(started)
+
+    # 3. Validate / describe only what is not known yet
+    started = time.perf_counter()
+    analyze_jobs = []
+    new_results = []
+    restore_jobs = {}
+    first_by_digest = {}
+    for result in hashed:
+        upload_file = upload_files[result["index"]]
+        blob = existing.get(result["digest"])
+        if blob:
+            result["status"] = "duplicate"
+            result["key"] = blob.filename
+            restore_jobs.setdefault(result["digest"], (result, upload_file))
+            result["metadata"] = known_metadata.get(blob.id)
+            if result["metadata"] is None:
+                analyze_jobs.append((result, upload_file, False))
+        elif result["digest"] in first_by_digest:
+            # Same bytes twice in one request: reuse the first file's work
+            result["status"] = "duplicate"
+        else:
+            result["key"] = blob_key(result["digest"], upload_file.filename)
+            first_by_digest[result["digest"]] = result
+            new_results.append(result)
+            analyze_jobs.append((result, upload_file, action != "off"))
+
+    await run_parallel(_analyze_file, analyze_jobs)
+    timings["analyze_ms"] = _elapsed_ms(started)
+
+    # 4. Near-duplicates against the band index and earlier files in this request
+    started = time.perf_counter()
+    if action != "off":
+        candidates = [result for result in new_results if result["status"] != "failed" and result["phash"]]
+        stored_matches = find_near_duplicates(db, [result["phash"] for result in candidates])
+        accepted = []
+        for result in candidates:
+            matches = list(stored_matches.get(result["phash"], []))
+            for earlier in accepted:
+                distance = hamming_distance(result["phash"], earlier["phash"])
+                if distance <= max_distance():
+                    matches.append({"upload_filename": earlier["filename"], "filename": earlier["key"], "distance": distance})
+            matches.sort(key=lambda match: match["distance"])
+            result["near_duplicates"] = matches
+
+            if matches and action == "reject":
+                _fail(result, _near_duplicate_error(matches))
+            else:
+                accepted.append(result)
+    timings["similarity_ms"] = _elapsed_ms(started)
+
+    # 5. Write new content, and re-save known content whose file is gone, in parallel
+    started = time.perf_counter()
+    await asyncio.gather(
+        run_parallel(_write_file, [
+            (result, upload_files[result["index"]])
+            for result in new_results if result["status"] != "failed"
+        ]),
+        run_parallel(_restore_missing_file, list(restore_jobs.values())),
+    )
+    timings["store_ms"] = _elapsed_ms(started)
+
+    # 6. Register blobs, hashes and references from the calling thread
+    started = time.perf_counter()
+    references = {}
+    for result in results:
+        if result["status"] == "duplicate" and result["digest"] in first_by_digest:
+            first = first_by_digest[result["digest"]]
+            if first["status"] == "failed":
+                _fail(result, first["error"])
+                continue
+            result["key"] = first["key"]
+            result["metadata"] = first["metadata"]
+        elif result["digest"] in restore_jobs and result["status"] != "failed":
+            restored = restore_jobs[result["digest"]][0]
+            if restored["status"] == "failed":
+                _fail(result, restored["error"])
+        if result["status"] != "failed":
+            references[result["digest"]] = references.get(result["digest"], 0) + 1
+
+    blobs = {}
+    for digest, count in references.items():
+        if digest in existing:
+            blobs[digest] = _take_references(db, existing[digest], count)
+        else:
+            first = first_by_digest[digest]
+            upload_file = upload_files[first["index"]]
+            blobs[digest] = _register_blob(
+                db, digest, first["key"], first["size"], upload_file.content_type, refs=count
+            )
+            register_hash(db, blobs[digest], first["phash"])
+
+    for result in results:
+        if result["status"] != "failed":
+            result["blob"] = blobs[result["digest"]]
+    timings["register_ms"] = _elapsed_ms(started)
+    timings["total_ms"] = _elapsed_ms(total_started)
+
+    return results, timings
+
+@event.listens_for(ProductImage, "after_delete")
+def _release_image_blob(mapper, connection, target):
+    """Drop the image's reference; unreferenced files are left for garbage collection"""
+    if not target.blob_id:
+        return
+    blobs = UploadBlob.__table__
+    connection.execute(
+        update(blobs)
+        .where(blobs.c.id == target.blob_id, blobs.c.ref_count > 0)
+        .values(ref_count=blobs.c.ref_count - 1)
+    )
@@ -0,0 +1,186 @@
+# app/services/webhook_inbox.py - DURABLE PAYSTACK WEBHOOK INBOX AND ITS WORKERS
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import and_, delete, exists, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.workers import DrainWorkerPool
+from app.models.models import WebhookEvent
+from app.services.outbox import backoff_seconds
+
+logger = logging.getLogger(__name__)
+
+_events = WebhookEvent.__table__
+_earlier = _events.alias("earlier")
+
+# event -> handler(data, db). Handlers get their own session and commit
+# it; raising schedules a retry of the same event
+HANDLERS: Dict[str, Callable[[Dict[str, Any], Session], Any]] = {}
+
+def handler(event: str):
+    """Register the function that processes one Paystack event type"""
+    def register(func):
+        HANDLERS[event] = func
+        return func
+    return register
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+def event_key(event: str, data: Dict[str, Any]) -> str:
+    """Paystack sends no event id, a redelivery repeats the event, reference and object id"""
+    return f"{event}:{data.get('reference')}:{data.get('id') or ''}"
+
+def _insert(connection):
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise RuntimeError(f"The webhook inbox needs INSERT ... ON CONFLICT, not supported on {dialect}")
+    return insert
+
+def record_event(db: Session, event: str, data: Dict[str, Any]) -> bool:
+    """Store a webhook once, True if it is new. Redeliveries are dropped by ON CONFLICT. Commits"""
+    connection = db.connection()
+    insert = _insert(connection)
+    inserted = connection.execute(
+        insert(_events)
+        .values(
+            event_key=event_key(event, data),
+            event=event,
+            reference=data.get("reference") or "",
+            payload=data,
+            status="pending",
+            attempts=0,
+            available_at=_now(),
+        )
+        .on_conflict_do_nothing(index_elements=["event_key"])
+    ).rowcount == 1
+    db.commit()
+    return inserted
+
+def claim_batch(db: Session, limit: Optional[int] = None) -> List[Any]:
+    """Lock due events whose reference has nothing older still unfinished.
+
+    An event waits while an earlier one for the same reference is pending
+    (including in backoff) or being processed, so each reference is handled
+    strictly in arrival order and never by two workers at once. Dead events
+    no longer hold their reference up. Commits.
+    """
+    now = _now()
+    due = and_(
+        or_(
+            and_(_events.c.status == "pending", _events.c.available_at <= now),
+            and_(_events.c.status == "processing", _events.c.locked_until < now),
+        ),
+        ~exists().where(
+            _earlier.c.reference == _events.c.reference,
+            _earlier.c.id < _events.c.id,
+            _earlier.c.status.in_(("pending", "processing")),
+        ),
+    )
+    ids = [
+        row[0] for row in db.execute(
+            select(_events.c.id).where(due).order_by(_events.c.id).limit(limit or settings.WEBHOOK_BATCH_SIZE)
+        )
+    ]
+    if not ids:
+        return []
+
+    statement = (
+        update(_events)
+        .where(_events.c.id.in_(ids), due)
+        .values(
+            status="processing",
+            attempts=_events.c.attempts + 1,
+            locked_until=now + timedelta(seconds=settings.WEBHOOK_LOCK_SECONDS),
+        )
+    )
+    connection = db.connection()
+    returned = [_events.c.id, _events.c.event, _events.c.reference, _events.c.payload, _events.c.attempts]
+    if connection.dialect.update_returning:
+        claimed = connection.execute(statement.returning(*returned)).all()
+    else:
+        claimed = connection.execute(select(*returned).where(_events.c.id.in_(ids), due).with_for_update()).all()
+        connection.execute(statement)
+    db.commit()
+    return sorted(claimed, key=lambda event: event.id)
+
+def _finish(db: Session, event, error: Optional[str] = None) -> None:
+    if error is None:
+        values = {"status": "done", "processed_at": _now(), "locked_until": None, "last_error": None}
+    elif event.attempts >= settings.WEBHOOK_MAX_ATTEMPTS:
+        values = {"status": "dead", "locked_until": None, "last_error": error}
+        logger.error(f"Webhook {event.id} ({event.event} {event.reference}) gave up after {event.attempts} attempts: {error}")
+    else:
+        values = {
+            "status": "pending",
+            "locked_until": None,
+            "last_error": error,
+            "available_at": _now() + timedelta(seconds=backoff_seconds(event.attempts)),
+        }
+    db.execute(update(_events).where(_events.c.id == event.id).values(**values))
+    db.commit()
+
+def process_event(event) -> bool:
+    """Run one claimed event in a fresh session and record the outcome"""
+    db = SessionLocal()
+    try:
+        func = HANDLERS.get(event.event)
+        if func is not None:
+            func(event.payload, db)
+        error = None
+    except Exception as e:
+        db.rollback()
+        error = f"{type(e).__name__}: {e}"
+        logger.warning(f"Webhook {event.id} ({event.event} {event.reference}) attempt {event.attempts} failed: {error}")
+    finally:
+        db.close()
+
+    db = SessionLocal()
+    try:
+        _finish(db, event, error)
+    finally:
+        db.close()
+    return error is None
+
+def drain(max_batches: int = 1) -> Dict[str, int]:
+    """Claim and process due events in this thread, for workers and admin triggers"""
+    report = {"processed": 0, "failed": 0}
+    for _ in range(max_batches):
+        db = SessionLocal()
+        try:
+            batch = claim_batch(db)
+        finally:
+            db.close()
+        if not batch:
+            break
+        for event in batch:
+            report["processed" if process_event(event) else "failed"] += 1
+    return report
+
+def purge_processed(db: Session, days: Optional[int] = None) -> int:
+    """Delete done events older than WEBHOOK_RETENTION_DAYS. Dead ones stay for inspection"""
+    cutoff = _now() - timedelta(days=days or settings.WEBHOOK_RETENTION_DAYS)
+    deleted = db.execute(
+        delete(_events).where(_events.c.status == "done", _events.c.processed_at < cutoff)
+    ).rowcount
+    db.commit()
+    return deleted
+
+def run_webhook_purge():
+    """Scheduler entry point"""
+    db = SessionLocal()
+    try:
+        return purge_processed(db)
+    finally:
+        db.close()
+
+# Threads per process processing stored webhooks; notify() after recording one
+webhook_workers = DrainWorkerPool("webhook", drain, settings.WEBHOOK_WORKERS, settings.WEBHOOK_POLL_SECONDS)